@@ -0,0 +1,122 @@
+"""
+Update times of single processor nodes. The source emits one chunk in setup
+and every time_update call processes that same chunk again.
+
+"""
+from cognigraph.helpers import inverse_model
+from cognigraph.nodes import processors
+
+from .synthetic import (get_synthetic_forward_file, make_synthetic_data,
+                        make_synthetic_info, SyntheticSource)
+
+CHANNEL_COUNTS = (32, 64, 128, 306)
+CHUNK_SIZES = (1, 10, 100)
+
+
+class _NodeBenchmark(object):
+    param_names = ('channel_count', 'chunk_size')
+    params = (CHANNEL_COUNTS, CHUNK_SIZES)
+    source_count = 4000
+
+    def make_node(self, forward_file_path):
+        raise NotImplementedError
+
+    def setup(self, channel_count, chunk_size, *args):
+        # Benchmarks must not read inverse matrices computed by earlier runs
+        inverse_model.INVERSE_MATRIX_CACHE_DIR = None
+
+        forward_file_path = get_synthetic_forward_file(
+            channel_count, source_count=self.source_count)
+        data = make_synthetic_data(forward_file_path, seconds=1.0)
+        self.source = SyntheticSource(data, make_synthetic_info(channel_count),
+                                      chunk_size=chunk_size)
+        self.node = self.make_node(forward_file_path, *args)
+        self.node.input_node = self.source
+
+        self.source.initialize()
+        self.source.update()
+        self.node.initialize()
+        self.node.update()  # The first update may allocate buffers
+
+    def time_update(self, *params):
+        self.node.update()
+
+
+class InverseModelBenchmark(_NodeBenchmark):
+    def make_node(self, forward_file_path):
+        return processors.InverseModel(forward_model_path=forward_file_path)
+
+
+class BeamformerBenchmark(_NodeBenchmark):
+    param_names = _NodeBenchmark.param_names + ('is_adaptive', )
+    params = ((32, 128, 306), CHUNK_SIZES, (False, True))
+
+    def make_node(self, forward_file_path, is_adaptive):
+        return processors.Beamformer(forward_model_path=forward_file_path,
+                                     is_adaptive=is_adaptive)
+
+
+class MCEBenchmark(_NodeBenchmark):
+    # MCE solves a linear program for the last sample of each chunk and
+    # that grows quickly with the number of sources. It needs more channels
+    # than its n_comp=40 components.
+    params = ((64, 128), (1, 100))
+    source_count = 1000
+
+    def make_node(self, forward_file_path):
+        return processors.MCE(forward_model_path=forward_file_path)
+
+
+class LinearFilterBenchmark(_NodeBenchmark):
+    def make_node(self, forward_file_path):
+        return processors.LinearFilter(lower_cutoff=8.0, upper_cutoff=12.0)
+
+
+class EnvelopeExtractorBenchmark(_NodeBenchmark):
+    param_names = _NodeBenchmark.param_names + ('method', )
+    params = ((32, 128, 306), CHUNK_SIZES,
+              processors.EnvelopeExtractor.SUPPORTED_METHODS)
+
+    def make_node(self, forward_file_path, method):
+        return processors.EnvelopeExtractor(method=method)
+
+
+class SpectralPowerBenchmark(_NodeBenchmark):
+    param_names = _NodeBenchmark.param_names + ('taper', )
+    params = ((32, 128, 306), CHUNK_SIZES,
+              processors.SpectralPower.SUPPORTED_TAPERS)
+
+    def make_node(self, forward_file_path, taper):
+        return processors.SpectralPower(taper=taper)
+
+
+class ConnectivityBenchmark(_NodeBenchmark):
+    # Channel counts of the order of the number of ROIs
+    param_names = _NodeBenchmark.param_names + ('method', )
+    params = ((32, 128), CHUNK_SIZES, processors.Connectivity.SUPPORTED_METHODS)
+
+    def make_node(self, forward_file_path, method):
+        return processors.Connectivity(method=method)
+
+
+class ResampleBenchmark(_NodeBenchmark):
+    # The synthetic data are sampled at 500 Hz
+    param_names = _NodeBenchmark.param_names + ('frequency', )
+    params = ((32, 128, 306), CHUNK_SIZES, (250.0, 100.0))
+
+    def make_node(self, forward_file_path, frequency):
+        return processors.Resample(frequency=frequency)
+
+
+class ASRBenchmark(_NodeBenchmark):
+    params = ((32, 128), CHUNK_SIZES)
+
+    def make_node(self, forward_file_path):
+        return processors.ASR(collect_for_x_seconds=1)
+
+    def setup(self, channel_count, chunk_size, *args):
+        super().setup(channel_count, chunk_size, *args)
+        # Times the updates after calibration
+        while not self.node._enough_collected:
+            self.source.update()
+            self.node.update()
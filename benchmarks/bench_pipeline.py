@@ -0,0 +1,37 @@
+"""
+Whole pipelines: every time_update_all_nodes call reads a new chunk from the
+source and passes it through all the nodes.
+
+"""
+from cognigraph.helpers import inverse_model
+from cognigraph.nodes import processors
+from cognigraph.pipeline import Pipeline
+
+from .synthetic import (get_synthetic_forward_file, make_synthetic_data,
+                        make_synthetic_info, SyntheticSource)
+
+
+class PipelineBenchmark(object):
+    """source -> LinearFilter -> inverse -> EnvelopeExtractor"""
+    param_names = ('inverse', 'channel_count', 'chunk_size')
+    params = (('InverseModel', 'Beamformer'), (64, 128), (1, 10, 100))
+
+    def setup(self, inverse, channel_count, chunk_size):
+        inverse_model.INVERSE_MATRIX_CACHE_DIR = None
+
+        forward_file_path = get_synthetic_forward_file(channel_count)
+        data = make_synthetic_data(forward_file_path, seconds=10.0)
+
+        self.pipeline = Pipeline()
+        self.pipeline.source = SyntheticSource(
+            data, make_synthetic_info(channel_count), chunk_size=chunk_size)
+        self.pipeline.add_processor(
+            processors.LinearFilter(lower_cutoff=8.0, upper_cutoff=12.0))
+        self.pipeline.add_processor(getattr(processors, inverse)(
+            forward_model_path=forward_file_path))
+        self.pipeline.add_processor(processors.EnvelopeExtractor())
+        self.pipeline.initialize_all_nodes()
+        self.pipeline.update_all_nodes()
+
+    def time_update_all_nodes(self, *params):
+        self.pipeline.update_all_nodes()
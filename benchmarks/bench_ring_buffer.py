@@ -0,0 +1,40 @@
+"""
+Ring buffers as the nodes use them: a chunk is appended and the last
+window is read on every update.
+
+"""
+import numpy as np
+
+from cognigraph import DTYPE
+from cognigraph.helpers.ring_buffer import (RingBuffer, RingBufferMirrored,
+                                            RingBufferSlow)
+
+IMPLEMENTATIONS = {
+    'slow': RingBufferSlow,
+    'copying': RingBuffer,
+    'mirrored': RingBufferMirrored,
+}
+
+
+class RingBufferBenchmark(object):
+    param_names = ('implementation', 'row_count', 'chunk_size')
+    params = (tuple(IMPLEMENTATIONS), (64, 8196), (1, 10, 100))
+    maxlen = 1000
+
+    def setup(self, implementation, row_count, chunk_size):
+        try:
+            self.buffer = IMPLEMENTATIONS[implementation](
+                row_cnt=row_count, maxlen=self.maxlen)
+        except OSError:  # No mirrored memory on this platform
+            raise NotImplementedError
+        self.chunk = np.random.RandomState(0).randn(
+            row_count, chunk_size).astype(DTYPE)
+        for _ in range(self.maxlen // chunk_size + 1):
+            self.buffer.extend(self.chunk)
+
+    def time_extend(self, *params):
+        self.buffer.extend(self.chunk)
+
+    def time_extend_and_read(self, *params):
+        self.buffer.extend(self.chunk)
+        np.asarray(self.buffer.data).sum()
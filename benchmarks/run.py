@@ -0,0 +1,254 @@
+"""
+Runs the benchmarks in benchmarks/bench_*.py and saves the results so that
+they can be compared between commits.
+
+Benchmarks are written like for asv (https://asv.readthedocs.io): every
+class with time_* methods is a benchmark, params and param_names make it
+run for every combination of parameters, setup(*params) is not timed and
+can raise NotImplementedError to skip a combination. asv can run them as
+well.
+
+Usage (from the repository root):
+    python -m benchmarks.run [--filter InverseModel] [--repeat 5]
+    python -m benchmarks.run --compare benchmarks/results/old.json
+
+Results are written to benchmarks/results/<host>_<commit>.json. With
+--compare the script prints the ratio of new to old times and exits with
+status 1 if something became slower by more than --threshold times.
+
+"""
+import os
+import re
+import sys
+import json
+import socket
+import inspect
+import argparse
+import platform
+import itertools
+import importlib
+import subprocess
+import traceback
+from timeit import Timer
+from datetime import datetime
+from statistics import median
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, 'results')
+
+# Every repeat runs the timed function number times, where number is chosen
+# so that a repeat takes at least this long
+MIN_REPEAT_SECONDS = 0.05
+
+
+def _commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCHMARKS_DIR,
+            stderr=subprocess.DEVNULL, universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def _machine_info():
+    import numpy as np
+    try:
+        import mne
+        mne_version = mne.__version__
+    except ImportError:
+        mne_version = None
+    return {
+        'host': socket.gethostname(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'mne': mne_version,
+    }
+
+
+def discover():
+    """Yields (module name, benchmark class) for every benchmark class"""
+    file_names = sorted(name for name in os.listdir(BENCHMARKS_DIR)
+                        if name.startswith('bench_') and name.endswith('.py'))
+    for file_name in file_names:
+        module_name = file_name[:-len('.py')]
+        try:
+            module = importlib.import_module('benchmarks.' + module_name)
+        except ImportError as e:
+            print('Skipping {}: {}'.format(module_name, e), file=sys.stderr)
+            continue
+        for class_name, cls in inspect.getmembers(module, inspect.isclass):
+            if (cls.__module__ == module.__name__ and
+                    not class_name.startswith('_') and
+                    any(name.startswith('time_') for name in dir(cls))):
+                yield module_name, cls
+
+
+def _parameter_combinations(cls):
+    params = getattr(cls, 'params', ())
+    if not params:
+        return [()]
+    # asv allows a single list of values for one parameter
+    if not isinstance(params[0], (list, tuple)):
+        params = (params, )
+    return list(itertools.product(*params))
+
+
+def _benchmark_name(module_name, cls, method_name, param_names, combination):
+    name = '{}.{}.{}'.format(module_name, cls.__name__, method_name)
+    if combination:
+        name += '({})'.format(', '.join(
+            '{}={}'.format(param_name, value)
+            for param_name, value in zip(param_names, combination)))
+    return name
+
+
+def measure(function, repeat) -> dict:
+    """Median and minimum seconds per call of function over repeat repeats"""
+    timer = Timer(function)
+    number = 1
+    while True:
+        seconds = timer.timeit(number)
+        if seconds >= MIN_REPEAT_SECONDS or number >= 10 ** 6:
+            break
+        number *= 10
+    times = [timer.timeit(number) / number for _ in range(repeat)]
+    return {'median': median(times), 'min': min(times), 'number': number,
+            'repeat': repeat}
+
+
+def run_benchmarks(name_filter=None, repeat=5, report_file=sys.stdout):
+    """Returns {benchmark name: measure() result or {'error': message}}"""
+    pattern = re.compile(name_filter) if name_filter else None
+    results = dict()
+    for module_name, cls in discover():
+        param_names = getattr(cls, 'param_names', ())
+        method_names = sorted(name for name in dir(cls)
+                              if name.startswith('time_'))
+        for combination in _parameter_combinations(cls):
+            names = {method_name: _benchmark_name(
+                        module_name, cls, method_name, param_names,
+                        combination)
+                     for method_name in method_names}
+            names = {method_name: name for method_name, name in names.items()
+                     if pattern is None or pattern.search(name)}
+            if not names:
+                continue
+
+            benchmark = cls()
+            try:
+                if hasattr(benchmark, 'setup'):
+                    benchmark.setup(*combination)
+            except NotImplementedError:
+                continue
+            except Exception:
+                message = traceback.format_exc(limit=1).strip().splitlines()[-1]
+                for name in names.values():
+                    results[name] = {'error': message}
+                    print('{}: setup failed: {}'.format(name, message),
+                          file=report_file, flush=True)
+                continue
+
+            for method_name, name in names.items():
+                method = getattr(benchmark, method_name)
+                try:
+                    results[name] = measure(lambda: method(*combination),
+                                            repeat)
+                    print('{}: {}'.format(
+                        name, _format_seconds(results[name]['median'])),
+                        file=report_file, flush=True)
+                except Exception:
+                    message = traceback.format_exc(
+                        limit=1).strip().splitlines()[-1]
+                    results[name] = {'error': message}
+                    print('{}: failed: {}'.format(name, message),
+                          file=report_file, flush=True)
+
+            if hasattr(benchmark, 'teardown'):
+                benchmark.teardown(*combination)
+    return results
+
+
+def _format_seconds(seconds):
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return '{:.3g} {}'.format(seconds / scale, unit)
+    return '{:.3g} ns'.format(seconds / 1e-9)
+
+
+def compare(old_results: dict, new_results: dict, threshold: float,
+            report_file=sys.stdout) -> list:
+    """
+    Prints new/old time ratios for the benchmarks present in both results
+    and returns the names of those that are slower by more than threshold
+    times.
+
+    """
+    regressions = list()
+    rows = list()
+    for name in sorted(set(old_results) & set(new_results)):
+        old, new = old_results[name], new_results[name]
+        if 'median' not in old or 'median' not in new:
+            continue
+        ratio = new['median'] / old['median']
+        if ratio > threshold:
+            regressions.append(name)
+        rows.append((ratio, name, old['median'], new['median']))
+
+    for ratio, name, old_seconds, new_seconds in sorted(rows, reverse=True):
+        mark = '!' if name in regressions else\
+            '+' if ratio < 1 / threshold else ' '
+        print('{} {:>6.2f}x {:>10} -> {:<10} {}'.format(
+            mark, ratio, _format_seconds(old_seconds),
+            _format_seconds(new_seconds), name), file=report_file)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Run cognigraph benchmarks and save the results')
+    parser.add_argument('--filter', default=None,
+                        help='only run benchmarks whose names match this '
+                             'regular expression')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', default=None,
+                        help='where to save the results, '
+                             'benchmarks/results/<host>_<commit>.json '
+                             'by default')
+    parser.add_argument('--compare', default=None, type=argparse.FileType('r'),
+                        help='results of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='new/old time ratio above which --compare '
+                             'reports a regression')
+    args = parser.parse_args(argv)
+
+    machine = _machine_info()
+    commit = _commit()
+    results = run_benchmarks(args.filter, args.repeat)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, '{}_{}.json'.format(machine['host'], commit))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({'commit': commit, 'date': datetime.now().isoformat(),
+                   'machine': machine, 'results': results}, f, indent=2,
+                  sort_keys=True)
+    print('Saved to {}'.format(output))
+
+    if args.compare is not None:
+        with args.compare:
+            old = json.load(args.compare)
+        if old['machine'] != machine:
+            print('Warning: the results are from a different machine or '
+                  'environment', file=sys.stderr)
+        regressions = compare(old['results'], results, args.threshold)
+        if regressions:
+            print('{} benchmark(s) are slower by more than {}x'.format(
+                len(regressions), args.threshold))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""
+Synthetic forward models and recordings for the benchmarks, so that they
+need neither the mne sample dataset nor any other files.
+
+Sources are spread over two hemispherical shells inside a spherical head
+model and the sensors are standard_1005 EEG electrodes, so gain matrices
+have the structure of real ones: neighbouring sources have similar
+topographies and the matrix is severely ill-conditioned.
+
+"""
+import os
+import time
+import tempfile
+
+import numpy as np
+import mne
+
+from cognigraph import DTYPE
+from cognigraph.nodes.node import SourceNode
+
+# Forward models are computed once and kept here between runs
+CACHE_DIR = os.path.join(tempfile.gettempdir(), 'cognigraph-benchmarks')
+
+FREQUENCY = 500.0
+
+
+def _standard_1005_montage():
+    try:
+        return mne.channels.make_standard_montage('standard_1005')
+    except AttributeError:  # mne < 0.19
+        return mne.channels.read_montage(kind='standard_1005')
+
+
+def make_synthetic_info(channel_count: int, frequency=FREQUENCY) -> mne.Info:
+    """EEG info with channel_count (up to 343) evenly spread electrodes"""
+    montage = _standard_1005_montage()
+    all_ch_names = [name for name in montage.ch_names
+                    if name.lower() not in ('nz', 'lpa', 'rpa')]
+    if channel_count > len(all_ch_names):
+        raise ValueError('At most {} channels are available'.format(
+            len(all_ch_names)))
+    picks = np.linspace(0, len(all_ch_names) - 1, channel_count).astype(int)
+    ch_names = [all_ch_names[i] for i in picks]
+
+    info = mne.create_info(ch_names, frequency, ch_types='eeg')
+    try:
+        info.set_montage(montage)
+    except AttributeError:  # mne < 0.20
+        info = mne.create_info(ch_names, frequency, ch_types='eeg',
+                               montage=montage)
+    return info
+
+
+def _make_cortex_like_sources(sphere, source_count, rng):
+    # Two hemispherical shells at 75% of the brain radius. Normals are
+    # radial with random tilts, roughly like the folded cortex.
+    r0 = np.asarray(sphere['r0'])
+    directions = rng.randn(source_count, 3)
+    directions /= np.linalg.norm(directions, axis=1)[:, np.newaxis]
+    directions[:, 2] = np.abs(directions[:, 2])  # upper half only
+    # Leave a gap between the hemispheres
+    directions[:, 0] += np.sign(directions[:, 0]) * 0.1
+    directions /= np.linalg.norm(directions, axis=1)[:, np.newaxis]
+    rr = r0 + 0.75 * sphere.radius * 0.9 * directions
+
+    nn = directions + 0.5 * rng.randn(source_count, 3)
+    nn /= np.linalg.norm(nn, axis=1)[:, np.newaxis]
+    return rr, nn
+
+
+def get_synthetic_forward_file(channel_count: int, source_count=4000,
+                               seed=0) -> str:
+    """
+    Returns a path to a free-orientation forward solution for
+    make_synthetic_info(channel_count). It is computed on the first call and
+    cached in CACHE_DIR.
+
+    """
+    file_path = os.path.join(
+        CACHE_DIR, 'synthetic-{}ch-{}src-seed{}-fwd.fif'.format(
+            channel_count, source_count, seed))
+    if os.path.exists(file_path):
+        return file_path
+
+    info = make_synthetic_info(channel_count)
+    sphere = mne.make_sphere_model(r0='auto', head_radius='auto', info=info,
+                                   verbose='ERROR')
+    rr, nn = _make_cortex_like_sources(sphere, source_count,
+                                       np.random.RandomState(seed))
+    src = mne.setup_volume_source_space(pos=dict(rr=rr, nn=nn),
+                                        verbose='ERROR')
+    fwd = mne.make_forward_solution(info, trans=None, src=src, bem=sphere,
+                                    meg=False, eeg=True, verbose='ERROR')
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    # Write under a temporary name so that parallel runs do not see
+    # a partial file
+    temporary_file_path = file_path[:-len('-fwd.fif')] +\
+        '-{}-fwd.fif'.format(os.getpid())
+    mne.write_forward_solution(temporary_file_path, fwd, overwrite=True,
+                               verbose='ERROR')
+    os.replace(temporary_file_path, file_path)
+    return file_path
+
+
+def make_synthetic_data(forward_file_path: str, seconds=10.0,
+                        frequency=FREQUENCY, active_source_count=5,
+                        snr=3.0, seed=0) -> np.ndarray:
+    """
+    CHANNELS x TIME recording: a few sources oscillating in the alpha band
+    with slowly changing amplitudes, projected through the forward model,
+    plus white sensor noise.
+
+    """
+    rng = np.random.RandomState(seed)
+    fwd = mne.read_forward_solution(forward_file_path, verbose='ERROR')
+    fwd = mne.convert_forward_solution(fwd, surf_ori=True, force_fixed=True,
+                                       verbose='ERROR')
+    gain = fwd['sol']['data']
+    sample_count = int(seconds * frequency)
+    times = np.arange(sample_count) / frequency
+
+    active_sources = rng.choice(gain.shape[1], active_source_count,
+                                replace=False)
+    source_frequencies = rng.uniform(8, 12, active_source_count)
+    amplitudes = 1 + 0.5 * np.sin(
+        2 * np.pi * rng.uniform(0.1, 0.5, (active_source_count, 1)) * times)
+    signals = amplitudes * np.sin(
+        2 * np.pi * source_frequencies[:, np.newaxis] * times)
+    data = gain[:, active_sources].dot(signals)
+
+    noise = rng.randn(*data.shape)
+    data += noise * np.std(data) / snr
+    return data.astype(DTYPE)
+
+
+class SyntheticSource(SourceNode):
+    """Emits chunk_size samples of data per update, looping over it"""
+
+    CHANGES_IN_THESE_REQUIRE_RESET = ('chunk_size', )
+
+    def __init__(self, data: np.ndarray, mne_info: mne.Info, chunk_size=10):
+        super().__init__()
+        self.data = data
+        self.chunk_size = chunk_size
+        self.source_name = 'synthetic'
+        self._info = mne_info
+        self._samples_already_read = 0
+
+    def _initialize(self):
+        self.mne_info = self._info
+        self.dtype = self.data.dtype
+        self._samples_already_read = 0
+
+    def _update(self):
+        start = self._samples_already_read
+        if start + self.chunk_size > self.data.shape[1]:
+            start = 0
+        stop = start + self.chunk_size
+        self.output = self.data[:, start:stop]
+        self.acquisition_time = time.time()
+        self._samples_already_read = stop
+
+    def _reset(self) -> bool:
+        output_history_is_no_longer_valid = False
+        return output_history_is_no_longer_valid
+
+    def _on_input_history_invalidation(self):
+        pass
+
+    def _check_value(self, key, value):
+        if key == 'chunk_size':
+            if value < 1:
+                raise ValueError('chunk_size must be a positive integer')
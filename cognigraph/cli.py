@@ -0,0 +1,242 @@
+"""
+Runs a pipeline described in a JSON config file without Qt, e.g. on a server.
+
+Sample config:
+
+{
+    "source": {"class": "LSLStreamSource",
+               "stream_name": "cognigraph-mock-stream"},
+    "processors": [{"class": "LinearFilter",
+                    "lower_cutoff": 8.0, "upper_cutoff": 12.0},
+                   {"class": "EnvelopeExtractor"}],
+    "outputs": [{"class": "LSLStreamOutput", "stream_name": "alpha"},
+                {"class": "FileOutput", "output_fname": "alpha.h5"}]
+}
+
+Everything except "class" and "attributes" is passed to the constructor of
+the node. "attributes" are set after the node has been constructed, e.g.
+{"class": "FileSource", "file_path": "data.fif",
+ "attributes": {"loop_the_file": true}}.
+TorchOutput's "model" can be a path to a TorchScript file.
+
+Usage:
+    cognigraph config.json [--executor loop] [--clock realtime]
+
+"""
+import sys
+import json
+import time
+import argparse
+from types import SimpleNamespace
+
+import numpy as np
+
+from . import TIME_AXIS
+from .pipeline import Pipeline
+from .helpers.metrics import MetricsServer
+
+# Outputs that draw something need Qt, so only these are available
+SUPPORTED_OUTPUTS = ('LSLStreamOutput', 'FileOutput', 'TorchOutput')
+SUPPORTED_SOURCES = ('LSLStreamSource', 'FileSource')
+
+# loop: update again as soon as the previous update has finished, sleeping
+# for idle_sleep seconds if the source had nothing new.
+# timer: update every interval seconds, like the GUI does with a QTimer.
+EXECUTORS = SimpleNamespace(LOOP='loop', TIMER='timer')
+
+# realtime: sources read data as it arrives (FileSource emulates that).
+# simulated: FileSource reads the file as fast as the pipeline can process it.
+CLOCKS = SimpleNamespace(REALTIME='realtime', SIMULATED='simulated')
+
+
+class SimulatedClock(object):
+    """Time that advances by step seconds every time it is read"""
+    def __init__(self, step: float):
+        self.step = step
+        self._time = 0.0
+
+    def __call__(self):
+        self._time += self.step
+        return self._time
+
+
+class ThroughputStats(object):
+    """Counts processed samples and update durations between reports"""
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.start_time = time.time()
+        self.sample_count = 0
+        self.update_durations = list()
+
+    def add(self, sample_count, update_duration):
+        self.sample_count += sample_count
+        self.update_durations.append(update_duration)
+
+    def report(self, frequency) -> str:
+        seconds = time.time() - self.start_time
+        samples_per_second = self.sample_count / seconds
+        durations_ms = np.array(self.update_durations or [0]) * 1000
+        return ('{:.0f} samples/s ({:.2f}x real time), {:.0f} updates/s, '
+                'update time: mean {:.2f} ms, 95% {:.2f} ms, '
+                'max {:.2f} ms'.format(
+                    samples_per_second, samples_per_second / frequency,
+                    len(self.update_durations) / seconds,
+                    np.mean(durations_ms), np.percentile(durations_ms, 95),
+                    np.max(durations_ms)))
+
+
+def _create_node(module, description: dict, supported_class_names):
+    description = dict(description)
+    class_name = description.pop('class')
+    if class_name not in supported_class_names:
+        raise ValueError('{} is not supported. Use one of: {}'.format(
+            class_name, supported_class_names))
+    attributes = description.pop('attributes', dict())
+
+    node = getattr(module, class_name)(**description)
+    for key, value in attributes.items():
+        setattr(node, key, value)
+    return node
+
+
+def _supported_processor_names():
+    from .nodes import processors
+    from .nodes.node import ProcessorNode
+    return tuple(name for name, value in vars(processors).items()
+                 if isinstance(value, type) and
+                 issubclass(value, ProcessorNode) and
+                 value is not ProcessorNode)
+
+
+def build_pipeline(config: dict) -> Pipeline:
+    from .nodes import sources, processors, outputs
+
+    pipeline = Pipeline()
+    pipeline.source = _create_node(sources, config['source'],
+                                   SUPPORTED_SOURCES)
+
+    supported_processor_names = _supported_processor_names()
+    for description in config.get('processors', list()):
+        pipeline.add_processor(_create_node(processors, description,
+                                            supported_processor_names))
+
+    for description in config.get('outputs', list()):
+        description = dict(description)
+        if (description['class'] == 'TorchOutput' and
+                isinstance(description.get('model'), str)):
+            import torch
+            description['model'] = torch.jit.load(description['model'])
+        pipeline.add_output(_create_node(outputs, description,
+                                         SUPPORTED_OUTPUTS))
+    return pipeline
+
+
+def run(pipeline: Pipeline, executor=EXECUTORS.LOOP, clock=CLOCKS.REALTIME,
+        interval=0.01, idle_sleep=0.001, stats_every_x_seconds=5.0,
+        duration=None, stats_file=sys.stdout):
+    """
+    Initializes all the nodes and updates them until the source is exhausted,
+    duration seconds have passed or the process is interrupted.
+
+    :param interval: seconds between updates for the timer executor
+    :param duration: seconds to run for, None means until interrupted
+    :param stats_file: where to print throughput and latency stats every
+    stats_every_x_seconds seconds
+
+    """
+    pipeline.initialize_all_nodes()
+    source = pipeline.source
+
+    if clock == CLOCKS.SIMULATED:
+        if not hasattr(source, 'clock'):
+            raise ValueError('{} cannot be read with a simulated clock'.format(
+                type(source).__name__))
+        # Every update reads the most samples the source is allowed to
+        source.clock = SimulatedClock(
+            step=source.MAX_SAMPLES_IN_CHUNK / pipeline.frequency)
+    elif clock != CLOCKS.REALTIME:
+        raise ValueError('Unknown clock: {}'.format(clock))
+
+    if executor not in vars(EXECUTORS).values():
+        raise ValueError('Unknown executor: {}'.format(executor))
+
+    stats = ThroughputStats()
+    start_time = time.time()
+    next_update_time = start_time
+    try:
+        while getattr(source, 'is_alive', True):
+            current_time = time.time()
+            if duration is not None and current_time - start_time >= duration:
+                break
+
+            update_start = time.perf_counter()
+            pipeline.update_all_nodes()
+            update_duration = time.perf_counter() - update_start
+
+            output = source.output
+            sample_count = 0 if output is None else output.shape[TIME_AXIS]
+            stats.add(sample_count, update_duration)
+
+            if current_time - stats.start_time >= stats_every_x_seconds:
+                print('{:.1f} s: {}'.format(current_time - start_time,
+                                            stats.report(pipeline.frequency)),
+                      file=stats_file, flush=True)
+                stats.reset()
+
+            if executor == EXECUTORS.TIMER:
+                next_update_time += interval
+                time.sleep(max(0, next_update_time - time.time()))
+            elif sample_count == 0:
+                time.sleep(idle_sleep)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for node in pipeline.all_nodes:
+            close = getattr(node, 'close', None)
+            if close is not None:
+                close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Run a cognigraph pipeline without a GUI')
+    parser.add_argument('config', type=argparse.FileType('r'),
+                        help='JSON file describing the pipeline')
+    parser.add_argument('--executor', choices=vars(EXECUTORS).values(),
+                        default=EXECUTORS.LOOP)
+    parser.add_argument('--clock', choices=vars(CLOCKS).values(),
+                        default=CLOCKS.REALTIME)
+    parser.add_argument('--interval', type=float, default=0.01,
+                        help='seconds between updates for --executor timer')
+    parser.add_argument('--stats-every', type=float, default=5.0,
+                        help='seconds between throughput reports')
+    parser.add_argument('--duration', type=float, default=None,
+                        help='stop after this many seconds')
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help='serve per-node metrics in the Prometheus '
+                             'text format at localhost:<port>/metrics')
+    args = parser.parse_args(argv)
+
+    with args.config:
+        config = json.load(args.config)
+    pipeline = build_pipeline(config)
+
+    metrics_server = None
+    if args.metrics_port is not None:
+        pipeline.enable_metrics()
+        metrics_server = MetricsServer(pipeline.metrics,
+                                       port=args.metrics_port)
+        metrics_server.start()
+    try:
+        run(pipeline, executor=args.executor, clock=args.clock,
+            interval=args.interval, stats_every_x_seconds=args.stats_every,
+            duration=args.duration)
+    finally:
+        if metrics_server is not None:
+            metrics_server.stop()
+
+
+if __name__ == '__main__':
+    main()
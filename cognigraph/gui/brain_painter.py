@@ -0,0 +1,310 @@
+import os
+import time
+from types import SimpleNamespace
+
+from PyQt5.QtCore import pyqtSignal, QObject
+
+import mne
+import nibabel as nib
+import numpy as np
+import pyqtgraph.opengl as gl
+from matplotlib import cm
+from matplotlib.colors import Colormap as matplotlib_Colormap
+from mne.datasets import sample
+from scipy import sparse
+from vispy import scene
+
+from ..helpers.pysurfer.smoothing_matrix import smoothing_matrix, mesh_edges
+from .brain_visual import BrainMesh
+
+
+class BrainPainter(QObject):
+    draw_sig = pyqtSignal('PyQt_PyObject')
+    time_since_draw = time.time()
+
+    MESH_RESOLUTIONS = SimpleNamespace(HIGH='High', LOW='Low')
+
+    def __init__(self, threshold_pct=50,
+                 brain_colormap: matplotlib_Colormap = cm.Greys,
+                 data_colormap: matplotlib_Colormap = cm.Reds,
+                 show_curvature=True, surfaces_dir=None,
+                 mesh_resolution=MESH_RESOLUTIONS.HIGH):
+        """
+        This is the last step.
+        Object of this class draws any data on the cortex mesh given to it.
+        No changes, except for thresholding, are made.
+
+        :param threshold_pct:
+        Only values exceeding this percentage threshold will be shown
+        :param show_curvature:
+        If True, concave areas will be shown in darker grey,
+        convex - in lighter
+        :param surfaces_dir:
+        Path to the Fressurfer surf directory.
+        If None, mne's sample's surfaces will be used.
+        :param mesh_resolution:
+        MESH_RESOLUTIONS.HIGH draws the inflated FreeSurfer surfaces and
+        interpolates source values onto them with the smoothing matrix.
+        MESH_RESOLUTIONS.LOW draws the decimated source-space mesh from the
+        forward solution with one value per source and no interpolation.
+        surfaces_dir is not needed in this case.
+        """
+        super().__init__()
+
+        self.threshold_pct = threshold_pct
+        self.show_curvature = show_curvature
+        self.mesh_resolution = mesh_resolution
+
+        self.brain_colormap = brain_colormap
+        self.data_colormap = data_colormap
+
+        self.surfaces_dir = surfaces_dir  # type: str
+        self.mesh_data = None  # type: gl.MeshData
+        self.smoothing_matrix = None  # type: np.ndarray
+        self.widget = None  # type: gl.GLViewWidget
+
+        # Low resolution mode only: index of each source among mesh vertices
+        # and a preallocated array of per-vertex values to draw
+        self._source_vertex_idx = None  # type: np.ndarray
+        self._vertex_values = None  # type: np.ndarray
+
+        self.background_colors = None  # type: np.ndarray  # N x 4
+        self.mesh_item = None  # type: gl.GLMeshItem
+
+        self.draw_sig.connect(self.on_draw)
+
+    def initialize(self, mne_forward_model_file_path):
+        if self.mesh_resolution == self.MESH_RESOLUTIONS.LOW:
+            self._initialize_low_resolution_mesh(mne_forward_model_file_path)
+            return
+
+        self.background_colors = self._calculate_background_colors(
+            self.show_curvature)
+        # self.mesh_data.setVertexColors(self.background_colors)
+        # import ipdb; ipdb.set_trace()
+        # self.mesh_data.add_overlay(self.background_colors, to_overlay=1)
+        # self.mesh_item = gl.GLMeshItem(
+        #     meshdata=self.mesh_data, shader='shaded')
+        # self.widget.addItem(self.mesh_item)
+        if self.widget is None:
+            self.mesh_data = self._get_mesh_data_from_surfaces_dir()
+            self.widget = self._create_widget()
+        self.smoothing_matrix = self._get_smoothing_matrix(
+            mne_forward_model_file_path)
+        # else:  # Do not recreate the widget, just clear it
+        #     for item in self.widget.items:
+        #         self.widget.removeItem(item)
+
+    def _initialize_low_resolution_mesh(self, mne_forward_model_file_path):
+        self._source_vertex_idx, vertexes, faces =\
+            self._get_low_resolution_mesh_from_forward_solution(
+                mne_forward_model_file_path)
+        self._vertex_values = np.zeros(vertexes.shape[0])
+
+        if self.widget is None:
+            self.mesh_data = BrainMesh(vertices=vertexes, faces=faces)
+            self.widget = self._create_widget()
+        else:  # Forward model might have changed, so reuse the widget only
+            self.mesh_data.set_data(vertices=vertexes, faces=faces)
+
+    def on_draw(self, normalized_values):
+
+        if self.mesh_resolution == self.MESH_RESOLUTIONS.LOW:
+            # Vertices that are not sources stay at zero
+            sources_smoothed = self._vertex_values
+            sources_smoothed[self._source_vertex_idx] = normalized_values
+        else:
+            sources_smoothed = self.smoothing_matrix.dot(normalized_values)
+        threshold = self.threshold_pct / 100
+        mask = sources_smoothed <= threshold
+
+        # reset colors to white
+        self.mesh_data._alphas[:, :] = 0.
+        self.mesh_data._alphas_buffer.set_data(self.mesh_data._alphas)
+
+        if np.any(~mask):
+            self.mesh_data.add_overlay(sources_smoothed[~mask],
+                                       vertices=np.where(~mask)[0],
+                                       to_overlay=1)
+        self.mesh_data.update()
+
+    def draw(self, normalized_values):
+        self.draw_sig.emit(normalized_values)
+
+    def _get_mesh_data_from_surfaces_dir(self, cortex_type='inflated') -> gl.MeshData:
+        if self.surfaces_dir:
+            surf_paths = [os.path.join(self.surfaces_dir, '{}.{}'.format(h, cortex_type))
+                          for h in ('lh', 'rh')]
+        else:
+            raise NameError('surfaces_dir is not set')
+        lh_mesh, rh_mesh = [nib.freesurfer.read_geometry(surf_path) for surf_path in surf_paths]
+        lh_vertexes, lh_faces = lh_mesh
+        rh_vertexes, rh_faces = rh_mesh
+
+        vertexes, faces = self._combine_hemispheres(
+            lh_vertexes, lh_faces, rh_vertexes, rh_faces)
+
+        # Invert vertex normals for more reasonable lighting (I am not sure if the pyqtgraph's shader has a bug or
+        # gl.MeshData's calculation of normals does
+        # mesh_data = gl.MeshData(vertexes=vertexes, faces=faces)
+        mesh_data = BrainMesh(vertices=vertexes, faces=faces)
+        # mesh_data._vertexNormals = mesh_data.vertexNormals() * (-1)
+
+        return mesh_data
+
+    @staticmethod
+    def _combine_hemispheres(lh_vertexes, lh_faces, rh_vertexes, rh_faces):
+        # Move all the vertexes so that the lh has x (L-R) <= 0 and rh - >= 0
+        lh_vertexes[:, 0] -= np.max(lh_vertexes[:, 0])
+        rh_vertexes[:, 0] -= np.min(rh_vertexes[:, 0])
+
+        # Combine two meshes
+        vertexes = np.r_[lh_vertexes, rh_vertexes]
+        lh_vertex_cnt = lh_vertexes.shape[0]
+        faces = np.r_[lh_faces, lh_vertex_cnt + rh_faces]
+
+        # Move the mesh so that the center of the brain is at (0, 0, 0) (kinda)
+        vertexes[:, 1:2] -= np.mean(vertexes[:, 1:2])
+
+        return vertexes, faces
+
+    def _get_mesh_data_from_forward_solution(self, forward_solution_file_path) -> (list, gl.MeshData):
+        # mne's forward solution is a dict with the geometry information under the key 'src'.
+        # forward_solution['src'] is a list two items each of which corresponds to one hemisphere.
+        forward_solution = mne.read_forward_solution(forward_solution_file_path, verbose='ERROR')
+        left_hemi, right_hemi = forward_solution['src']
+
+        # Each hemisphere is represented by a dict containing the list of all vertices from the original mesh (with
+        # default options in FreeSurfer that is ~150K vertices). These are stored under the key 'rr'.
+
+        # Only a small subset of these vertices was likely used during the construction of the forward solution. The
+        # mesh containing only the used vertices is represented by an array of faces stored under the 'use_tris' key.
+        # This submesh still contains some extra vertices so that it is still a manifold.
+
+        # Each face is a row with the indices of the vertices of that face. The indexing is into the 'rr' array
+        # containing all the vertices.
+
+        # Let's now combine two meshes into one. Also save the indexes of the sources
+        vertexes = np.r_[left_hemi['rr'], right_hemi['rr']]
+        lh_vertex_cnt = left_hemi['rr'].shape[0]
+        faces = np.r_[left_hemi['use_tris'], lh_vertex_cnt + right_hemi['use_tris']]
+        sources_idx = np.r_[left_hemi['vertno'], lh_vertex_cnt + right_hemi['vertno']]
+
+        return sources_idx, vertexes, faces
+
+    def _get_low_resolution_mesh_from_forward_solution(self, forward_solution_file_path):
+        # Same geometry as in _get_mesh_data_from_forward_solution but only the vertices referenced by 'use_tris' are
+        # kept, so the mesh has roughly as many vertices as there are sources and no interpolation is needed.
+        forward_solution = mne.read_forward_solution(forward_solution_file_path, verbose='ERROR')
+
+        hemi_meshes = list()
+        hemi_sources_idx = list()
+        for hemi in forward_solution['src']:
+            # Indices into 'rr' of the used vertices, and the faces reindexed into that subset
+            used_vertex_idx, faces = np.unique(hemi['use_tris'], return_inverse=True)
+            faces = faces.reshape(hemi['use_tris'].shape)
+            # Source spaces are in meters while FreeSurfer surfaces are in millimeters
+            vertexes = hemi['rr'][used_vertex_idx] * 1000
+
+            sources_idx = np.searchsorted(used_vertex_idx, hemi['vertno'])
+            if not np.array_equal(used_vertex_idx[np.minimum(sources_idx, len(used_vertex_idx) - 1)],
+                                  hemi['vertno']):
+                raise ValueError('Some of the sources in {} are not vertices of the decimated mesh'.format(
+                    forward_solution_file_path))
+
+            hemi_meshes.extend((vertexes, faces))
+            hemi_sources_idx.append(sources_idx)
+
+        vertexes, faces = self._combine_hemispheres(*hemi_meshes)
+        lh_vertex_cnt = hemi_meshes[0].shape[0]
+        sources_idx = np.r_[hemi_sources_idx[0], lh_vertex_cnt + hemi_sources_idx[1]]
+
+        return sources_idx, vertexes, faces
+
+    def _create_widget(self):
+        # TODO: change to vispy
+        # widget = gl.GLViewWidget()
+        canvas = scene.SceneCanvas(keys='interactive', show=False)
+
+        # Add a ViewBox to let the user zoom/rotate
+        view = canvas.central_widget.add_view()
+        view.camera = 'turntable'
+        view.camera.fov = 50
+        view.camera.distance = 400
+
+        # Make light follow camera
+        @canvas.events.mouse_move.connect
+        def on_mouse_move(event):
+            self.mesh_data._camera = view.camera
+            self.mesh_data.shared_program.frag['camtf'] = self.mesh_data._camera.transform
+            self.mesh_data.update()
+            view.add(self.mesh_data)
+        # # Set the camera at a distance proportional to the size of the mesh along the widest dimension
+        # max_ptp = max(np.ptp(self.mesh_data.vertexes(), axis=0))
+        # widget.setCameraPosition(distance=(1.5 * max_ptp))
+        return canvas.native
+
+
+    def _calculate_background_colors(self, show_curvature):
+        if show_curvature:
+            curvature_file_paths = [os.path.join(self.surfaces_dir,
+                                                 "{}.curv".format(h)) for h in ('lh', 'rh')]
+            curvatures = [nib.freesurfer.read_morph_data(path) for path in curvature_file_paths]
+            curvature = np.concatenate(curvatures)
+            return self.brain_colormap((curvature > 0) / 3 + 1 / 3)  # 1/3 for concave, 2/3 for convex
+        else:
+            background_color = self.brain_colormap(0.5)
+            total_vertex_cnt = self.mesh_data.vertexes().shape[0]
+            return np.tile(background_color, total_vertex_cnt)
+
+    @staticmethod
+    def _guess_surfaces_dir_based_on(mne_forward_model_file_path):
+        # If the forward model that was used is from the mne's sample dataset, then we can use curvatures from there
+        path_to_sample = os.path.realpath(sample.data_path(verbose='ERROR'))
+        if os.path.realpath(mne_forward_model_file_path).startswith(path_to_sample):
+            return os.path.join(path_to_sample, "subjects", "sample", "surf")
+
+    @staticmethod
+    def read_smoothing_matrix():
+        lh_npz = np.load('playground/vs_pysurfer/smooth_mat_lh.npz')
+        rh_npz = np.load('playground/vs_pysurfer/smooth_mat_rh.npz')
+
+        smooth_mat_lh = sparse.coo_matrix((
+            lh_npz['data'], (lh_npz['row'], lh_npz['col'])),
+            shape=lh_npz['shape'] + rh_npz['shape'])
+
+        lh_row_cnt, lh_col_cnt = lh_npz['shape']
+        smooth_mat_rh = sparse.coo_matrix((
+            rh_npz['data'], (rh_npz['row'] + lh_row_cnt, rh_npz['col'] + lh_col_cnt)),
+            shape=rh_npz['shape'] + lh_npz['shape'])
+
+        return smooth_mat_lh.tocsc() + smooth_mat_rh.tocsc()
+
+    def _get_smoothing_matrix(self, mne_forward_model_file_path):
+        """
+        Creates or loads a smoothing matrix that lets us
+        interpolate source values onto all mesh vertices
+
+        """
+        # Not all the vertices in the forward solution mesh are sources.
+        # sources_idx actually indexes into the union of
+        # high-definition meshes for left and right hemispheres.
+        # The smoothing matrix then lets us assign a color to each vertex.
+        # If in future we decide to use low-definition mesh from
+        # the forward model for drawing, we should index into that.
+        # Shorter: the coordinates of the jth source are
+        # in self.mesh_data.vertexes()[sources_idx[j], :]
+        smoothing_matrix_file_path = (
+            os.path.splitext(mne_forward_model_file_path)[0] +
+            '-smoothing-matrix.npz')
+        try:
+            return sparse.load_npz(smoothing_matrix_file_path)
+        except FileNotFoundError:
+            print('Calculating smoothing matrix.' +
+                  ' This might take a while the first time.')
+            sources_idx, vertexes, faces = self._get_mesh_data_from_forward_solution(
+                mne_forward_model_file_path)
+            adj_mat = mesh_edges(self.mesh_data._faces)
+            smoothing_mat = smoothing_matrix(sources_idx, adj_mat)
+            sparse.save_npz(smoothing_matrix_file_path, smoothing_mat)
+            return smoothing_mat
@@ -1,4 +1,4 @@
-from PyQt5 import QtGui
+from PyQt5 import QtGui, QtCore
 from ...nodes.node import ProcessorNode
 from ...nodes import processors
 from ...helpers.pyqtgraph import MyGroupParameter, parameterTypes
@@ -169,7 +169,7 @@ class EnvelopeExtractorControls(ProcessorNodeControls):
 
     def _create_parameters(self):
 
-        method_values = ['Exponential smoothing']  # TODO: change once we support more methods
+        method_values = self.PROCESSOR_CLASS.SUPPORTED_METHODS
         method_value = self._processor_node.method
         methods_combo = parameterTypes.ListParameter(name=self.METHODS_COMBO_NAME,
                                                      values=method_values, value=method_value)
@@ -182,11 +182,11 @@ class EnvelopeExtractorControls(ProcessorNodeControls):
         factor_spin_box.sigValueChanged.connect(self._on_factor_changed)
         self.factor_spin_box = self.addChild(factor_spin_box)
 
-    def _on_method_changed(self):
-        pass  # TODO: implement
+    def _on_method_changed(self, param, value):
+        self._processor_node.method = value
 
-    def _on_factor_changed(self):
-        pass  # TODO: implement
+    def _on_factor_changed(self, param, value):
+        self._processor_node.factor = value
 
 
 class BeamformerControls(ProcessorNodeControls):
@@ -330,20 +330,59 @@ class MCEControls(ProcessorNodeControls):
 
 class ICARejectionControls(ProcessorNodeControls):
     CONTROLS_LABEL = 'ICA rejection'
-    PROCESSOR_CLASS = processors.MCE
+    PROCESSOR_CLASS = processors.ICARejection
 
     METHODS_COMBO_NAME = 'Method: '
+    COMPONENT_SELECTION_COMBO_NAME = 'Component selection: '
+    REJECTED_COMPONENTS_NAME = 'Rejected components: '
+    REJECTED_COMPONENTS_REFRESH_INTERVAL_MS = 500
 
     def _create_parameters(self):
 
-        # method_values = self.PROCESSOR_CLASS.SUPPORTED_METHODS
-        # method_value = self._processor_node.method
-        # methods_combo = parameterTypes.ListParameter(name=self.METHODS_COMBO_NAME,
-        #                                              values=method_values, value=method_value)
-        # methods_combo.sigValueChanged.connect(self._on_method_changed)
-        # self.methods_combo = self.addChild(methods_combo)
-        pass
+        method_values = self.PROCESSOR_CLASS.SUPPORTED_METHODS
+        method_value = self._processor_node.method
+        methods_combo = parameterTypes.ListParameter(name=self.METHODS_COMBO_NAME,
+                                                     values=method_values, value=method_value)
+        methods_combo.sigValueChanged.connect(self._on_method_changed)
+        self.methods_combo = self.addChild(methods_combo)
+
+        selection_values = self.PROCESSOR_CLASS.SUPPORTED_COMPONENT_SELECTIONS
+        selection_value = self._processor_node.component_selection
+        selection_combo = parameterTypes.ListParameter(name=self.COMPONENT_SELECTION_COMBO_NAME,
+                                                       values=selection_values, value=selection_value)
+        selection_combo.sigValueChanged.connect(self._on_component_selection_changed)
+        self.selection_combo = self.addChild(selection_combo)
+
+        # Comma-separated component indices, applied once ICA has been fitted
+        rejected_components = parameterTypes.SimpleParameter(type='str', name=self.REJECTED_COMPONENTS_NAME,
+                                                             value=self._rejected_components_text())
+        rejected_components.sigValueChanged.connect(self._on_rejected_components_changed)
+        self.rejected_components = self.addChild(rejected_components)
+
+        # Components are picked automatically in the background, so the field is kept up to date with a timer
+        self._rejected_components_timer = QtCore.QTimer()
+        self._rejected_components_timer.timeout.connect(self._show_rejected_components)
+        self._rejected_components_timer.start(self.REJECTED_COMPONENTS_REFRESH_INTERVAL_MS)
 
     def _on_method_changed(self, param, value):
-        # self._processor_node.method = value
-        pass
+        self._processor_node.method = value
+
+    def _on_component_selection_changed(self, param, value):
+        self._processor_node.component_selection = value
+
+    def _on_rejected_components_changed(self, param, value):
+        try:
+            components = [int(c) for c in value.split(',') if c.strip()]
+            self._processor_node.reject_components(components)
+        except ValueError as e:
+            self._processor_node.logger.warning(
+                'Could not reject components {!r}: {}'.format(value, e))
+            self._show_rejected_components()
+
+    def _rejected_components_text(self):
+        return ', '.join(str(c) for c in self._processor_node.rejected_components)
+
+    def _show_rejected_components(self):
+        text = self._rejected_components_text()
+        if self.rejected_components.value() != text:
+            self.rejected_components.setValue(text, blockSignal=self._on_rejected_components_changed)
@@ -0,0 +1,177 @@
+"""
+Artifact subspace reconstruction (Mullen et al., 2015; Kothe and Jung,
+2016). Data are CHANNELS x TIME arrays that have been high-passed, e.g. by
+LinearFilter.
+
+"""
+import numpy as np
+
+from .ring_buffer import create_ring_buffer
+from .. import DTYPE
+
+
+def _window_starts(sample_count: int, window_length: int, hop: int):
+    return np.arange(0, sample_count - window_length + 1, hop)
+
+
+def calibrate_asr(data: np.ndarray, frequency: float, cutoff: float=20.0,
+                  window_length: float=0.5, window_overlap: float=0.66):
+    """
+    Statistics of clean data. Both the covariance and the RMS of each
+    principal component are computed over windows of window_length seconds
+    and summarized robustly: the covariance is the element-wise median of
+    the window covariances and the RMS threshold of a component is
+    median + cutoff * (standard deviation estimated from the median
+    absolute deviation). Short artifacts in data hardly change either.
+
+    Returns (mixing, threshold): mixing is the square root of the covariance
+    and threshold.dot(x) gives the amplitudes of x along the principal
+    components in the units of the component thresholds. Both are CHANNELS
+    x CHANNELS.
+
+    """
+    data = np.asarray(data, dtype=np.float64)
+    channel_count, sample_count = data.shape
+    window_length = int(round(window_length * frequency))
+    if sample_count < window_length:
+        raise ValueError(
+            'Calibration needs at least {} samples, got {}.'.format(
+                window_length, sample_count))
+
+    # Non-overlapping windows for the covariance
+    block_count = sample_count // window_length
+    blocks = data[:, :block_count * window_length].reshape(
+        channel_count, block_count, window_length).transpose(1, 0, 2)
+    covariances = np.matmul(blocks, blocks.transpose(0, 2, 1))
+    covariances /= window_length
+    covariance = np.median(covariances, axis=0)
+
+    eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+    eigenvalues = np.maximum(eigenvalues, 0)
+    mixing = (eigenvectors * np.sqrt(eigenvalues)).dot(eigenvectors.T)
+
+    # RMS of the components in overlapping windows, from cumulative sums
+    hop = max(1, int(round(window_length * (1 - window_overlap))))
+    starts = _window_starts(sample_count, window_length, hop)
+    squared_components = np.square(eigenvectors.T.dot(data))
+    cumulative_sums = np.zeros((channel_count, sample_count + 1))
+    np.cumsum(squared_components, axis=1, out=cumulative_sums[:, 1:])
+    rms = np.sqrt((cumulative_sums[:, starts + window_length] -
+                   cumulative_sums[:, starts]) / window_length)
+
+    medians = np.median(rms, axis=1)
+    stds = 1.4826 * np.median(np.abs(rms - medians[:, np.newaxis]), axis=1)
+    threshold = (medians + cutoff * stds)[:, np.newaxis] * eigenvectors.T
+    return mixing, threshold
+
+
+class ASRFilter(object):
+    """
+    Removes high-variance artifacts chunk by chunk. Every step samples the
+    covariance of the last window_length samples is decomposed and the
+    principal components whose variance exceeds the calibration threshold
+    are reconstructed from the rest using the calibration covariance (the
+    mixing matrix). At most max_dimension of the channels are
+    reconstructed.
+
+    The window covariance is updated with the outer products of the samples
+    that enter and leave the window, so a step costs O(channels ** 2 *
+    step) and one eigendecomposition. The reconstruction matrix found at
+    the end of a step is blended in over the next step with a raised
+    cosine; as long as no component exceeds the threshold the data are
+    passed through.
+
+    """
+    def __init__(self, mixing: np.ndarray, threshold: np.ndarray,
+                 window_length: int, step: int=32,
+                 max_dimension: float=0.66):
+        self.mixing = mixing
+        self.threshold = threshold
+        self.window_length = window_length
+        self.step = step
+        self.channel_count = mixing.shape[0]
+        self.max_reconstructed_count = int(
+            round(self.channel_count * max_dimension))
+
+        self._identity = np.eye(self.channel_count)
+        self._blend_weights = (
+            1 - np.cos(np.pi * np.arange(1, step + 1) / step)) / 2
+        self._window = create_ring_buffer(self.channel_count, window_length,
+                                          dtype=np.float64)
+        self.reset()
+
+    def reset(self):
+        self._window.clear()
+        self._window_sum = np.zeros((self.channel_count, self.channel_count))
+        self._samples_since_update = 0
+        self._previous_matrix = None  # type: np.ndarray
+        self._matrix = None  # type: np.ndarray
+
+    @property
+    def reconstruction_matrix(self) -> np.ndarray:
+        """The latest reconstruction matrix, None for the identity"""
+        return self._matrix
+
+    def apply(self, chunk: np.ndarray) -> np.ndarray:
+        chunk_float64 = np.asarray(chunk, dtype=np.float64)
+        output = np.array(chunk, dtype=DTYPE)
+        sample_count = chunk.shape[1]
+        start = 0
+        while start < sample_count:
+            segment_length = min(self.step - self._samples_since_update,
+                                 sample_count - start)
+            end = start + segment_length
+            segment = chunk_float64[:, start:end]
+
+            if self._matrix is not None or self._previous_matrix is not None:
+                output[:, start:end] = self._reconstruct(segment)
+
+            self._update_window(segment)
+            self._samples_since_update += segment_length
+            if self._samples_since_update == self.step:
+                self._samples_since_update = 0
+                self._previous_matrix = self._matrix
+                # Until the window is full its covariance is too noisy
+                if self._window.data.shape[-1] == self.window_length:
+                    self._matrix = self._reconstruction_matrix()
+            start = end
+        return output
+
+    def _reconstruct(self, segment):
+        previous = (self._identity if self._previous_matrix is None
+                    else self._previous_matrix)
+        current = self._identity if self._matrix is None else self._matrix
+        old = previous.dot(segment)
+        if current is previous:
+            return old
+        new = current.dot(segment)
+        first = self._samples_since_update
+        weights = self._blend_weights[first:first + segment.shape[1]]
+        new -= old
+        new *= weights
+        new += old
+        return new
+
+    def _update_window(self, segment):
+        leaving_count = (self._window.data.shape[-1] + segment.shape[1] -
+                         self.window_length)
+        if leaving_count > 0:
+            leaving = self._window.data[:, :leaving_count]
+            self._window_sum -= leaving.dot(leaving.T)
+        self._window_sum += segment.dot(segment.T)
+        self._window.extend(segment)
+
+    def _reconstruction_matrix(self):
+        covariance = self._window_sum / self._window.data.shape[-1]
+        eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+        # Eigenvalues are in ascending order, so the first components are
+        # always kept
+        kept = eigenvalues < np.sum(
+            np.square(self.threshold.dot(eigenvectors)), axis=0)
+        kept[:self.channel_count - self.max_reconstructed_count] = True
+        if np.all(kept):
+            return None
+        projected_mixing = eigenvectors.T.dot(self.mixing)
+        projected_mixing[~kept] = 0
+        return self.mixing.dot(np.linalg.pinv(projected_mixing)).dot(
+            eigenvectors.T)
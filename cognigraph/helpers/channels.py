@@ -48,6 +48,11 @@ def channel_labels_saver(mne_info: mne.Info):
     return tuple(mne_info['ch_names'], )
 
 
+def channel_labels_and_frequency_saver(mne_info: mne.Info):
+    """For the nodes that depend on the sampling frequency too, e.g. after a Resample node"""
+    return (mne_info['sfreq'], ) + channel_labels_saver(mne_info)
+
+
 def get_average_reference_projection(channel_count: int):
     """
     Calculates average-reference projection matrix assuming all channel_count channels are used
@@ -0,0 +1,163 @@
+"""
+Functional connectivity between the channels of analytic (complex,
+band-limited) CHANNELS x TIME signals, e.g. cFIR filter outputs, over an
+exponentially weighted window.
+
+"""
+import numpy as np
+from scipy.linalg.blas import cherk
+
+from .. import DTYPE
+
+SUPPORTED_METHODS = ('PLV', 'Imaginary coherence', 'Orthogonalized AEC')
+
+
+def all_pairs(channel_count: int) -> np.ndarray:
+    """PAIRS x 2 array of the channel indices i < j of all pairs"""
+    return np.column_stack(np.triu_indices(channel_count, k=1))
+
+
+def _normalize(analytic_signal):
+    """Unit-amplitude phasors, zero where the amplitude is zero"""
+    amplitude = np.abs(analytic_signal)
+    return np.divide(analytic_signal, amplitude,
+                     out=np.zeros_like(analytic_signal),
+                     where=amplitude > 0)
+
+
+class ConnectivityEstimator(object):
+    """
+    Updates the connectivity between the channel pairs (PAIRS x 2 array of
+    channel indices, all pairs by default) with every chunk. A sample t
+    samples ago has weight factor ** t.
+
+    'PLV' is the phase-locking value, 'Imaginary coherence' the imaginary
+    part of the coherency (Nolte et al., 2004) and 'Orthogonalized AEC' the
+    correlation of the amplitude envelopes after orthogonalizing one signal
+    with respect to the other, averaged over both directions (Hipp et al.,
+    2012). The last two are insensitive to zero-lag leakage.
+
+    For all pairs, PLV and coherence need the cross products of all the
+    channels: those are accumulated with one Hermitian rank-k update (BLAS
+    herk, upper triangle only) per chunk. For a subset of pairs and for
+    AEC only the products of the paired channels are computed, which costs
+    O(pairs) instead of O(channels ** 2).
+
+    """
+    def __init__(self, method: str, channel_count: int, factor: float,
+                 pairs: np.ndarray=None):
+        if method not in SUPPORTED_METHODS:
+            raise ValueError(
+                'Method {} is not supported.'
+                ' Use one of: {}'.format(method, SUPPORTED_METHODS))
+        self.method = method
+        self.channel_count = channel_count
+        self.factor = factor
+        self._uses_herk = pairs is None and method != 'Orthogonalized AEC'
+        if pairs is None:
+            pairs = all_pairs(channel_count)
+        self.pairs = np.asarray(pairs, dtype=int).reshape(-1, 2)
+        self.reset()
+
+    def reset(self):
+        self._total_weight = 0.0
+        pair_count = len(self.pairs)
+        if self.method == 'Orthogonalized AEC':
+            # Weighted sums of a, b, a^2, b^2 and ab in both directions
+            self._moments = np.zeros((5, 2, pair_count))
+        elif self._uses_herk:
+            self._cross_products = np.zeros(
+                (self.channel_count, self.channel_count), dtype=np.complex64,
+                order='F')
+        else:
+            self._cross_products = np.zeros(pair_count, dtype=np.complex64)
+            self._powers = np.zeros(self.channel_count)
+
+    def apply(self, analytic_signal: np.ndarray) -> np.ndarray:
+        """Connectivity of each pair after the chunk, PAIRS values"""
+        sample_count = analytic_signal.shape[1]
+        decay = self.factor ** sample_count
+        weights = (1 - self.factor) * self.factor ** np.arange(
+            sample_count - 1, -1, -1)
+        self._total_weight = decay * self._total_weight + weights.sum()
+
+        if self.method == 'Orthogonalized AEC':
+            return self._update_aec(analytic_signal, decay, weights)
+
+        if self.method == 'PLV':
+            analytic_signal = _normalize(analytic_signal)
+        if self._uses_herk:
+            self._update_all_cross_products(analytic_signal, decay, weights)
+            rows, columns = self.pairs.T
+            cross_products = self._cross_products[rows, columns]
+            powers = self._cross_products.diagonal().real
+        else:
+            self._update_pair_cross_products(analytic_signal, decay, weights)
+            cross_products = self._cross_products
+            powers = self._powers
+
+        if self.method == 'PLV':
+            if self._total_weight == 0:
+                return np.zeros(len(self.pairs), dtype=DTYPE)
+            return (np.abs(cross_products) / self._total_weight).astype(DTYPE)
+
+        norms = np.sqrt(powers[self.pairs[:, 0]] * powers[self.pairs[:, 1]])
+        return np.divide(cross_products.imag, norms,
+                         out=np.zeros(len(self.pairs)),
+                         where=norms > 0).astype(DTYPE)
+
+    def _update_all_cross_products(self, analytic_signal, decay, weights):
+        # A C-ordered CHANNELS x TIME array is a Fortran-ordered TIME x
+        # CHANNELS one, so herk gets A^H A without copying. That is the
+        # conjugate of sum_t z_i(t) conj(z_j(t)), hence the conj.
+        weighted = np.conj(analytic_signal * np.sqrt(weights)).astype(
+            np.complex64)
+        self._cross_products = cherk(
+            1.0, weighted.T, beta=decay, c=self._cross_products, trans=2,
+            overwrite_c=1)
+
+    def _update_pair_cross_products(self, analytic_signal, decay, weights):
+        first = analytic_signal[self.pairs[:, 0]]
+        second = analytic_signal[self.pairs[:, 1]]
+        self._cross_products *= decay
+        self._cross_products += (first * np.conj(second)).dot(weights)
+        self._powers *= decay
+        self._powers += np.square(np.abs(analytic_signal)).dot(weights)
+
+    def _update_aec(self, analytic_signal, decay, weights):
+        first = analytic_signal[self.pairs[:, 0]]
+        second = analytic_signal[self.pairs[:, 1]]
+        amplitude = np.abs(analytic_signal)
+        first_amplitude = amplitude[self.pairs[:, 0]]
+        second_amplitude = amplitude[self.pairs[:, 1]]
+        # The amplitude of the part of one signal orthogonal to the other:
+        # |Im(y conj(x))| / |x|
+        orthogonal = np.abs((second * np.conj(first)).imag)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            second_orthogonal = np.nan_to_num(orthogonal / first_amplitude)
+            first_orthogonal = np.nan_to_num(orthogonal / second_amplitude)
+
+        self._moments *= decay
+        weights = weights.astype(first_amplitude.dtype)
+        for direction, (a, b) in enumerate((
+                (first_amplitude, second_orthogonal),
+                (second_amplitude, first_orthogonal))):
+            moments = self._moments[:, direction]
+            moments[0] += a.dot(weights)
+            moments[1] += b.dot(weights)
+            moments[4] += (a * b).dot(weights)
+            np.square(a, out=a)
+            np.square(b, out=b)
+            moments[2] += a.dot(weights)
+            moments[3] += b.dot(weights)
+
+        if self._total_weight == 0:
+            return np.zeros(len(self.pairs), dtype=DTYPE)
+        mean_a, mean_b, mean_aa, mean_bb, mean_ab =\
+            self._moments / self._total_weight
+        covariance = mean_ab - mean_a * mean_b
+        variances = (mean_aa - mean_a ** 2) * (mean_bb - mean_b ** 2)
+        correlations = np.divide(covariance, np.sqrt(np.abs(variances)),
+                                 out=np.zeros_like(covariance),
+                                 where=variances > 0)
+        return correlations.mean(axis=0).astype(DTYPE)
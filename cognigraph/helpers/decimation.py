@@ -0,0 +1,125 @@
+from math import gcd
+
+import numpy as np
+
+from .. import DTYPE
+
+
+class MinMaxDecimator(object):
+    """
+    Replaces every samples_per_bin samples of each row with two samples:
+    their minimum and their maximum. When plotted as a line, the result
+    covers the same vertical extent as the original data, so nothing visible
+    is lost as long as one bin is no wider than one pixel column.
+
+    Works on CHANNELS x TIME arrays. Samples that do not fill a whole bin
+    are kept until the next chunk.
+
+    """
+    TIME_AXIS = 1
+
+    def __init__(self, samples_per_bin: int, row_cnt: int, dtype=DTYPE):
+        self.samples_per_bin = samples_per_bin
+        self.row_cnt = row_cnt
+        self._leftover = np.empty((row_cnt, samples_per_bin), dtype=dtype)
+        self._leftover_cnt = 0
+
+    def apply(self, chunk: np.ndarray) -> np.ndarray:
+        if self._leftover_cnt > 0:
+            chunk = np.concatenate(
+                (self._leftover[:, :self._leftover_cnt], chunk),
+                axis=self.TIME_AXIS)
+
+        sample_cnt = chunk.shape[self.TIME_AXIS]
+        bin_cnt = sample_cnt // self.samples_per_bin
+        binned_sample_cnt = bin_cnt * self.samples_per_bin
+
+        bins = chunk[:, :binned_sample_cnt].reshape(
+            (self.row_cnt, bin_cnt, self.samples_per_bin))
+        envelopes = np.empty((self.row_cnt, bin_cnt, 2), dtype=chunk.dtype)
+        np.min(bins, axis=2, out=envelopes[:, :, 0])
+        np.max(bins, axis=2, out=envelopes[:, :, 1])
+
+        self._leftover_cnt = sample_cnt - binned_sample_cnt
+        self._leftover[:, :self._leftover_cnt] = chunk[:, binned_sample_cnt:]
+
+        return envelopes.reshape((self.row_cnt, 2 * bin_cnt))
+
+    def reset(self):
+        self._leftover_cnt = 0
+
+
+class PolyphaseResampler(object):
+    """
+    Resamples CHANNELS x TIME chunks by up / down: upsampling by up,
+    low-pass filtering and keeping every down-th sample, as
+    scipy.signal.resample_poly does, but with the filter state kept between
+    chunks so that the chunks can be of any size. Only the taps that meet
+    non-zero samples of the upsampled signal are used (the polyphase
+    decomposition), so each output sample costs len(taps) / up operations
+    per channel.
+
+    The default filter is that of resample_poly. It is linear-phase with a
+    delay of group_delay output samples.
+
+    """
+    def __init__(self, up: int, down: int, channel_count: int,
+                 taps: np.ndarray=None, dtype=DTYPE):
+        from scipy.signal import firwin
+
+        divisor = gcd(up, down)
+        self.up, self.down = up // divisor, down // divisor
+        self.channel_count = channel_count
+        self.dtype = np.dtype(dtype)
+
+        max_rate = max(self.up, self.down)
+        if taps is None and max_rate == 1:
+            taps = np.ones(1)
+        elif taps is None:
+            half_length = 10 * max_rate
+            taps = firwin(2 * half_length + 1, 1 / max_rate,
+                          window=('kaiser', 5.0)) * self.up
+        self.group_delay = (len(taps) - 1) / 2 / self.down
+
+        # polyphase_taps[phase, k] is the tap applied to the sample
+        # window_length - 1 - k samples before the current one
+        self._window_length = -(-len(taps) // self.up)
+        padded_taps = np.zeros(self._window_length * self.up)
+        padded_taps[:len(taps)] = taps
+        self._polyphase_taps = padded_taps.reshape(
+            self._window_length, self.up).T[:, ::-1].astype(self.dtype)
+        self.reset()
+
+    def apply(self, chunk: np.ndarray) -> np.ndarray:
+        sample_count = chunk.shape[1]
+        history_length = self._window_length - 1
+        signal = np.empty((self.channel_count, history_length + sample_count),
+                          dtype=self.dtype)
+        signal[:, :history_length] = self._history
+        signal[:, history_length:] = chunk
+
+        # Positions of the output samples on the upsampled time axis, with
+        # the first sample of the chunk at 0
+        last_position = sample_count * self.up - 1
+        positions = np.arange(self._next_position, last_position + 1,
+                              self.down)
+        self._next_position = (self._next_position +
+                               len(positions) * self.down -
+                               sample_count * self.up)
+        self._history = signal[:, sample_count:]
+
+        # The window of the output sample at position p ends with input
+        # sample p // up, which is signal[p // up + history_length]
+        windows = np.lib.stride_tricks.as_strided(
+            signal, shape=(self.channel_count, sample_count,
+                           self._window_length),
+            strides=signal.strides + signal.strides[1:], writeable=False)
+        window_starts = positions // self.up
+        phases = positions % self.up
+        return np.einsum('cjk,jk->cj', windows[:, window_starts],
+                         self._polyphase_taps[phases])
+
+    def reset(self):
+        self._history = np.zeros((self.channel_count, self._window_length - 1),
+                                 dtype=self.dtype)
+        self._next_position = 0
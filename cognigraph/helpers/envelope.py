@@ -0,0 +1,189 @@
+"""
+Streaming envelope detectors for CHANNELS x TIME chunks. Each has apply(chunk)
+returning the envelope of the chunk, reset() and group_delay: the delay of the
+envelope in samples.
+
+"""
+import math
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+from scipy.fftpack import next_fast_len
+from scipy.linalg import solve_toeplitz
+
+from .. import DTYPE
+from .filters import ExponentialSmoother
+
+
+class ExponentialSmoothingEnvelope(object):
+    """Exponentially smoothed absolute value of the signal"""
+    def __init__(self, factor: float, channel_count: int):
+        self._smoother = ExponentialSmoother(factor, channel_count)
+        # Group delay of a first-order low-pass filter at zero frequency
+        self.group_delay = factor / (1 - factor)
+
+    def apply(self, chunk: np.ndarray) -> np.ndarray:
+        rectified = np.abs(chunk, dtype=DTYPE)
+        return self._smoother.apply(rectified)
+
+    def reset(self):
+        self._smoother.reset()
+
+
+class ExponentialRMSEnvelope(ExponentialSmoothingEnvelope):
+    """
+    Square root of the exponentially smoothed square of the signal, i.e. RMS
+    over an exponential window. Multiply by sqrt(2) to get the amplitude of
+    a sinusoid.
+
+    """
+    def apply(self, chunk: np.ndarray) -> np.ndarray:
+        squared = np.square(chunk, dtype=DTYPE)
+        mean_square = self._smoother.apply(squared)
+        # Rounding can make tiny values negative
+        np.maximum(mean_square, 0, out=mean_square)
+        return np.sqrt(mean_square, out=mean_square)
+
+
+# Default cFIR length in periods of the band width (1 / (upper - lower
+# cutoff)). For 8-12 Hz and a 50 ms delay the amplitude error is 3% with 4
+# periods and 10% with 2.
+CFIR_BAND_WIDTH_PERIODS = 4
+
+
+def default_cfir_tap_count(band, frequency: float, delay: int) -> int:
+    """CFIR_BAND_WIDTH_PERIODS of the band width, but at least 2 * delay + 1"""
+    lower_cutoff, upper_cutoff = band
+    band_width_tap_count = int(math.ceil(
+        CFIR_BAND_WIDTH_PERIODS * frequency / (upper_cutoff - lower_cutoff)))
+    return max(band_width_tap_count, 2 * delay + 1)
+
+
+def cfir_taps(band, frequency: float, delay: int, n_taps: int,
+              n_fft: int=None, transition: float=None) -> np.ndarray:
+    """
+    Complex FIR filter whose output approximates the analytic signal of the
+    input band-passed to band and delayed by delay samples, so that its
+    absolute value is the envelope (the cFIR filter of Smetanin et al.,
+    2020, also used in nfb).
+
+    The taps are a least-squares fit of the ideal frequency response at
+    n_fft frequencies, ignoring transition bands of transition Hz on either
+    side of band (the band width by default, at most half the lower cutoff
+    below it). Without them short delays are inaccurate: for 8-12 Hz and
+    a 50 ms delay the amplitude error drops from 50% to 3%.
+
+    """
+    if n_fft is None:
+        n_fft = 4 * n_taps
+    lower_cutoff, upper_cutoff = band
+    if transition is None:
+        transition = upper_cutoff - lower_cutoff
+    lower_transition = min(transition, lower_cutoff / 2)
+
+    frequencies = np.arange(n_fft) / n_fft * frequency
+    ideal_response = 2 * np.exp(-2j * np.pi * np.arange(n_fft) / n_fft * delay)
+    ideal_response[(frequencies < lower_cutoff) |
+                   (frequencies > upper_cutoff)] = 0
+    weights = np.ones(n_fft)
+    weights[(frequencies > lower_cutoff - lower_transition) &
+            (frequencies < lower_cutoff)] = 0
+    weights[(frequencies > upper_cutoff) &
+            (frequencies < upper_cutoff + transition)] = 0
+
+    # With F[k, t] = exp(-2 pi i k t / n_fft) the response of the taps is
+    # F.dot(b) and the normal equations are F^H W F b = F^H W ideal_response.
+    # (F^H W F)[t, s] depends only on t - s, so it is a Hermitian Toeplitz
+    # matrix, and both it and the right-hand side are inverse FFTs. Levinson
+    # recursion solves the system in O(n_taps ** 2) time and O(n_fft) memory.
+    first_column = n_fft * np.fft.ifft(weights)[:n_taps]
+    right_hand_side = n_fft * np.fft.ifft(weights * ideal_response)[:n_taps]
+    return solve_toeplitz(first_column, right_hand_side)
+
+
+class OverlapSaveFilter(object):
+    """
+    Applies an FIR filter with (possibly complex) taps to chunks of
+    channel_count channels, keeping the last len(taps) - 1 samples between
+    chunks. Long chunks are convolved with the overlap-save method, short
+    ones directly, whichever takes fewer operations.
+
+    """
+    def __init__(self, taps: np.ndarray, channel_count: int):
+        if np.iscomplexobj(taps):
+            self.output_dtype = np.result_type(DTYPE, np.complex64)
+        else:
+            self.output_dtype = DTYPE
+        self.taps = np.asarray(taps, dtype=self.output_dtype)
+        self.channel_count = channel_count
+        self._reversed_taps = self.taps[::-1].copy()
+        self._taps_ffts = dict()  # n_fft -> FFT of the taps
+        self.reset()
+
+    def apply(self, chunk: np.ndarray) -> np.ndarray:
+        sample_count = chunk.shape[1]
+        history_length = len(self.taps) - 1
+        signal = np.empty((self.channel_count, history_length + sample_count),
+                          dtype=DTYPE)
+        signal[:, :history_length] = self._history
+        signal[:, history_length:] = chunk
+        self._history = signal[:, sample_count:]
+
+        n_fft = next_fast_len(history_length + sample_count)
+        if sample_count * len(self.taps) <= 2 * n_fft * math.log2(n_fft):
+            # windows[c, t] is signal[c, t:t + len(taps)]
+            windows = as_strided(
+                signal, shape=(self.channel_count, sample_count,
+                               len(self.taps)),
+                strides=signal.strides + signal.strides[1:], writeable=False)
+            return windows.dot(self._reversed_taps)
+
+        taps_fft = self._taps_ffts.get(n_fft)
+        if taps_fft is None:
+            taps_fft = self._taps_ffts[n_fft] = np.fft.fft(self.taps, n_fft)
+        output = np.fft.ifft(np.fft.fft(signal, n_fft, axis=1) * taps_fft,
+                             axis=1)
+        # The first history_length samples are wrapped around
+        return output[:, history_length:history_length + sample_count].astype(
+            self.output_dtype)
+
+    def reset(self):
+        self._history = np.zeros((self.channel_count, len(self.taps) - 1),
+                                 dtype=DTYPE)
+
+
+class CFIRFilter(OverlapSaveFilter):
+    """
+    cFIR filter (see cfir_taps) for chunks of channel_count channels: its
+    complex output approximates the analytic signal of the input in band,
+    delayed by group_delay = delay samples.
+
+    """
+    def __init__(self, band, frequency: float, delay: int, channel_count: int,
+                 n_taps: int=None):
+        if n_taps is None:
+            n_taps = default_cfir_tap_count(band, frequency, delay)
+        super().__init__(cfir_taps(band, frequency, delay, n_taps),
+                         channel_count)
+        self.group_delay = delay
+
+
+class CFIREnvelope(object):
+    """
+    Absolute value of the output of a CFIRFilter: band-pass filtering and
+    envelope extraction in one step, with a group delay of delay samples
+    that can be much shorter than that of band-pass filtering followed by
+    smoothing.
+
+    """
+    def __init__(self, band, frequency: float, delay: int, channel_count: int,
+                 n_taps: int=None):
+        self._filter = CFIRFilter(band, frequency, delay, channel_count,
+                                  n_taps=n_taps)
+        self.group_delay = delay
+
+    def apply(self, chunk: np.ndarray) -> np.ndarray:
+        return np.abs(self._filter.apply(chunk))
+
+    def reset(self):
+        self._filter.reset()
@@ -0,0 +1,123 @@
+"""
+Streaming IIR filters, mostly in second-order sections (sos).
+
+Chunks are filtered along TIME_AXIS as they are, so CHANNELS x TIME chunks
+need no transposing, and the filter state is kept between chunks: filtering
+a signal chunk by chunk gives the same result as filtering it at once.
+Second-order sections stay stable for narrow bands and high orders where
+the transfer function (b, a) form does not, which also makes float32 state
+good enough.
+
+scipy.signal imports scipy.optimize, which takes seconds, so it is imported
+when a filter is made rather than with this module.
+
+"""
+import numpy as np
+
+from .. import TIME_AXIS, DTYPE
+
+
+def butter_sos(band, frequency, order=4) -> np.ndarray:
+    """
+    Butterworth filter passing band = (lower_cutoff, upper_cutoff) in Hz as
+    second-order sections. A None lower cutoff gives a low-pass filter and
+    a None upper cutoff (or one at the Nyquist frequency or above) gives
+    a high-pass one. Returns None if nothing would be filtered out.
+
+    """
+    from scipy.signal import butter
+    lower_cutoff, upper_cutoff = band
+    nyquist = frequency / 2
+    if lower_cutoff is not None and lower_cutoff <= 0:
+        lower_cutoff = None
+    if upper_cutoff is not None and upper_cutoff >= nyquist:
+        upper_cutoff = None
+
+    if lower_cutoff is None and upper_cutoff is None:
+        return None
+    elif lower_cutoff is None:
+        return butter(order, upper_cutoff / nyquist, btype='lowpass',
+                      output='sos')
+    elif upper_cutoff is None:
+        return butter(order, lower_cutoff / nyquist, btype='highpass',
+                      output='sos')
+    else:
+        return butter(order, [lower_cutoff / nyquist, upper_cutoff / nyquist],
+                      btype='bandpass', output='sos')
+
+
+def cascade(*sos_arrays) -> np.ndarray:
+    """
+    Second-order sections of the filters applied one after another, e.g.
+    cascade(butter_sos((1, None), 500), iirnotch_sos) to apply both in one
+    pass. None means no filter.
+
+    """
+    sos_arrays = [sos for sos in sos_arrays if sos is not None]
+    if not sos_arrays:
+        return None
+    return np.vstack(sos_arrays)
+
+
+class SOSFilter(object):
+    """
+    Applies second-order sections sos to chunks of channel_count channels.
+    The chunks are converted to dtype, which is also the type of the state
+    and of the output. With float32 the error is about 1e-3 of the signal
+    for cutoffs down to 1/1000 of the sampling frequency; use float64 for
+    lower ones.
+
+    """
+    def __init__(self, sos: np.ndarray, channel_count: int, dtype=DTYPE):
+        from scipy.signal import sosfilt
+        self._sosfilt = sosfilt
+        self.dtype = np.dtype(dtype)
+        self.sos = np.asarray(sos, dtype=self.dtype)
+        self.channel_count = channel_count
+        self.reset()
+
+    def apply(self, chunk: np.ndarray) -> np.ndarray:
+        chunk = np.asarray(chunk, dtype=self.dtype)
+        if chunk.shape[TIME_AXIS] == 0:
+            return chunk.copy()
+        output, self._zi = self._sosfilt(self.sos, chunk, axis=TIME_AXIS,
+                                         zi=self._zi)
+        return output
+
+    def reset(self):
+        """Forgets the previous chunks as if the input before was all zeros"""
+        state_shape = [self.channel_count]
+        state_shape.insert(TIME_AXIS, 2)
+        self._zi = np.zeros([self.sos.shape[0]] + state_shape,
+                            dtype=self.dtype)
+
+
+class ExponentialSmoother(object):
+    """
+    y[n] = (1 - factor) * x[n] + factor * y[n - 1] for chunks of
+    channel_count channels. A first-order filter is stable in any form, and
+    lfilter takes a fraction of the per-call overhead of sosfilt, which
+    matters for one-sample chunks.
+
+    """
+    def __init__(self, factor: float, channel_count: int, dtype=DTYPE):
+        from scipy.signal import lfilter
+        self._lfilter = lfilter
+        self.dtype = np.dtype(dtype)
+        self.b = np.array([1 - factor], dtype=self.dtype)
+        self.a = np.array([1, -factor], dtype=self.dtype)
+        self.channel_count = channel_count
+        self.reset()
+
+    def apply(self, chunk: np.ndarray) -> np.ndarray:
+        chunk = np.asarray(chunk, dtype=self.dtype)
+        if chunk.shape[TIME_AXIS] == 0:
+            return chunk.copy()
+        output, self._zi = self._lfilter(self.b, self.a, chunk,
+                                         axis=TIME_AXIS, zi=self._zi)
+        return output
+
+    def reset(self):
+        state_shape = [self.channel_count]
+        state_shape.insert(TIME_AXIS, 1)
+        self._zi = np.zeros(state_shape, dtype=self.dtype)
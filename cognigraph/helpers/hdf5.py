@@ -0,0 +1,114 @@
+import time
+import queue
+import threading
+
+import numpy as np
+
+# Aim for HDF5 chunks of about this size. Much smaller chunks make the file
+# slow to write and to read, much larger ones waste memory in the chunk cache.
+TARGET_CHUNK_BYTE_COUNT = 2 ** 18
+
+
+def choose_chunkshape(channel_count: int, dtype: np.dtype,
+                      target_byte_count=TARGET_CHUNK_BYTE_COUNT):
+    """
+    Chunkshape for a CHANNELS x TIME EArray: all channels in every chunk and
+    as many samples as fit into target_byte_count bytes.
+
+    """
+    bytes_per_sample = channel_count * np.dtype(dtype).itemsize
+    sample_count = max(1, target_byte_count // bytes_per_sample)
+    return channel_count, sample_count
+
+
+def make_filters(compression=None, compression_level=5):
+    """
+    :param compression: None for no compression or one of the tables.Filters
+    complib values, e.g. 'blosc:lz4', 'blosc:zstd', 'zlib'
+    :return: tables.Filters instance or None
+
+    """
+    if compression is None:
+        return None
+    import tables
+    return tables.Filters(complevel=compression_level, complib=compression,
+                          shuffle=True)
+
+
+class BackgroundChunkWriter(threading.Thread):
+    """
+    Calls write_function for every chunk put into the queue from a separate
+    thread so that the producer never waits for disk I/O.
+    flush_function is called at most every flush_every_x_seconds seconds
+    and when the writer is stopped.
+
+    Sample usage:
+
+    writer = BackgroundChunkWriter(earray.append, out_file.flush)
+    writer.start()
+    writer.put(chunk)
+    ...
+    writer.stop()
+
+    """
+
+    def __init__(self, write_function, flush_function=None,
+                 max_queued_chunk_count=1000, flush_every_x_seconds=1.0):
+        super().__init__(daemon=True)
+        self._write_function = write_function
+        self._flush_function = flush_function
+        self._queue = queue.Queue(maxsize=max_queued_chunk_count)
+        self.flush_every_x_seconds = flush_every_x_seconds
+
+        # Number of chunks that did not fit into the queue and were lost
+        self.dropped_chunk_count = 0
+        self.error = None  # type: Exception
+
+        self._stop_event = threading.Event()
+
+    def put(self, *chunk) -> bool:
+        """
+        Schedules write_function(*chunk). Never blocks.
+        Returns False if the queue is full and the chunk has been dropped.
+
+        """
+        if self.error is not None:
+            raise RuntimeError('Background writer has failed') from self.error
+        try:
+            self._queue.put_nowait(chunk)
+            return True
+        except queue.Full:
+            self.dropped_chunk_count += 1
+            return False
+
+    @property
+    def queued_chunk_count(self):
+        return self._queue.qsize()
+
+    def run(self):
+        time_of_the_last_flush = time.time()
+        try:
+            while not (self._stop_event.is_set() and self._queue.empty()):
+                try:
+                    chunk = self._queue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+                else:
+                    self._write_function(*chunk)
+
+                current_time = time.time()
+                if (self._flush_function is not None and current_time -
+                        time_of_the_last_flush >= self.flush_every_x_seconds):
+                    self._flush_function()
+                    time_of_the_last_flush = current_time
+
+            if self._flush_function is not None:
+                self._flush_function()
+        except Exception as e:
+            self.error = e
+
+    def stop(self):
+        """Writes whatever is left in the queue and waits for the thread"""
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
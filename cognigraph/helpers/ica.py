@@ -0,0 +1,137 @@
+"""
+Independent component analysis for artifact rejection. Data are CHANNELS x
+TIME arrays and components are rows of the unmixing matrix: sources =
+unmixing.dot(data - data.mean(axis=1)).
+
+"""
+import numpy as np
+
+SUPPORTED_METHODS = ('fastica', 'infomax', 'picard')
+
+
+def _symmetric_decorrelation(W: np.ndarray) -> np.ndarray:
+    """(W W^T)^(-1/2) W: the orthogonal matrix closest to W"""
+    eigenvalues, eigenvectors = np.linalg.eigh(W.dot(W.T))
+    return (eigenvectors / np.sqrt(eigenvalues)).dot(eigenvectors.T).dot(W)
+
+
+def _fastica(whitened, max_iter, tol, random_state, progress):
+    """Symmetric FastICA with the logcosh contrast (Hyvarinen, 1999)"""
+    component_count, sample_count = whitened.shape
+    rng = np.random.RandomState(random_state)
+    W = _symmetric_decorrelation(rng.randn(component_count, component_count))
+    for iteration in range(max_iter):
+        g = np.tanh(W.dot(whitened))
+        g_derivative_means = np.mean(1 - g ** 2, axis=1)
+        new_W = _symmetric_decorrelation(
+            g.dot(whitened.T) / sample_count -
+            g_derivative_means[:, np.newaxis] * W)
+        # Rows of W are unit vectors, so converged rows have |cos| = 1
+        change = np.max(np.abs(np.abs(np.sum(new_W * W, axis=1)) - 1))
+        W = new_W
+        if progress is not None:
+            progress((iteration + 1) / max_iter)
+        if change < tol:
+            break
+    return W
+
+
+def fit_ica(data: np.ndarray, method: str='fastica',
+            n_components: int=None, max_iter: int=200, tol: float=1e-4,
+            random_state=0, progress=None):
+    """
+    Fits ICA to data after whitening it with PCA, keeping n_components
+    components (all the non-degenerate ones by default).
+
+    progress is called with the fraction of max_iter iterations done. Only
+    fastica reports the iterations as they go: the other methods report
+    0 before and 1 after fitting. An exception raised by progress stops the
+    fit, so only a fastica fit can be stopped before it ends. 'infomax' is
+    mne's implementation, 'picard' needs the python-picard package.
+
+    Returns (unmixing, mixing): COMPONENTS x CHANNELS and CHANNELS x
+    COMPONENTS matrices.
+
+    """
+    if method not in SUPPORTED_METHODS:
+        raise ValueError(
+            'Method {} is not supported.'
+            ' Use one of: {}'.format(method, SUPPORTED_METHODS))
+
+    data = data - data.mean(axis=1, keepdims=True)
+    covariance = data.dot(data.T) / data.shape[1]
+    eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+    eigenvalues, eigenvectors = eigenvalues[::-1], eigenvectors[:, ::-1]
+    rank = np.sum(eigenvalues > eigenvalues[0] * 1e-10)
+    if n_components is None or n_components > rank:
+        n_components = rank
+    whitening = (eigenvectors[:, :n_components] /
+                 np.sqrt(eigenvalues[:n_components])).T
+    whitened = whitening.dot(data)
+
+    if method == 'fastica':
+        W = _fastica(whitened, max_iter, tol, random_state, progress)
+    else:
+        if progress is not None:
+            progress(0.0)
+        if method == 'infomax':
+            from mne.preprocessing import infomax
+            W = infomax(whitened.T, max_iter=max_iter,
+                        random_state=random_state, verbose='ERROR')
+        else:
+            from picard import picard
+            _, W, _ = picard(whitened, whiten=False, max_iter=max_iter,
+                             tol=tol, random_state=random_state)
+        if progress is not None:
+            progress(1.0)
+
+    unmixing = W.dot(whitening)
+    return unmixing, np.linalg.pinv(unmixing)
+
+
+def find_artifact_components(sources: np.ndarray,
+                             references: np.ndarray=None,
+                             correlation_threshold: float=0.5,
+                             kurtosis_threshold: float=3.0) -> list:
+    """
+    Indices of the components (rows of sources) that are artifacts: those
+    whose absolute correlation with any of the references (e.g. EOG and ECG
+    channels recorded along with the data) exceeds correlation_threshold,
+    and those whose kurtosis is more than kurtosis_threshold standard
+    deviations above the mean kurtosis of the components, as blinks and
+    other sparse artifacts are.
+
+    """
+    sources = sources - sources.mean(axis=1, keepdims=True)
+    sources = sources / sources.std(axis=1, keepdims=True)
+    artifacts = set()
+
+    if references is not None and len(references) > 0:
+        references = references - references.mean(axis=1, keepdims=True)
+        reference_stds = references.std(axis=1, keepdims=True)
+        references = np.divide(references, reference_stds,
+                               out=np.zeros_like(references),
+                               where=reference_stds > 0)
+        correlations = sources.dot(references.T) / sources.shape[1]
+        artifacts.update(np.nonzero(np.any(
+            np.abs(correlations) > correlation_threshold, axis=1))[0])
+
+    kurtosis = np.mean(sources ** 4, axis=1) - 3
+    if len(kurtosis) > 1 and kurtosis.std() > 0:
+        z_scores = (kurtosis - kurtosis.mean()) / kurtosis.std()
+        artifacts.update(np.nonzero(z_scores > kurtosis_threshold)[0])
+
+    return sorted(int(component) for component in artifacts)
+
+
+def make_rejection_matrix(unmixing: np.ndarray, mixing: np.ndarray,
+                          components) -> np.ndarray:
+    """
+    CHANNELS x CHANNELS matrix that removes components from the data:
+    data - mixing[:, components].dot(unmixing[components].dot(data)).
+
+    """
+    components = list(components)
+    channel_count = mixing.shape[0]
+    return (np.eye(channel_count) -
+            mixing[:, components].dot(unmixing[components]))
@@ -1,23 +1,51 @@
 import os
+import hashlib
+from copy import deepcopy
+from collections import OrderedDict
 
 import numpy as np
 import mne
-from mne.datasets import sample
-from mne.minimum_norm import read_inverse_operator
+from mne.io.constants import FIFF
 
 from .. import MISC_CHANNEL_TYPE
 from ..helpers.misc import all_upper
 
-data_path = sample.data_path(verbose='ERROR')
-sample_dir = os.path.join(data_path, 'MEG', 'sample')
-neuromag_forward_file_path = os.path.join(
-    sample_dir, 'sample_audvis-meg-oct-6-fwd.fif')
-standard_1005_forward_file_path = os.path.join(
-    sample_dir, 'sample_1005-eeg-oct-6-fwd.fif')
+# Forward models from mne's sample dataset. Looking the dataset up might mean
+# downloading it, so the paths are only resolved on first access.
+_SAMPLE_FORWARD_FILE_NAMES = {
+    'neuromag_forward_file_path': 'sample_audvis-meg-oct-6-fwd.fif',
+    'standard_1005_forward_file_path': 'sample_1005-eeg-oct-6-fwd.fif',
+}
 
 
-def _pick_columns_from_matrix(matrix: np.ndarray, output_column_labels: list,
-                              input_column_labels: list) -> np.ndarray:
+def _get_sample_forward_file_path(name):
+    from mne.datasets import sample
+    sample_dir = os.path.join(sample.data_path(verbose='ERROR'),
+                              'MEG', 'sample')
+    return os.path.join(sample_dir, _SAMPLE_FORWARD_FILE_NAMES[name])
+
+
+def __getattr__(name):
+    # Module __getattr__ (PEP 562) needs Python 3.7; setup.py requires 3.8
+    if name in _SAMPLE_FORWARD_FILE_NAMES:
+        return _get_sample_forward_file_path(name)
+    raise AttributeError(
+        'module {!r} has no attribute {!r}'.format(__name__, name))
+
+# Forward solutions already read by this process. Keys are returned by
+# _forward_cache_key, values are (forward, missing_ch_names) tuples.
+FORWARD_CACHE_SIZE = 4
+_forward_cache = OrderedDict()
+
+# If set, inverse model matrices are saved here as .npy files. Every
+# combination of channels, bads, snr and method adds a file of a few MB and
+# none are ever deleted, so the cache is off unless COGNIGRAPH_CACHE_DIR is
+# set.
+INVERSE_MATRIX_CACHE_DIR = os.environ.get('COGNIGRAPH_CACHE_DIR')
+
+
+def pick_columns_from_matrix(matrix: np.ndarray, output_column_labels: list,
+                             input_column_labels: list) -> np.ndarray:
     """
     From matrix take only the columns that correspond to
     output_column_labels - in the order of the latter.
@@ -43,31 +71,80 @@ def _pick_columns_from_matrix(matrix: np.ndarray, output_column_labels: list,
     return output_matrix
 
 
-def matrix_from_inverse_operator(
-        inverse_operator, mne_info, snr, method) -> np.ndarray:
-    # Create a dummy mne.Raw object
-    picks = mne.pick_types(mne_info, eeg=True, meg=False, exclude='bads')
-    info_goods = mne.pick_info(mne_info, sel=picks)
-    channel_count = info_goods['nchan']
-    dummy_eye = np.identity(channel_count)
+class InverseOperatorDecomposition(object):
+    """
+    Fixed-orientation linear inverse operator in terms of the SVD of the
+    whitened and weighted gain matrix stored in an mne inverse operator:
 
-    dummy_raw = mne.io.RawArray(
-        data=dummy_eye, info=info_goods, verbose='ERROR')
+        K = N * R^(1/2) * V * diag(reginv) * U^T * C^(-1/2) * P
 
-    contains_eeg_channels = len(
-        mne.pick_types(mne_info, meg=False, eeg=True)) > 0
+    P - projector, C^(-1/2) - whitener, U, sing, V - eigen fields, singular
+    values and eigen leads, R - source covariance and N - noise normalization
+    (identity for MNE).
+    reginv = sing / (sing ** 2 + lambda2) is the only part that depends on
+    snr, so the SVD is reused and a new matrix costs one product.
 
+    """
+    SUPPORTED_METHODS = ('MNE', 'dSPM', 'sLORETA')
+
+    def __init__(self, inverse_operator):
+        if inverse_operator['source_ori'] != FIFF.FIFFV_MNE_FIXED_ORI:
+            raise ValueError('Only fixed orientation inverse operators '
+                             'are supported')
+
+        from mne.minimum_norm import prepare_inverse_operator
+        # Whitener and projector do not depend on lambda2 and method
+        inv = prepare_inverse_operator(
+            inverse_operator, nave=1, lambda2=1.0, method='MNE',
+            verbose='ERROR')
+
+        self._sing = inv['sing']
+        # U^T * C^(-1/2) * P: COMPONENTS x CHANNELS
+        self._fields = inv['eigen_fields']['data'].dot(
+            inv['whitener']).dot(inv['proj'])
+        # R^(1/2) * V: SOURCES x COMPONENTS
+        if inv['eigen_leads_weighted']:
+            self._leads = inv['eigen_leads']['data']
+        else:
+            self._leads = (np.sqrt(inv['source_cov']['data'])[:, np.newaxis] *
+                           inv['eigen_leads']['data'])
+
+    def matrix(self, snr, method) -> np.ndarray:
+        """Returns SOURCES x CHANNELS inverse model matrix"""
+        if method not in self.SUPPORTED_METHODS:
+            raise ValueError('Method {} is not supported.'.format(method))
+
+        lambda2 = 1.0 / snr ** 2
+        sing = self._sing
+        reginv = np.zeros_like(sing)
+        nonzero = sing > 0
+        reginv[nonzero] = sing[nonzero] / (sing[nonzero] ** 2 + lambda2)
+
+        weighted_leads = self._leads * reginv
+        K = weighted_leads.dot(self._fields)
+
+        # Noise normalization as in mne.minimum_norm.prepare_inverse_operator
+        if method == 'dSPM':
+            noise_norm = np.linalg.norm(weighted_leads, axis=1)
+        elif method == 'sLORETA':
+            noise_norm = np.linalg.norm(
+                self._leads * (reginv * np.sqrt(1 + sing ** 2 / lambda2)),
+                axis=1)
+        if method != 'MNE':
+            K /= noise_norm[:, np.newaxis]
+
+        return K
 
-    if contains_eeg_channels:
-        dummy_raw.set_eeg_reference(ref_channels='average',
-                                    verbose='ERROR', projection=True)
 
-    # Applying inverse operator to identity matrix gives inverse model matrix
-    lambda2 = 1.0 / snr ** 2
-    stc = mne.minimum_norm.apply_inverse_raw(dummy_raw, inverse_operator,
-                                             lambda2, method, verbose='ERROR')
+def matrix_from_inverse_operator(
+        inverse_operator, snr, method) -> np.ndarray:
+    """
+    Returns the matrix that apply_inverse_raw would effectively apply to
+    the data. To get matrices for several values of snr, use
+    InverseOperatorDecomposition directly.
 
-    return stc.data
+    """
+    return InverseOperatorDecomposition(inverse_operator).matrix(snr, method)
 
 
 def get_default_forward_file(mne_info: mne.Info):
@@ -82,14 +159,15 @@ def get_default_forward_file(mne_info: mne.Info):
     channel_labels_upper = all_upper(mne_info['ch_names'])
 
     if max(label.startswith('MEG ') for label in channel_labels_upper) is True:
-        return neuromag_forward_file_path
+        return _get_sample_forward_file_path('neuromag_forward_file_path')
 
     else:
         montage_1005 = mne.channels.read_montage(kind='standard_1005')
         montage_labels_upper = all_upper(montage_1005.ch_names)
         if any([label_upper in montage_labels_upper
                 for label_upper in channel_labels_upper]):
-            return standard_1005_forward_file_path
+            return _get_sample_forward_file_path(
+                'standard_1005_forward_file_path')
 
 
 def get_clean_forward(forward_model_path: str, mne_info: mne.Info):
@@ -112,26 +190,101 @@ def get_clean_forward(forward_model_path: str, mne_info: mne.Info):
 
     """
 
-    # Get the gain matrix from the forward solution
-    forward = mne.read_forward_solution(forward_model_path, verbose='ERROR')
-
     # Take only the channels present in mne_info
     ch_names = mne_info['ch_names']
     goods = mne.pick_types(mne_info, eeg=True, stim=False, eog=False,
                            ecg=False, exclude='bads')
     ch_names_data = [ch_names[i] for i in goods]
-    ch_names_fwd = forward['info']['ch_names']
-    # Take only channels from both mne_info and the forward solution
-    ch_names_intersect = [n for n in ch_names_fwd if
-                          n.upper() in all_upper(ch_names_data)]
-    missing_ch_names = [n for n in ch_names_data if
-                        n.upper() not in all_upper(ch_names_fwd)]
 
-    fwd = mne.pick_channels_forward(forward, include=ch_names_intersect)
-    return fwd, missing_ch_names
+    # Reading the file takes seconds, so forward solutions are cached
+    # for the lifetime of the process. Copies are returned because mne
+    # functions are free to modify the forward solution they are given.
+    cache_key = (_forward_file_key(forward_model_path), tuple(ch_names_data))
+    try:
+        fwd, missing_ch_names = _forward_cache[cache_key]
+        _forward_cache.move_to_end(cache_key)
+    except KeyError:
+        # Get the gain matrix from the forward solution
+        forward = mne.read_forward_solution(forward_model_path,
+                                            verbose='ERROR')
+        ch_names_fwd = forward['info']['ch_names']
+        # Take only channels from both mne_info and the forward solution
+        ch_names_intersect = [n for n in ch_names_fwd if
+                              n.upper() in all_upper(ch_names_data)]
+        missing_ch_names = [n for n in ch_names_data if
+                            n.upper() not in all_upper(ch_names_fwd)]
+
+        fwd = mne.pick_channels_forward(forward, include=ch_names_intersect)
+        _forward_cache[cache_key] = fwd, missing_ch_names
+        if len(_forward_cache) > FORWARD_CACHE_SIZE:
+            _forward_cache.popitem(last=False)
+
+    return deepcopy(fwd), list(missing_ch_names)
+
+
+def _forward_file_key(forward_model_path: str):
+    """Identifies a forward model file together with its current version"""
+    real_path = os.path.realpath(forward_model_path)
+    stat = os.stat(real_path)
+    return real_path, stat.st_mtime_ns, stat.st_size
+
+
+def get_inverse_model_matrix_and_decomposition(
+        forward_model_path: str, fwd, mne_info, snr, method):
+    """
+    Returns the inverse model matrix and the InverseOperatorDecomposition it
+    has been computed from, so that matrices for other values of snr and
+    method are cheap (see make_inverse_operator_decomposition).
+
+    The matrix is saved to INVERSE_MATRIX_CACHE_DIR and loaded from there
+    when the same forward model file, channels, bads, snr and method are
+    used again. The decomposition is not computed then and is None.
+
+    """
+    if INVERSE_MATRIX_CACHE_DIR is None:
+        return _compute_inverse_model_matrix(fwd, mne_info, snr, method)
+
+    picks = mne.pick_types(mne_info, eeg=True, meg=False, exclude='bads')
+    key = repr((_forward_file_key(forward_model_path),
+                [mne_info['ch_names'][i] for i in picks],
+                sorted(mne_info['bads']), float(snr), method))
+    cache_file_path = os.path.join(
+        INVERSE_MATRIX_CACHE_DIR,
+        'inverse-' + hashlib.sha1(key.encode()).hexdigest() + '.npy')
+
+    try:
+        return np.load(cache_file_path), None
+    except (FileNotFoundError, ValueError):
+        pass
+
+    inverse_model_matrix, decomposition = _compute_inverse_model_matrix(
+        fwd, mne_info, snr, method)
+    try:
+        os.makedirs(INVERSE_MATRIX_CACHE_DIR, exist_ok=True)
+        # Write under a temporary name so that nobody reads a partial file
+        temporary_file_path = cache_file_path + '.{}.tmp'.format(os.getpid())
+        with open(temporary_file_path, 'wb') as f:
+            np.save(f, inverse_model_matrix)
+        os.replace(temporary_file_path, cache_file_path)
+    except OSError:
+        pass  # Not being able to cache is not a reason to stop
+    return inverse_model_matrix, decomposition
+
+
+def _compute_inverse_model_matrix(fwd, mne_info, snr, method):
+    decomposition = make_inverse_operator_decomposition(fwd, mne_info)
+    return decomposition.matrix(snr=snr, method=method), decomposition
+
+
+def make_inverse_operator_decomposition(
+        fwd, mne_info) -> InverseOperatorDecomposition:
+    """make_inverse_operator followed by the SVD, which takes seconds"""
+    return InverseOperatorDecomposition(make_inverse_operator(fwd, mne_info))
 
 
 def make_inverse_operator(fwd, mne_info, sigma2=1):
+    # mne.minimum_norm imports scipy.optimize, which takes seconds
+    from mne import minimum_norm
     # sigma2 is what will be used to scale the identity covariance matrix.
     # This will not affect MNE solution though.
     # The inverse operator will use channels common to
@@ -145,7 +298,7 @@ def make_inverse_operator(fwd, mne_info, sigma2=1):
     cov_data = np.identity(N_SEN)
     cov = mne.Covariance(cov_data, ch_names, mne_info['bads'],
                          mne_info['projs'], nfree=1)
-    inv = mne.minimum_norm.make_inverse_operator(info_goods, fwd, cov,
-                                                 depth=None, loose=0,
-                                                 fixed=True, verbose='ERROR')
+    inv = minimum_norm.make_inverse_operator(info_goods, fwd, cov,
+                                             depth=None, loose=0,
+                                             fixed=True, verbose='ERROR')
     return inv
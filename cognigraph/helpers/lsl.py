@@ -1,3 +1,4 @@
+import time
 import uuid
 
 import pylsl as lsl
@@ -10,6 +11,15 @@ string2fmt['float64'] = string2fmt['double64']
 LSL_TIME_DIMENSION_ID = 0
 
 
+def get_lsl_clock_offset() -> float:
+    """
+    Returns x such that lsl.local_clock() + x is time.time(). LSL timestamps
+    are in lsl.local_clock() time, while cognigraph nodes use time.time().
+
+    """
+    return time.time() - lsl.local_clock()
+
+
 def convert_lsl_format_to_numpy(lsl_channel_format: int):
     return fmt2string[lsl_channel_format]
 
@@ -64,6 +74,26 @@ def convert_numpy_array_to_lsl_chunk(ndarray):
 convert_numpy_array_to_lsl_chunk.__doc__ = convert_lsl_chunk_to_numpy_array.__doc__
 
 
+def allocate_lsl_chunk_buffer(sample_count, channel_count, dtype):
+    """
+    Allocates a C-contiguous time-major array that StreamOutlet.push_chunk can read directly, without converting
+    every value to a python float.
+    """
+    return np.empty((sample_count, channel_count), dtype=dtype, order='C')
+
+
+def write_numpy_array_to_lsl_chunk(ndarray, lsl_chunk_buffer):
+    """
+    Copies ndarray into the first samples of lsl_chunk_buffer (see allocate_lsl_chunk_buffer), transposing and
+    casting on the fly if need be. Returns the view of lsl_chunk_buffer holding the samples which is still
+    C-contiguous and thus can be passed to push_chunk as is.
+    """
+    sample_count = ndarray.shape[TIME_AXIS]
+    lsl_chunk = lsl_chunk_buffer[:sample_count]
+    np.copyto(lsl_chunk, _transpose_if_need_be(ndarray), casting='same_kind')
+    return lsl_chunk
+
+
 def read_channel_labels_from_info(info: lsl.StreamInfo):
     channels_tag = info.desc().child('channels')
     if channels_tag.empty():
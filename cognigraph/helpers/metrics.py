@@ -0,0 +1,202 @@
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+# Latencies are recorded in whole microseconds into log-linear buckets: values
+# below SUB_BUCKET_COUNT get a bucket each, above that every power of two is
+# split into SUB_BUCKET_COUNT / 2 buckets. The relative error is then at most
+# 2 / SUB_BUCKET_COUNT, like in HdrHistogram with one significant digit.
+SUB_BUCKET_BITS = 5
+SUB_BUCKET_COUNT = 2 ** SUB_BUCKET_BITS
+_SUB_BUCKET_HALF_COUNT = SUB_BUCKET_COUNT // 2
+
+# Quantiles in snapshots and in the Prometheus output
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+def _bucket_index(value: int) -> int:
+    if value < SUB_BUCKET_COUNT:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS
+    return shift * _SUB_BUCKET_HALF_COUNT + (value >> shift)
+
+
+def _bucket_bounds(index: int):
+    """Smallest and largest values that fall into the bucket"""
+    if index < SUB_BUCKET_COUNT:
+        return index, index
+    shift = index // _SUB_BUCKET_HALF_COUNT - 1
+    lowest = (index - shift * _SUB_BUCKET_HALF_COUNT) << shift
+    return lowest, lowest + (1 << shift) - 1
+
+
+class LatencyHistogram(object):
+    """
+    Histogram of durations in seconds with constant relative precision.
+    Recording is a couple of integer operations and a list increment, so it
+    can be done on every update.
+
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._counts = [0] * (2 * SUB_BUCKET_COUNT)
+        self.count = 0
+        self.total = 0.0  # seconds
+        self.max = 0.0  # seconds
+
+    def record(self, seconds: float):
+        index = _bucket_index(max(0, int(seconds * 1e6)))
+        try:
+            self._counts[index] += 1
+        except IndexError:
+            self._counts.extend([0] * (index + 1 - len(self._counts)))
+            self._counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q: float) -> float:
+        """Value in seconds below which q (from 0 to 1) of the values are"""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        cumulative_count = 0
+        for index, count in enumerate(self._counts):
+            cumulative_count += count
+            if count > 0 and cumulative_count >= rank:
+                lowest, highest = _bucket_bounds(index)
+                return min((lowest + highest) / 2 / 1e6, self.max)
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def snapshot(self) -> dict:
+        snapshot = {'count': self.count, 'sum': self.total,
+                    'mean': self.mean, 'max': self.max}
+        for q in QUANTILES:
+            snapshot['p{:g}'.format(q * 100)] = self.percentile(q)
+        return snapshot
+
+
+class NodeMetrics(object):
+    """
+    Counters and latency histograms of one node. Node.update, initialize and
+    reset fill them in when the node has a NodeMetrics object in its metrics
+    attribute. Nodes that queue data can report the queue length in
+    queue_depth and the chunks they have had to drop in dropped_chunk_count.
+
+    'latency' is the time from the acquisition of the last sample of a chunk
+    till the node has finished with that chunk (see Node.acquisition_time).
+    The difference between the latencies of two nodes is the time spent
+    between them.
+
+    """
+    HISTOGRAM_NAMES = ('update', 'initialize', 'reset', 'latency')
+
+    def __init__(self):
+        self.histograms = {name: LatencyHistogram()
+                           for name in self.HISTOGRAM_NAMES}
+        self.update_count = 0
+        self.samples_in = 0
+        self.samples_out = 0
+        self.queue_depth = 0
+        self.dropped_chunk_count = 0
+
+    def snapshot(self) -> dict:
+        snapshot = {name + '_seconds': histogram.snapshot()
+                    for name, histogram in self.histograms.items()}
+        snapshot.update(update_count=self.update_count,
+                        samples_in=self.samples_in,
+                        samples_out=self.samples_out,
+                        queue_depth=self.queue_depth,
+                        dropped_chunk_count=self.dropped_chunk_count)
+        return snapshot
+
+
+def to_prometheus_text(metrics: dict, prefix='cognigraph_node') -> str:
+    """
+    Formats the output of Pipeline.metrics() in the Prometheus text
+    exposition format. Histograms become summaries with QUANTILES.
+
+    """
+    lines = list()
+    node_names = list(metrics.keys())
+    if not node_names:
+        return ''
+
+    first = metrics[node_names[0]]
+    for key in first:
+        if isinstance(first[key], dict):
+            name = '{}_{}'.format(prefix, key)
+            lines.append('# TYPE {} summary'.format(name))
+            for node_name in node_names:
+                histogram = metrics[node_name][key]
+                for q in QUANTILES:
+                    lines.append('{}{{node="{}",quantile="{:g}"}} {!r}'.format(
+                        name, node_name, q,
+                        histogram['p{:g}'.format(q * 100)]))
+                lines.append('{}_sum{{node="{}"}} {!r}'.format(
+                    name, node_name, histogram['sum']))
+                lines.append('{}_count{{node="{}"}} {}'.format(
+                    name, node_name, histogram['count']))
+        else:
+            metric_type = 'gauge' if key == 'queue_depth' else 'counter'
+            name = '{}_{}'.format(prefix, key)
+            if metric_type == 'counter':
+                name += '_total'
+            lines.append('# TYPE {} {}'.format(name, metric_type))
+            for node_name in node_names:
+                lines.append('{}{{node="{}"}} {}'.format(
+                    name, node_name, metrics[node_name][key]))
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsServer(threading.Thread):
+    """
+    Serves to_prometheus_text(get_metrics()) at http://host:port/metrics
+    from a daemon thread.
+
+    Sample usage:
+
+    pipeline.enable_metrics()
+    server = MetricsServer(pipeline.metrics, port=9100)
+    server.start()
+    ...
+    server.stop()
+
+    """
+    def __init__(self, get_metrics, port, host='127.0.0.1'):
+        super().__init__(daemon=True)
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip('/') != '/metrics':
+                    self.send_error(404)
+                    return
+                body = to_prometheus_text(get_metrics()).encode()
+                self.send_response(200)
+                self.send_header('Content-Type',
+                                 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Do not print a line for every scrape
+
+        self._server = HTTPServer((host, port), Handler)
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def run(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -1,5 +1,15 @@
+import os
+import sys
+import mmap
+import ctypes
+import ctypes.util
+import weakref
+from math import gcd
+
 import numpy as np
 
+from .. import DTYPE
+
 
 class RingBufferSlow(object):
     """Represents a multi-row deque object"""
@@ -60,28 +70,77 @@ class RingBufferSlow(object):
         return np.concatenate((self._data[:, self._start:], self._data[:, :self._start]), axis=1)
 
 
-class RingBuffer(object):
+class _RingBufferViews(object):
+    """
+    Windowed reads shared by RingBuffer and RingBufferMirrored. Both keep the samples in a single memory block, so
+    all of these are views.
+    Subclasses provide data (time is the last axis), _current_sample_count and _next_sample_index.
+    """
+
+    @property
+    def next_sample_index(self):
+        """Number of samples put into the buffer since it was created or cleared"""
+        return self._next_sample_index
+
+    @property
+    def first_sample_index(self):
+        """Index (counting from creation or the last clear) of the oldest sample still in the buffer"""
+        return self._next_sample_index - self._current_sample_count
+
+    def last(self, sample_cnt):
+        """View of the last sample_cnt samples or of all of them if there are fewer"""
+        sample_cnt = min(sample_cnt, self._current_sample_count)
+        data = self.data
+        return data[..., (data.shape[-1] - sample_cnt):]
+
+    def windows(self, window_length, hop, first_window_start=None):
+        """
+        Read-only view of the windows of window_length samples that start hop samples apart, e.g. for overlapping
+        FFT frames. Only the windows that are entirely in the buffer are returned.
+        :param first_window_start: index (see first_sample_index) of the first sample of the first window. Defaults
+        to first_sample_index. Use the returned next_window_start to continue from where the last call stopped.
+        :return: (windows, next_window_start) where windows has the shape frame_shape + (window_count, window_length)
+        """
+        if first_window_start is None:
+            first_window_start = self.first_sample_index
+        if first_window_start < self.first_sample_index:
+            raise ValueError('Sample {} has already been overwritten'.format(first_window_start))
+
+        data = self.last(self.next_sample_index - first_window_start)
+        window_cnt = max(0, (data.shape[-1] - window_length) // hop + 1)
+        time_stride = data.strides[-1]
+        windows = np.lib.stride_tricks.as_strided(
+            data, shape=data.shape[:-1] + (window_cnt, window_length),
+            strides=data.strides[:-1] + (hop * time_stride, time_stride), writeable=False)
+        return windows, first_window_start + window_cnt * hop
+
+
+class RingBuffer(_RingBufferViews):
     """Represents a multi-row deque object.
     Very memory-inefficient (all data is saved twice). This allows us to return views and not copies of the data.
+    A sample does not have to be a column: pass a tuple as row_cnt to store N-d frames. Time is always the last axis.
     """
 
     TIME_AXIS = 1
 
-    def __init__(self, row_cnt, maxlen):
+    def __init__(self, row_cnt, maxlen, dtype=DTYPE):
         self.maxlen = maxlen
-        self.row_cnt = row_cnt
-        self._data = np.zeros((row_cnt, maxlen * 2))
+        self.frame_shape = tuple(np.atleast_1d(row_cnt))
+        self.row_cnt = self.frame_shape[0]
+        self._data = np.zeros(self.frame_shape + (maxlen * 2, ), dtype=dtype)
         self._start = 0
         self._current_sample_count = 0
+        self._next_sample_index = 0
 
     def extend(self, array):
         self._check_input_shape(array)
-        new_sample_cnt = array.shape[self.TIME_AXIS]
+        new_sample_cnt = array.shape[-1]
+        self._next_sample_index += new_sample_cnt
 
         # If new data will take all the space, we can forget about the old data
         if new_sample_cnt >= self.maxlen:
-            self._data[:, :self.maxlen] = array[:, -self.maxlen:]
-            self._data[:, self.maxlen:] = array[:, -self.maxlen:]
+            self._data[..., :self.maxlen] = array[..., -self.maxlen:]
+            self._data[..., self.maxlen:] = array[..., -self.maxlen:]
             self._start = 0
             self._current_sample_count = self.maxlen
 
@@ -91,30 +150,162 @@ class RingBuffer(object):
 
             # Put as much as possible after new_data_start.
             new_data_end = min(new_data_start + new_sample_cnt, self.maxlen)
-            self._data[:, new_data_start:new_data_end] = array[:, :(new_data_end-new_data_start)]
-            self._data[:, (new_data_start + self.maxlen):(new_data_end + self.maxlen)] \
-                = array[:, :(new_data_end-new_data_start)]
+            self._data[..., new_data_start:new_data_end] = array[..., :(new_data_end-new_data_start)]
+            self._data[..., (new_data_start + self.maxlen):(new_data_end + self.maxlen)] \
+                = array[..., :(new_data_end-new_data_start)]
 
             # Then wrap around if needed
             if new_data_end - new_data_start < new_sample_cnt:
                 new_data_end = (new_data_start + new_sample_cnt) % self.maxlen
-                self._data[:, :new_data_end] = array[:, -new_data_end:]
-                self._data[:, self.maxlen:(new_data_end + self.maxlen)] = array[:, -new_data_end:]
+                self._data[..., :new_data_end] = array[..., -new_data_end:]
+                self._data[..., self.maxlen:(new_data_end + self.maxlen)] = array[..., -new_data_end:]
 
             self._current_sample_count = min(self._current_sample_count + new_sample_cnt, self.maxlen)
             if self._current_sample_count == self.maxlen:  # The buffer is fully populated
                 self._start = new_data_end % self.maxlen
 
     def _check_input_shape(self, array):
-        if array.shape[0] != self.row_cnt:
-            msg = 'Wrong shape. You are trying to extend a buffer with {} rows with an array with {} rows'.format(
-                self.row_cnt, array.shape[0])
-            raise ValueError(msg)
+        _check_frame_shape(self.frame_shape, array)
 
     def clear(self):
         self._current_sample_count = 0
         self._start = 0
+        self._next_sample_index = 0
+
+    @property
+    def data(self):
+        return self._data[..., self._start:(self._start + self._current_sample_count)]
+
+
+def _check_frame_shape(frame_shape, array):
+    if array.shape[:-1] != frame_shape:
+        if len(frame_shape) == 1:
+            msg = 'Wrong shape. You are trying to extend a buffer with {} rows with an array with {} rows'.format(
+                frame_shape[0], array.shape[0])
+        else:
+            msg = ('Wrong shape. You are trying to extend a buffer with frames of shape {} '
+                   'with an array with frames of shape {}'.format(frame_shape, array.shape[:-1]))
+        raise ValueError(msg)
+
+# Linux value, not exported by the mmap module
+_MAP_FIXED = 0x10
+_PROT_NONE = 0
+
+
+def _load_libc_mmap():
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    libc.mmap.restype = ctypes.c_void_p
+    libc.mmap.argtypes = (ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int,
+                          ctypes.c_int, ctypes.c_int, ctypes.c_long)
+    libc.munmap.restype = ctypes.c_int
+    libc.munmap.argtypes = (ctypes.c_void_p, ctypes.c_size_t)
+    return libc
+
+
+def _allocate_mirrored_memory(byte_cnt):
+    """
+    Maps the same byte_cnt bytes (a multiple of mmap.PAGESIZE) twice into two
+    adjacent address ranges so that writing to byte i also writes to byte
+    i + byte_cnt and vice versa. Returns a ctypes array of 2 * byte_cnt bytes.
+    The memory is unmapped when the array is garbage-collected.
+    Works on Linux only, raises OSError otherwise.
+
+    """
+    if not sys.platform.startswith('linux') or not hasattr(os, 'memfd_create'):
+        raise OSError('Mirrored memory requires memfd_create (Linux)')
+
+    libc = _load_libc_mmap()
+    map_failed = ctypes.c_void_p(-1).value
+
+    fd = os.memfd_create('cognigraph-ring-buffer')
+    try:
+        os.ftruncate(fd, byte_cnt)
+
+        # Reserve 2 * byte_cnt of address space and then map the file into
+        # both halves of it
+        address = libc.mmap(None, 2 * byte_cnt, _PROT_NONE,
+                            mmap.MAP_PRIVATE | mmap.MAP_ANONYMOUS, -1, 0)
+        if address in (None, map_failed):
+            raise OSError(ctypes.get_errno(), 'Could not reserve memory')
+
+        for half_address in (address, address + byte_cnt):
+            result = libc.mmap(half_address, byte_cnt,
+                               mmap.PROT_READ | mmap.PROT_WRITE,
+                               mmap.MAP_SHARED | _MAP_FIXED, fd, 0)
+            if result != half_address:
+                libc.munmap(address, 2 * byte_cnt)
+                raise OSError(ctypes.get_errno(), 'Could not map memory')
+    finally:
+        # The mappings keep the memory alive
+        os.close(fd)
+
+    memory = (ctypes.c_byte * (2 * byte_cnt)).from_address(address)
+    weakref.finalize(memory, libc.munmap, address, 2 * byte_cnt)
+    return memory
+
+
+class RingBufferMirrored(_RingBufferViews):
+    """Represents a multi-row deque object.
+    The underlying memory is mapped twice in a row (see _allocate_mirrored_memory), so every sample is written once
+    and data is still a view. Samples are stored time-major, so data is a transposed view of a contiguous block.
+    Supports N-d frames the same way RingBuffer does.
+    Linux only. Use create_ring_buffer to fall back to RingBuffer elsewhere.
+    """
+
+    TIME_AXIS = 1
+
+    def __init__(self, row_cnt, maxlen, dtype=DTYPE):
+        self.maxlen = maxlen
+        self.frame_shape = tuple(np.atleast_1d(row_cnt))
+        self.row_cnt = self.frame_shape[0]
+
+        # Mapped memory has to be a whole number of pages, so the actual capacity might be a bit larger than maxlen
+        dtype = np.dtype(dtype)
+        sample_byte_cnt = int(np.prod(self.frame_shape)) * dtype.itemsize
+        samples_per_page_multiple = mmap.PAGESIZE // gcd(mmap.PAGESIZE, sample_byte_cnt)
+        self._capacity = -(-maxlen // samples_per_page_multiple) * samples_per_page_multiple
+
+        memory = _allocate_mirrored_memory(self._capacity * sample_byte_cnt)
+        # Samples [capacity, 2 * capacity) are the same memory as samples [0, capacity)
+        self._data = np.frombuffer(memory, dtype=dtype).reshape((2 * self._capacity, ) + self.frame_shape)
+        self._end = 0
+        self._current_sample_count = 0
+        self._next_sample_index = 0
+
+    def extend(self, array):
+        self._check_input_shape(array)
+        new_sample_cnt = array.shape[-1]
+        self._next_sample_index += new_sample_cnt
+
+        # If new data will take all the space, we can forget about the old data
+        if new_sample_cnt > self.maxlen:
+            array = array[..., -self.maxlen:]
+            new_sample_cnt = self.maxlen
+
+        # Thanks to the mirror there is no need to wrap around
+        self._data[self._end:(self._end + new_sample_cnt)] = np.moveaxis(array, -1, 0)
+        self._end = (self._end + new_sample_cnt) % self._capacity
+        self._current_sample_count = min(self._current_sample_count + new_sample_cnt, self.maxlen)
+
+    def _check_input_shape(self, array):
+        _check_frame_shape(self.frame_shape, array)
+
+    def clear(self):
+        self._current_sample_count = 0
+        self._end = 0
+        self._next_sample_index = 0
 
     @property
     def data(self):
-        return self._data[:, self._start:(self._start + self._current_sample_count)]
+        start = self._end - self._current_sample_count
+        if start < 0:
+            start += self._capacity
+        return np.moveaxis(self._data[start:(start + self._current_sample_count)], 0, -1)
+
+
+def create_ring_buffer(row_cnt, maxlen, dtype=DTYPE):
+    """Returns RingBufferMirrored if the platform supports it and RingBuffer otherwise"""
+    try:
+        return RingBufferMirrored(row_cnt=row_cnt, maxlen=maxlen, dtype=dtype)
+    except OSError:
+        return RingBuffer(row_cnt=row_cnt, maxlen=maxlen, dtype=dtype)
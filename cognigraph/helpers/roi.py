@@ -0,0 +1,176 @@
+"""
+Reduction of source-space data (one row per source, in the order of the
+forward solution) to regions of interest (ROIs): the labels of a FreeSurfer
+parcellation such as 'aparc' (Desikan-Killiany, 68 labels) or 'aparc.a2009s'
+(Destrieux, 148 labels).
+
+"""
+import os
+
+import numpy as np
+import mne
+from scipy import sparse
+
+from .. import DTYPE
+
+SUPPORTED_METHODS = ('mean', 'mean_flip', 'pca_flip', 'max')
+
+
+def get_subjects_dir(subjects_dir: str=None) -> str:
+    """
+    subjects_dir if given, otherwise mne's SUBJECTS_DIR and finally the
+    subjects directory of the sample dataset that the default forward
+    models come from.
+
+    """
+    if subjects_dir is None:
+        subjects_dir = mne.get_config('SUBJECTS_DIR')
+    if subjects_dir is None:
+        from mne.datasets import sample
+        subjects_dir = os.path.join(sample.data_path(verbose='ERROR'),
+                                    'subjects')
+    return subjects_dir
+
+
+def read_parcellation(src, parcellation='aparc',
+                      subjects_dir: str=None) -> list:
+    """
+    Labels of the FreeSurfer annotation parcellation of the subject of the
+    source space src, without the 'unknown' ones. parcellation can also be
+    a list of mne.Label objects which is then returned as is.
+
+    """
+    if not isinstance(parcellation, str):
+        return list(parcellation)
+    subject = src[0]['subject_his_id']
+    labels = mne.read_labels_from_annot(
+        subject, parc=parcellation,
+        subjects_dir=get_subjects_dir(subjects_dir), verbose='ERROR')
+    return [label for label in labels
+            if not label.name.lower().startswith('unknown')]
+
+
+class ROIReducer(object):
+    """
+    Reduces SOURCES x TIME arrays to ROIS x TIME arrays, one row per label
+    that has at least one source in the two-hemisphere source space src.
+
+    'mean' averages the sources of a label, 'mean_flip' first flips the
+    signs of the sources oriented against the dominant direction of the
+    label, 'max' takes the maximum of the absolute values. 'pca_flip' is the
+    first principal component of the sources, its sign chosen to agree with
+    the flips and scaled to their RMS, as in mne.extract_label_time_course;
+    here the components are those of the rows of inverse_model_matrix
+    (SOURCES x CHANNELS) that produce the sources, so the weights are fixed
+    and need no data. They have to be recomputed (see
+    set_inverse_model_matrix) whenever that matrix changes.
+
+    The linear methods are applied as a product with the sparse ROIS x
+    SOURCES matrix. It can also be multiplied into the inverse model matrix
+    beforehand (see fuse) to compute the ROI time courses directly.
+
+    """
+    def __init__(self, labels: list, src, method: str='mean',
+                 inverse_model_matrix: np.ndarray=None):
+        if method not in SUPPORTED_METHODS:
+            raise ValueError(
+                'Method {} is not supported.'.format(method) +
+                ' Use one of: {}'.format(SUPPORTED_METHODS))
+        if method == 'pca_flip' and inverse_model_matrix is None:
+            raise ValueError('pca_flip needs the inverse model matrix')
+        self.method = method
+
+        # Sources of the right hemisphere follow those of the left one
+        offsets = {'lh': 0, 'rh': len(src[0]['vertno'])}
+        vertnos = {'lh': src[0]['vertno'], 'rh': src[1]['vertno']}
+        self.source_count = offsets['rh'] + len(src[1]['vertno'])
+
+        self.roi_names = list()
+        self._source_indices = list()  # one array per ROI
+        self._flips = list()
+        for label in labels:
+            indices = np.nonzero(np.isin(vertnos[label.hemi],
+                                         label.vertices))[0]
+            if len(indices) == 0:
+                continue
+            self.roi_names.append(label.name)
+            self._source_indices.append(indices + offsets[label.hemi])
+            if method in ('mean_flip', 'pca_flip'):
+                # Sorted by vertex number like the indices
+                self._flips.append(mne.label_sign_flip(label, src))
+        if not self.roi_names:
+            raise ValueError('None of the labels contains any sources')
+
+        if method == 'max':
+            self.matrix = None
+            self._order = np.concatenate(self._source_indices)
+            self._starts = np.cumsum(
+                [0] + [len(indices) for indices in self._source_indices[:-1]])
+        else:
+            self.matrix = self._make_matrix(inverse_model_matrix)
+
+    @property
+    def is_linear(self) -> bool:
+        return self.matrix is not None
+
+    def apply(self, data: np.ndarray) -> np.ndarray:
+        if self.is_linear:
+            return self.matrix.dot(data)
+        return np.maximum.reduceat(np.abs(data[self._order]), self._starts,
+                                   axis=0)
+
+    def set_inverse_model_matrix(self, inverse_model_matrix: np.ndarray):
+        """Recomputes the 'pca_flip' weights for inverse_model_matrix."""
+        if self.method == 'pca_flip':
+            self.matrix = self._make_matrix(inverse_model_matrix)
+
+    def fuse(self, inverse_model_matrix: np.ndarray) -> np.ndarray:
+        """
+        ROIS x CHANNELS matrix that computes the ROI time courses from the
+        sensor data at once. With 'pca_flip' the weights are recomputed for
+        inverse_model_matrix.
+
+        """
+        if not self.is_linear:
+            raise ValueError(
+                "Method {} is not linear and can't be fused into the inverse"
+                " model matrix".format(self.method))
+        if self.method == 'pca_flip':
+            matrix = self._make_matrix(inverse_model_matrix)
+        else:
+            matrix = self.matrix
+        return matrix.dot(inverse_model_matrix)
+
+    def _make_matrix(self, inverse_model_matrix) -> sparse.csr_matrix:
+        weights = list()
+        for roi_idx, indices in enumerate(self._source_indices):
+            if self.method == 'mean':
+                weights.append(np.full(len(indices), 1 / len(indices)))
+            elif self.method == 'mean_flip':
+                weights.append(self._flips[roi_idx] / len(indices))
+            elif self.method == 'pca_flip':
+                weights.append(self._pca_flip_weights(
+                    inverse_model_matrix[indices], self._flips[roi_idx]))
+
+        rows = np.repeat(np.arange(len(self._source_indices)),
+                         [len(indices) for indices in self._source_indices])
+        return sparse.csr_matrix(
+            (np.concatenate(weights), (rows,
+                                       np.concatenate(self._source_indices))),
+            shape=(len(self._source_indices), self.source_count),
+            dtype=DTYPE)
+
+    @staticmethod
+    def _pca_flip_weights(label_rows: np.ndarray, flip: np.ndarray):
+        """
+        Weights w such that w.dot(label_rows.dot(x)) is the pca_flip time
+        course: u^T label_rows = s * v^T, the first component, with the sign
+        of u^T flip as in mne's _pca_flip.
+
+        """
+        U, s, _ = np.linalg.svd(label_rows, full_matrices=False)
+        if s[0] == 0:
+            return np.zeros(len(flip))
+        sign = np.sign(U[:, 0].dot(flip)) or 1
+        scale = np.linalg.norm(s) / np.sqrt(len(flip))
+        return sign * scale / s[0] * U[:, 0]
@@ -0,0 +1,205 @@
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .. import DTYPE
+
+# Layout of the header: uint64 counters at the start of the shared block.
+# Only the producer writes _WRITE_INDEX and the overrun counters, only the
+# consumer writes _READ_INDEX. Both indices only grow, the position in the
+# payload is index % maxlen.
+_WRITE_INDEX = 0
+_READ_INDEX = 1
+_OVERRUN_CHUNK_COUNT = 2
+_OVERRUN_SAMPLE_COUNT = 3
+_ROW_COUNT = 4
+_MAXLEN = 5
+_ITEMSIZE = 6
+_HEADER_LENGTH = 8  # 64 bytes, keeps the payload cache-line aligned
+
+
+class SharedRingBuffer(object):
+    """
+    Single-producer/single-consumer queue of CHANNELS x TIME chunks in
+    shared memory. Works between threads and between processes: the consumer
+    attaches to the buffer by name (see attach) and gets views of the
+    payload, so nothing is pickled and the only copy is the one made by
+    write.
+
+    There are no locks. Each index is written by one side only with
+    a single aligned 8-byte store, which is atomic on the platforms we run
+    on, and the producer updates its index only after the payload has been
+    written.
+
+    The producer never waits: a chunk that does not fit into the free space
+    is dropped and counted in overrun_chunk_count/overrun_sample_count.
+
+    Sample usage:
+
+    # producer
+    buffer = SharedRingBuffer(row_cnt=64, maxlen=10000)
+    buffer.write(chunk)
+
+    # consumer, possibly in another process
+    buffer = SharedRingBuffer.attach(name, dtype)
+    chunk = buffer.read(timeout=0.1)  # valid until the next read/release
+
+    """
+
+    TIME_AXIS = 1
+
+    # Blocking reads poll with sleeps growing up to this many seconds
+    MAX_POLL_INTERVAL = 0.001
+
+    def __init__(self, row_cnt, maxlen, dtype=DTYPE, name=None):
+        dtype = np.dtype(dtype)
+        header_byte_count = _HEADER_LENGTH * 8
+        payload_byte_count = row_cnt * maxlen * dtype.itemsize
+        self._shared_memory = shared_memory.SharedMemory(
+            name=name, create=True,
+            size=header_byte_count + payload_byte_count)
+        self._is_owner = True
+        self._map(row_cnt, maxlen, dtype)
+
+        self._header[:] = 0
+        self._header[_ROW_COUNT] = row_cnt
+        self._header[_MAXLEN] = maxlen
+        self._header[_ITEMSIZE] = dtype.itemsize
+
+    @classmethod
+    def attach(cls, name, dtype=DTYPE):
+        """Connects to a buffer created (possibly in another process) with
+        SharedRingBuffer(..., name=name)"""
+        self = cls.__new__(cls)
+        try:
+            # Otherwise the resource tracker of this process might unlink
+            # the memory when the process exits
+            self._shared_memory = shared_memory.SharedMemory(name=name,
+                                                             track=False)
+        except TypeError:  # Python < 3.13
+            self._shared_memory = shared_memory.SharedMemory(name=name)
+        self._is_owner = False
+
+        header = np.ndarray((_HEADER_LENGTH, ), dtype=np.uint64,
+                            buffer=self._shared_memory.buf)
+        dtype = np.dtype(dtype)
+        if header[_ITEMSIZE] != dtype.itemsize:
+            raise ValueError('Buffer {} was not created with dtype {}'.format(
+                name, dtype))
+        self._map(int(header[_ROW_COUNT]), int(header[_MAXLEN]), dtype)
+        return self
+
+    def _map(self, row_cnt, maxlen, dtype):
+        self.row_cnt = row_cnt
+        self.maxlen = maxlen
+        self._header = np.ndarray((_HEADER_LENGTH, ), dtype=np.uint64,
+                                  buffer=self._shared_memory.buf)
+        # Time-major, so that any run of samples is one contiguous block
+        self._payload = np.ndarray((maxlen, row_cnt), dtype=dtype,
+                                   buffer=self._shared_memory.buf,
+                                   offset=_HEADER_LENGTH * 8)
+        # Samples returned by the last read that have not been released yet
+        self._samples_being_read = 0
+
+    @property
+    def name(self):
+        return self._shared_memory.name
+
+    @property
+    def overrun_chunk_count(self):
+        return int(self._header[_OVERRUN_CHUNK_COUNT])
+
+    @property
+    def overrun_sample_count(self):
+        return int(self._header[_OVERRUN_SAMPLE_COUNT])
+
+    @property
+    def unread_sample_count(self):
+        return int(self._header[_WRITE_INDEX] - self._header[_READ_INDEX])
+
+    def write(self, array) -> bool:
+        """
+        Copies a CHANNELS x TIME array into the buffer. Never blocks.
+        Returns False if there was not enough free space and the array has
+        been dropped.
+
+        """
+        if array.shape[0] != self.row_cnt:
+            msg = ('Wrong shape. You are trying to extend a buffer with {} '
+                   'rows with an array with {} rows'.format(self.row_cnt,
+                                                            array.shape[0]))
+            raise ValueError(msg)
+
+        new_sample_cnt = array.shape[self.TIME_AXIS]
+        write_index = int(self._header[_WRITE_INDEX])
+        free_sample_cnt = (self.maxlen -
+                           (write_index - int(self._header[_READ_INDEX])))
+        if new_sample_cnt > free_sample_cnt:
+            self._header[_OVERRUN_CHUNK_COUNT] += 1
+            self._header[_OVERRUN_SAMPLE_COUNT] += new_sample_cnt
+            return False
+
+        start = write_index % self.maxlen
+        first_part_cnt = min(new_sample_cnt, self.maxlen - start)
+        self._payload[start:(start + first_part_cnt)] =\
+            array[:, :first_part_cnt].T
+        # Wrap around if needed
+        self._payload[:(new_sample_cnt - first_part_cnt)] =\
+            array[:, first_part_cnt:].T
+
+        # Publish only after the payload is in place
+        self._header[_WRITE_INDEX] = write_index + new_sample_cnt
+        return True
+
+    def read(self, block=True, timeout=None, max_sample_cnt=None):
+        """
+        Releases the samples returned by the previous read and returns
+        a CHANNELS x TIME view of the oldest unread ones. The view stays valid
+        until the next call to read or release.
+
+        Unread samples that wrap around the end of the payload are returned
+        by two consecutive reads.
+
+        :param block: wait for data if there is none
+        :param timeout: maximum wait in seconds, None means forever
+        :return: the view, possibly with zero samples if nothing has arrived
+        in time
+
+        """
+        self.release()
+
+        deadline = None if timeout is None else time.time() + timeout
+        poll_interval = self.MAX_POLL_INTERVAL / 64
+        while True:
+            read_index = int(self._header[_READ_INDEX])
+            unread_sample_cnt = int(self._header[_WRITE_INDEX]) - read_index
+            if unread_sample_cnt > 0 or not block:
+                break
+            if deadline is not None and time.time() >= deadline:
+                break
+            time.sleep(poll_interval)
+            poll_interval = min(2 * poll_interval, self.MAX_POLL_INTERVAL)
+
+        start = read_index % self.maxlen
+        sample_cnt = min(unread_sample_cnt, self.maxlen - start)
+        if max_sample_cnt is not None:
+            sample_cnt = min(sample_cnt, max_sample_cnt)
+
+        self._samples_being_read = sample_cnt
+        return self._payload[start:(start + sample_cnt)].T
+
+    def release(self):
+        """Lets the producer overwrite the samples returned by the last read"""
+        if self._samples_being_read > 0:
+            self._header[_READ_INDEX] += self._samples_being_read
+            self._samples_being_read = 0
+
+    def close(self):
+        """Detaches from the shared memory. The creator also frees it."""
+        # Views into the buffer have to go before the memory can be closed
+        self._header = None
+        self._payload = None
+        self._shared_memory.close()
+        if self._is_owner:
+            self._shared_memory.unlink()
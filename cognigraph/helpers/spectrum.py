@@ -0,0 +1,91 @@
+"""
+Power spectra of overlapping windows, e.g. those returned by
+RingBuffer.windows. Windows are CHANNELS x WINDOWS x SAMPLES arrays.
+
+"""
+import numpy as np
+
+from .. import DTYPE
+
+SUPPORTED_TAPERS = ('hann', 'dpss')
+
+
+def make_tapers(taper: str, window_length: int,
+                time_bandwidth: float=4.0) -> np.ndarray:
+    """
+    TAPERS x SAMPLES array of tapers with unit energy. 'hann' is a single
+    Hann window (Welch's method), 'dpss' are the 2 * time_bandwidth - 1
+    Slepian sequences of the multitaper method.
+
+    """
+    if taper == 'hann':
+        from scipy.signal import get_window
+        tapers = get_window('hann', window_length)[np.newaxis]
+    elif taper == 'dpss':
+        from scipy.signal.windows import dpss
+        taper_count = max(1, int(2 * time_bandwidth) - 1)
+        tapers = np.atleast_2d(dpss(window_length, time_bandwidth,
+                                    Kmax=taper_count))
+    else:
+        raise ValueError(
+            'Taper {} is not supported.'
+            ' Use one of: {}'.format(taper, SUPPORTED_TAPERS))
+    return tapers / np.linalg.norm(tapers, axis=1, keepdims=True)
+
+
+def make_band_matrix(frequencies: np.ndarray, bands) -> np.ndarray:
+    """
+    FREQUENCIES x BANDS matrix that integrates a power spectral density
+    over each band: the bins with lower_cutoff <= frequency < upper_cutoff.
+
+    """
+    bin_width = frequencies[1] - frequencies[0]
+    band_matrix = np.zeros((len(frequencies), len(bands)), dtype=DTYPE)
+    for band_idx, (lower_cutoff, upper_cutoff) in enumerate(bands):
+        in_band = (frequencies >= lower_cutoff) & (frequencies < upper_cutoff)
+        band_matrix[in_band, band_idx] = bin_width
+    return band_matrix
+
+
+class WindowedPSD(object):
+    """
+    One-sided power spectral density (units^2 / Hz) of every window of
+    window_length samples, averaged over the tapers. All channels and
+    windows are transformed in one rfft call per taper, and the tapered
+    windows are written to a buffer that is kept between calls. numpy
+    caches the FFT plan for each length, so that is reused too.
+
+    """
+    def __init__(self, window_length: int, frequency: float,
+                 taper: str='hann', time_bandwidth: float=4.0):
+        self.window_length = window_length
+        self.tapers = make_tapers(taper, window_length,
+                                  time_bandwidth).astype(DTYPE)
+        self.frequencies = np.fft.rfftfreq(window_length, 1 / frequency)
+
+        # Unit-energy tapers make sum(psd) * bin_width the mean square of
+        # the signal. Negative frequencies are folded into positive ones.
+        self._scale = np.full(len(self.frequencies), 2 / frequency,
+                              dtype=DTYPE)
+        self._scale[0] /= 2
+        if window_length % 2 == 0:
+            self._scale[-1] /= 2
+        self._scale /= len(self.tapers)
+
+        self._tapered = np.empty(0, dtype=DTYPE)
+
+    def apply(self, windows: np.ndarray) -> np.ndarray:
+        """CHANNELS x WINDOWS x FREQUENCIES power spectral densities"""
+        if self._tapered.size < windows.size:
+            self._tapered = np.empty(windows.size, dtype=DTYPE)
+        tapered = self._tapered[:windows.size].reshape(windows.shape)
+
+        psd = np.zeros(windows.shape[:-1] + (len(self.frequencies), ),
+                       dtype=DTYPE)
+        for taper in self.tapers:
+            np.multiply(windows, taper, out=tapered)
+            spectrum = np.fft.rfft(tapered, axis=-1)
+            psd += np.square(spectrum.real)
+            psd += np.square(spectrum.imag)
+        psd *= self._scale
+        return psd
@@ -5,13 +5,21 @@ from contextlib import contextmanager
 import numpy as np
 from mne.io.pick import channel_type
 
+from .. import TIME_AXIS
 from ..helpers.misc import class_name_of
+from ..helpers.metrics import NodeMetrics
 import logging
 
 logging.basicConfig(filename='cognigraph.log', level=logging.INFO,
                     format='%(asctime)s:%(name)-17s:%(levelname)s:%(message)s')
 
 
+def _sample_count(array) -> int:
+    """Number of samples in a CHANNELS x TIME output, 0 for anything else"""
+    shape = getattr(array, 'shape', ())
+    return shape[TIME_AXIS] if len(shape) > TIME_AXIS else 0
+
+
 class Message(object):
     """
     Class to hold messages that need to be delivered to
@@ -87,6 +95,15 @@ class Node(object):
         self.logger = logging.getLogger(type(self).__name__)
         # reinitialization
 
+        # Timings and sample counts are only collected if this is set,
+        # see Pipeline.enable_metrics
+        self.metrics = None  # type: NodeMetrics
+
+        # time.time() at which the last sample of output was acquired or None
+        # if unknown. Sources set it, other nodes inherit it from their input
+        # node unless they set it themselves in _update.
+        self.acquisition_time = None  # type: float
+
     @property
     def input_node(self):
         return self._input_node
@@ -147,6 +164,8 @@ class Node(object):
             t2 = time.time()
             self.logger.info(
                 'Finish initialization in {:.1f} ms'.format((t2 - t1) * 1000))
+            if self.metrics is not None:
+                self.metrics.histograms['initialize'].record(t2 - t1)
             self._initialized = True
 
             # Set all the resetting flags to false
@@ -187,8 +206,9 @@ class Node(object):
             receiver_node.receive_a_message(message)
 
     def update(self) -> None:
-        t1 = time.time()
         self.output = None  # Reset output in case update does not succeed
+        self.acquisition_time = (None if self.input_node is None
+                                 else self.input_node.acquisition_time)
 
         if self._there_has_been_an_upstream_change is True:
             self._should_reinitialize =\
@@ -196,7 +216,17 @@ class Node(object):
             self._there_has_been_an_upstream_change = False
 
         if self._initialized is True and self._no_pending_changes is True:
-            self._update()
+            metrics = self.metrics
+            if metrics is None:
+                self._update()
+            else:
+                t1 = time.perf_counter()
+                self._update()
+                metrics.histograms['update'].record(time.perf_counter() - t1)
+                self._count_samples(metrics)
+                if self.acquisition_time is not None:
+                    metrics.histograms['latency'].record(
+                        time.time() - self.acquisition_time)
             # This does not work when there are multiple descendants
             # TODO: come up with a way
             # Discard input
@@ -210,8 +240,12 @@ class Node(object):
                 self.reset()
             if self._input_history_is_no_longer_valid is True:
                 self.on_input_history_invalidation()
-        t2 = time.time()
-        self.logger.info('Updated in {:.1f} ms'.format((t2 - t1) * 1000))
+
+    def _count_samples(self, metrics: NodeMetrics):
+        metrics.update_count += 1
+        if self.input_node is not None:
+            metrics.samples_in += _sample_count(self.input_node.output)
+        metrics.samples_out += _sample_count(self.output)
 
     def _update(self):
         raise NotImplementedError('_update should be implemented')
@@ -224,7 +258,11 @@ class Node(object):
         with self.not_triggering_reset():
             print('Resetting the {} node '.format(class_name_of(self)) +
                   'because of attribute changes')
+            t1 = time.perf_counter()
             output_history_is_no_longer_valid = self._reset()
+            if self.metrics is not None:
+                self.metrics.histograms['reset'].record(
+                    time.perf_counter() - t1)
             self._should_reset = False
 
             # Notify the receivers
@@ -419,9 +457,11 @@ class ProcessorNode(Node):
     def update(self):
         if self.disabled is True:
             self.output = self.input_node.output
+            self.acquisition_time = self.input_node.acquisition_time
             return
         if self.input_node.output is None or self.input_node.output.size == 0:
             self.output = None
+            self.acquisition_time = None
             return
         else:
             super().update()
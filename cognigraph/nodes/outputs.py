@@ -1,35 +1,41 @@
-import os
 import time
+import atexit
+import weakref
+from functools import partial
 from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
 
-import tables
-from PyQt5.QtCore import pyqtSignal, QObject
-
-import mne
-import nibabel as nib
 import numpy as np
-import pyqtgraph.opengl as gl
-from matplotlib import cm
-from matplotlib.colors import Colormap as matplotlib_Colormap
-from mne.datasets import sample
-from scipy import sparse
 
-from ..helpers.pysurfer.smoothing_matrix import smoothing_matrix, mesh_edges
 from .node import OutputNode
 from .. import CHANNEL_AXIS, TIME_AXIS, PYNFB_TIME_AXIS
 from ..helpers.lsl import (convert_numpy_format_to_lsl,
-                           convert_numpy_array_to_lsl_chunk,
-                           create_lsl_outlet)
-from ..helpers.matrix_functions import last_sample, make_time_dimension_second
-from ..helpers.ring_buffer import RingBuffer
-from ..helpers.channels import read_channel_types, channel_labels_saver
-from vendor.nfb.pynfb.widgets.signal_viewers import RawSignalViewer as nfbSignalViewer
-
-# visbrain visualization imports 
-from ..gui.brain_visual import BrainMesh
-from vispy import app, gloo, visuals, scene, io
-
-import torch
+                           allocate_lsl_chunk_buffer,
+                           write_numpy_array_to_lsl_chunk,
+                           create_lsl_outlet,
+                           get_lsl_clock_offset)
+from ..helpers.matrix_functions import (last_sample,
+                                        make_time_dimension_second,
+                                        get_a_subset_of_channels)
+from ..helpers.ring_buffer import create_ring_buffer
+from ..helpers.decimation import MinMaxDecimator
+from ..helpers.hdf5 import (BackgroundChunkWriter, choose_chunkshape,
+                            make_filters)
+from ..helpers.channels import (read_channel_types, channel_labels_saver,
+                                channel_labels_and_frequency_saver)
+
+# Qt, vispy, torch, tables and the nfb widgets take seconds to import and are
+# not needed by headless pipelines, so the nodes import them on first use.
+
+
+def __getattr__(name):
+    # BrainPainter used to be defined here. Module __getattr__ (PEP 562)
+    # needs Python 3.7; setup.py requires 3.8.
+    if name == 'BrainPainter':
+        from ..gui.brain_painter import BrainPainter
+        return BrainPainter
+    raise AttributeError(
+        'module {!r} has no attribute {!r}'.format(__name__, name))
 
 
 class LSLStreamOutput(OutputNode):
@@ -40,23 +46,36 @@ class LSLStreamOutput(OutputNode):
     def _check_value(self, key, value):
         pass  # TODO: check that value as a string usable as a stream name
 
-    CHANGES_IN_THESE_REQUIRE_RESET = ('stream_name', )
+    CHANGES_IN_THESE_REQUIRE_RESET = ('stream_name', 'max_channels_per_outlet')
 
     UPSTREAM_CHANGES_IN_THESE_REQUIRE_REINITIALIZATION = (
         'source_name', 'mne_info', 'dtype',
     )
-    SAVERS_FOR_UPSTREAM_MUTABLE_OBJECTS = {'mne_info': lambda info: (info['sfreq'], ) + channel_labels_saver(info)}
+    SAVERS_FOR_UPSTREAM_MUTABLE_OBJECTS = {'mne_info': channel_labels_and_frequency_saver}
+
+    # Initial number of samples the push buffers can hold. They grow if a larger chunk arrives.
+    INITIAL_BUFFER_SAMPLE_COUNT = 256
 
     def _reset(self):
         # It is impossible to change then name of an already started stream so we have to initialize again
         self._should_reinitialize = True
         self.initialize()
 
-    def __init__(self, stream_name=None):
+    def __init__(self, stream_name=None, max_channels_per_outlet=None):
+        """
+        :param stream_name: name of the output stream. If None, '_output' is appended to the source name.
+        :param max_channels_per_outlet: if the input has more channels than that (e.g. source-space data), it is split
+        into several outlets named '<stream_name>_part<i>' with at most max_channels_per_outlet channels each.
+        """
         super().__init__()
         self._provided_stream_name = stream_name
         self.stream_name = None
-        self._outlet = None
+        self.max_channels_per_outlet = max_channels_per_outlet
+        self._outlets = None  # type: list
+        self._channel_slices = None  # type: List[slice]
+        self._chunk_buffers = None  # type: List[np.ndarray]
+        self._dtype = None  # type: np.dtype
+        self._lsl_clock_offset = None  # type: float
 
     def _initialize(self):
 
@@ -65,20 +84,52 @@ class LSLStreamOutput(OutputNode):
         self.stream_name = self._provided_stream_name or (source_name + '_output')
 
         # Get other info from somewhere down the predecessor chain
-        dtype = self.traverse_back_and_find('dtype')
-        channel_format = convert_numpy_format_to_lsl(dtype)
+        self._dtype = self.traverse_back_and_find('dtype')
+        channel_format = convert_numpy_format_to_lsl(self._dtype)
         mne_info = self.traverse_back_and_find('mne_info')
         frequency = mne_info['sfreq']
         channel_labels = mne_info['ch_names']
         channel_types = read_channel_types(mne_info)
 
-        self._outlet = create_lsl_outlet(name=self.stream_name, frequency=frequency, channel_format=channel_format,
-                                         channel_labels=channel_labels, channel_types=channel_types)
+        channel_count = len(channel_labels)
+        outlet_width = self.max_channels_per_outlet or channel_count
+        self._channel_slices = [slice(start, min(start + outlet_width, channel_count))
+                                for start in range(0, channel_count, outlet_width)]
+
+        self._outlets = list()
+        for part_idx, channel_slice in enumerate(self._channel_slices):
+            if len(self._channel_slices) == 1:
+                outlet_name = self.stream_name
+            else:
+                outlet_name = '{}_part{}'.format(self.stream_name, part_idx)
+            self._outlets.append(create_lsl_outlet(
+                name=outlet_name, frequency=frequency, channel_format=channel_format,
+                channel_labels=channel_labels[channel_slice], channel_types=channel_types[channel_slice]))
+
+        self._allocate_chunk_buffers(self.INITIAL_BUFFER_SAMPLE_COUNT)
+        self._lsl_clock_offset = get_lsl_clock_offset()
+
+    def _allocate_chunk_buffers(self, sample_count):
+        self._chunk_buffers = [
+            allocate_lsl_chunk_buffer(sample_count=sample_count,
+                                      channel_count=channel_slice.stop - channel_slice.start, dtype=self._dtype)
+            for channel_slice in self._channel_slices]
 
     def _update(self):
         chunk = self.input_node.output
-        lsl_chunk = convert_numpy_array_to_lsl_chunk(chunk)
-        self._outlet.push_chunk(lsl_chunk)
+        sample_count = chunk.shape[TIME_AXIS]
+        if sample_count > self._chunk_buffers[0].shape[0]:
+            self._allocate_chunk_buffers(max(sample_count, 2 * self._chunk_buffers[0].shape[0]))
+
+        # Samples keep their acquisition time, so that consumers can tell how stale they are
+        if self.acquisition_time is None:
+            timestamp = 0.0  # LSL will use the current time
+        else:
+            timestamp = self.acquisition_time - self._lsl_clock_offset
+
+        for outlet, channel_slice, chunk_buffer in zip(self._outlets, self._channel_slices, self._chunk_buffers):
+            lsl_chunk = write_numpy_array_to_lsl_chunk(get_a_subset_of_channels(chunk, channel_slice), chunk_buffer)
+            outlet.push_chunk(lsl_chunk, timestamp)
 
 
 class ThreeDeeBrain(OutputNode):
@@ -114,6 +165,8 @@ class ThreeDeeBrain(OutputNode):
         self._threshold_pct = threshold_pct
 
         self._limits_buffer = None  # type: RingBuffer
+
+        from ..gui.brain_painter import BrainPainter
         self._brain_painter = BrainPainter(threshold_pct=threshold_pct,
                                            **brain_painter_kwargs)
 
@@ -133,7 +186,7 @@ class ThreeDeeBrain(OutputNode):
 
         frequency = self.traverse_back_and_find('mne_info')['sfreq']
         buffer_sample_count = np.int(self.buffer_length * frequency)
-        self._limits_buffer = RingBuffer(row_cnt=2, maxlen=buffer_sample_count)
+        self._limits_buffer = create_ring_buffer(row_cnt=2, maxlen=buffer_sample_count)
 
     def _update(self):
         sources = self.input_node.output
@@ -177,260 +230,157 @@ class ThreeDeeBrain(OutputNode):
                                  'Probably has not been initialized')
 
 
-class BrainPainter(QObject):
-    draw_sig = pyqtSignal('PyQt_PyObject')
-    time_since_draw = time.time()
-
-    def __init__(self, threshold_pct=50,
-                 brain_colormap: matplotlib_Colormap = cm.Greys,
-                 data_colormap: matplotlib_Colormap = cm.Reds,
-                 show_curvature=True, surfaces_dir=None):
-        """
-        This is the last step.
-        Object of this class draws any data on the cortex mesh given to it.
-        No changes, except for thresholding, are made.
-
-        :param threshold_pct:
-        Only values exceeding this percentage threshold will be shown
-        :param show_curvature:
-        If True, concave areas will be shown in darker grey,
-        convex - in lighter
-        :param surfaces_dir:
-        Path to the Fressurfer surf directory.
-        If None, mne's sample's surfaces will be used.
-        """
-        super().__init__()
-
-        self.threshold_pct = threshold_pct
-        self.show_curvature = show_curvature
-
-        self.brain_colormap = brain_colormap
-        self.data_colormap = data_colormap
+class SignalViewer(OutputNode):
+    """
+    Plots the input with nfb's RawSignalViewer.
 
-        self.surfaces_dir = surfaces_dir  # type: str
-        self.mesh_data = None  # type: gl.MeshData
-        self.smoothing_matrix = None  # type: np.ndarray
-        self.widget = None  # type: gl.GLViewWidget
+    With many channels or high sampling rates, plotting every sample is what
+    takes most of the time, so by default the input is reduced to
+    a min/max envelope with two samples per pixel column
+    (see MinMaxDecimator). Only the channels on the current page are shown
+    (all of them if channels_per_page is None) and the widget is updated at
+    most refresh_rate times per second.
 
-        self.background_colors = None  # type: np.ndarray  # N x 4
-        self.mesh_item = None  # type: gl.GLMeshItem
+    """
+    CHANGES_IN_THESE_REQUIRE_RESET = ('seconds_to_plot', 'pixel_column_count',
+                                      'channels_per_page', 'page')
 
-        self.draw_sig.connect(self.on_draw)
+    UPSTREAM_CHANGES_IN_THESE_REQUIRE_REINITIALIZATION = ('mne_info', )
+    SAVERS_FOR_UPSTREAM_MUTABLE_OBJECTS = {
+        'mne_info': channel_labels_and_frequency_saver}
 
-    def initialize(self, mne_forward_model_file_path):
+    def _initialize(self):
+        mne_info = self.traverse_back_and_find('mne_info')
+        self._frequency = mne_info['sfreq']
+        self._ch_names = list(mne_info['ch_names'])
 
-        self.background_colors = self._calculate_background_colors(
-            self.show_curvature)
-        # self.mesh_data.setVertexColors(self.background_colors)
-        # import ipdb; ipdb.set_trace()
-        # self.mesh_data.add_overlay(self.background_colors, to_overlay=1)
-        # self.mesh_item = gl.GLMeshItem(
-        #     meshdata=self.mesh_data, shader='shaded')
-        # self.widget.addItem(self.mesh_item)
+        # The GUI embeds self.widget once, so the viewer is put into a
+        # container that stays the same when the viewer is replaced
         if self.widget is None:
-            self.mesh_data = self._get_mesh_data_from_surfaces_dir()
-            self.widget = self._create_widget()
-        self.smoothing_matrix = self._get_smoothing_matrix(
-            mne_forward_model_file_path)
-        # else:  # Do not recreate the widget, just clear it
-        #     for item in self.widget.items:
-        #         self.widget.removeItem(item)
-
-    def on_draw(self, normalized_values):
-
-        sources_smoothed = self.smoothing_matrix.dot(normalized_values)
-        threshold = self.threshold_pct / 100
-        mask = sources_smoothed <= threshold
-
-        # reset colors to white
-        self.mesh_data._alphas[:, :] = 0.
-        self.mesh_data._alphas_buffer.set_data(self.mesh_data._alphas)
-
-        if np.any(~mask):
-            self.mesh_data.add_overlay(sources_smoothed[~mask],
-                                       vertices=np.where(~mask)[0],
-                                       to_overlay=1)
-        self.mesh_data.update()
-
-    def draw(self, normalized_values):
-        self.draw_sig.emit(normalized_values)
-
-    def _get_mesh_data_from_surfaces_dir(self, cortex_type='inflated') -> gl.MeshData:
-        if self.surfaces_dir:
-            surf_paths = [os.path.join(self.surfaces_dir, '{}.{}'.format(h, cortex_type))
-                          for h in ('lh', 'rh')]
+            from PyQt5.QtWidgets import QWidget, QVBoxLayout
+            self.widget = QWidget()
+            layout = QVBoxLayout(self.widget)
+            layout.setContentsMargins(0, 0, 0, 0)
+        self._set_up_plot()
+
+    def _set_up_plot(self):
+        """Picks the visible channels and the decimation, makes a viewer"""
+        channel_count = len(self._ch_names)
+        if self.channels_per_page is None:
+            self._visible_channels = slice(0, channel_count)
         else:
-            raise NameError('surfaces_dir is not set')
-        lh_mesh, rh_mesh = [nib.freesurfer.read_geometry(surf_path) for surf_path in surf_paths]
-        lh_vertexes, lh_faces = lh_mesh
-        rh_vertexes, rh_faces = rh_mesh
-
-        # Move all the vertexes so that the lh has x (L-R) <= 0 and rh - >= 0
-        lh_vertexes[:, 0] -= np.max(lh_vertexes[:, 0])
-        rh_vertexes[:, 0] -= np.min(rh_vertexes[:, 0])
-
-        # Combine two meshes
-        vertexes = np.r_[lh_vertexes, rh_vertexes]
-        lh_vertex_cnt = lh_vertexes.shape[0]
-        faces = np.r_[lh_faces, lh_vertex_cnt + rh_faces]
-
-        # Move the mesh so that the center of the brain is at (0, 0, 0) (kinda)
-        vertexes[:, 1:2] -= np.mean(vertexes[:, 1:2])
-
-        # Invert vertex normals for more reasonable lighting (I am not sure if the pyqtgraph's shader has a bug or
-        # gl.MeshData's calculation of normals does
-        # mesh_data = gl.MeshData(vertexes=vertexes, faces=faces)
-        mesh_data = BrainMesh(vertices=vertexes, faces=faces)
-        # mesh_data._vertexNormals = mesh_data.vertexNormals() * (-1)
-
-        return mesh_data
-
-    def _get_mesh_data_from_forward_solution(self, forward_solution_file_path) -> (list, gl.MeshData):
-        # mne's forward solution is a dict with the geometry information under the key 'src'.
-        # forward_solution['src'] is a list two items each of which corresponds to one hemisphere.
-        forward_solution = mne.read_forward_solution(forward_solution_file_path, verbose='ERROR')
-        left_hemi, right_hemi = forward_solution['src']
-
-        # Each hemisphere is represented by a dict containing the list of all vertices from the original mesh (with
-        # default options in FreeSurfer that is ~150K vertices). These are stored under the key 'rr'.
-
-        # Only a small subset of these vertices was likely used during the construction of the forward solution. The
-        # mesh containing only the used vertices is represented by an array of faces stored under the 'use_tris' key.
-        # This submesh still contains some extra vertices so that it is still a manifold.
-
-        # Each face is a row with the indices of the vertices of that face. The indexing is into the 'rr' array
-        # containing all the vertices.
-
-        # Let's now combine two meshes into one. Also save the indexes of the sources
-        vertexes = np.r_[left_hemi['rr'], right_hemi['rr']]
-        lh_vertex_cnt = left_hemi['rr'].shape[0]
-        faces = np.r_[left_hemi['use_tris'], lh_vertex_cnt + right_hemi['use_tris']]
-        sources_idx = np.r_[left_hemi['vertno'], lh_vertex_cnt + right_hemi['vertno']]
-
-        return sources_idx, vertexes, faces
-
-    def _create_widget(self):
-        # TODO: change to vispy
-        # widget = gl.GLViewWidget()
-        canvas = scene.SceneCanvas(keys='interactive', show=False)
-
-        # Add a ViewBox to let the user zoom/rotate
-        view = canvas.central_widget.add_view()
-        view.camera = 'turntable'
-        view.camera.fov = 50
-        view.camera.distance = 400
-
-        # Make light follow camera
-        @canvas.events.mouse_move.connect
-        def on_mouse_move(event):
-            self.mesh_data._camera = view.camera
-            self.mesh_data.shared_program.frag['camtf'] = self.mesh_data._camera.transform
-            self.mesh_data.update()
-            view.add(self.mesh_data)
-        # # Set the camera at a distance proportional to the size of the mesh along the widest dimension
-        # max_ptp = max(np.ptp(self.mesh_data.vertexes(), axis=0))
-        # widget.setCameraPosition(distance=(1.5 * max_ptp))
-        return canvas.native
-
-
-    def _calculate_background_colors(self, show_curvature):
-        if show_curvature:
-            curvature_file_paths = [os.path.join(self.surfaces_dir,
-                                                 "{}.curv".format(h)) for h in ('lh', 'rh')]
-            curvatures = [nib.freesurfer.read_morph_data(path) for path in curvature_file_paths]
-            curvature = np.concatenate(curvatures)
-            return self.brain_colormap((curvature > 0) / 3 + 1 / 3)  # 1/3 for concave, 2/3 for convex
+            first_channel = self.page * self.channels_per_page
+            self._visible_channels = slice(
+                first_channel,
+                min(first_channel + self.channels_per_page, channel_count))
+        names = self._ch_names[self._visible_channels]
+
+        samples_per_bin = 1
+        if self.pixel_column_count is not None:
+            samples_per_bin = int(self._frequency * self.seconds_to_plot //
+                                  self.pixel_column_count)
+
+        # Each bin turns into two samples, so with fewer than three samples
+        # per bin decimation does not save anything
+        if samples_per_bin > 2:
+            self._decimator = MinMaxDecimator(
+                samples_per_bin=samples_per_bin, row_cnt=len(names))
+            plotted_frequency = 2 * self._frequency / samples_per_bin
         else:
-            background_color = self.brain_colormap(0.5)
-            total_vertex_cnt = self.mesh_data.vertexes().shape[0]
-            return np.tile(background_color, total_vertex_cnt)
-
-    @staticmethod
-    def _guess_surfaces_dir_based_on(mne_forward_model_file_path):
-        # If the forward model that was used is from the mne's sample dataset, then we can use curvatures from there
-        path_to_sample = os.path.realpath(sample.data_path(verbose='ERROR'))
-        if os.path.realpath(mne_forward_model_file_path).startswith(path_to_sample):
-            return os.path.join(path_to_sample, "subjects", "sample", "surf")
-
-    @staticmethod
-    def read_smoothing_matrix():
-        lh_npz = np.load('playground/vs_pysurfer/smooth_mat_lh.npz')
-        rh_npz = np.load('playground/vs_pysurfer/smooth_mat_rh.npz')
-
-        smooth_mat_lh = sparse.coo_matrix((
-            lh_npz['data'], (lh_npz['row'], lh_npz['col'])),
-            shape=lh_npz['shape'] + rh_npz['shape'])
-
-        lh_row_cnt, lh_col_cnt = lh_npz['shape']
-        smooth_mat_rh = sparse.coo_matrix((
-            rh_npz['data'], (rh_npz['row'] + lh_row_cnt, rh_npz['col'] + lh_col_cnt)),
-            shape=rh_npz['shape'] + lh_npz['shape'])
-
-        return smooth_mat_lh.tocsc() + smooth_mat_rh.tocsc()
-
-    def _get_smoothing_matrix(self, mne_forward_model_file_path):
-        """
-        Creates or loads a smoothing matrix that lets us
-        interpolate source values onto all mesh vertices
-
-        """
-        # Not all the vertices in the forward solution mesh are sources.
-        # sources_idx actually indexes into the union of
-        # high-definition meshes for left and right hemispheres.
-        # The smoothing matrix then lets us assign a color to each vertex.
-        # If in future we decide to use low-definition mesh from
-        # the forward model for drawing, we should index into that.
-        # Shorter: the coordinates of the jth source are
-        # in self.mesh_data.vertexes()[sources_idx[j], :]
-        smoothing_matrix_file_path = (
-            os.path.splitext(mne_forward_model_file_path)[0] +
-            '-smoothing-matrix.npz')
-        try:
-            return sparse.load_npz(smoothing_matrix_file_path)
-        except FileNotFoundError:
-            print('Calculating smoothing matrix.' +
-                  ' This might take a while the first time.')
-            sources_idx, vertexes, faces = self._get_mesh_data_from_forward_solution(
-                mne_forward_model_file_path)
-            adj_mat = mesh_edges(self.mesh_data._faces)
-            smoothing_mat = smoothing_matrix(sources_idx, adj_mat)
-            sparse.save_npz(smoothing_matrix_file_path, smoothing_mat)
-            return smoothing_mat
-
-
-class SignalViewer(OutputNode):
-    CHANGES_IN_THESE_REQUIRE_RESET = ()
-
-    UPSTREAM_CHANGES_IN_THESE_REQUIRE_REINITIALIZATION = ('mne_info', )
-    SAVERS_FOR_UPSTREAM_MUTABLE_OBJECTS = {'mne_info': channel_labels_saver}
-
-    def _initialize(self):
-        mne_info = self.traverse_back_and_find('mne_info')
-        self.widget = nfbSignalViewer(fs=mne_info['sfreq'], names=mne_info['ch_names'],
-                                      seconds_to_plot=10)
+            self._decimator = None
+            plotted_frequency = self._frequency
+
+        from vendor.nfb.pynfb.widgets.signal_viewers import (
+            RawSignalViewer as nfbSignalViewer)
+
+        self._pending_chunks = list()
+        self._time_of_the_last_draw = 0
+        viewer = nfbSignalViewer(fs=plotted_frequency, names=names,
+                                 seconds_to_plot=self.seconds_to_plot)
+        layout = self.widget.layout()
+        if self._viewer is not None:
+            layout.removeWidget(self._viewer)
+            self._viewer.deleteLater()
+        layout.addWidget(viewer)
+        self._viewer = viewer
 
     def _update(self):
-        chunk = self.input_node.output
-        if TIME_AXIS == PYNFB_TIME_AXIS:
-            self.widget.update(chunk)
+        chunk = make_time_dimension_second(self.input_node.output)
+        chunk = chunk[self._visible_channels]
+        if self._decimator is not None:
+            chunk = self._decimator.apply(chunk)
+        self._pending_chunks.append(chunk)
+
+        current_time = time.time()
+        if current_time - self._time_of_the_last_draw < 1 / self.refresh_rate:
+            return
+        self._time_of_the_last_draw = current_time
+
+        if len(self._pending_chunks) == 1:
+            chunk = self._pending_chunks[0]
         else:
-            self.widget.update(chunk.T)
+            chunk = np.concatenate(self._pending_chunks, axis=1)
+        self._pending_chunks = list()
+
+        if PYNFB_TIME_AXIS == 1:
+            self._viewer.update(chunk)
+        else:
+            self._viewer.update(chunk.T)
 
     def _reset(self) -> bool:
-        # Nothing to reset, really
-        pass
+        # Paging and decimation only change what is plotted, the input is
+        # the same
+        self._set_up_plot()
+        output_history_is_no_longer_valid = False
+        return output_history_is_no_longer_valid
 
     def _on_input_history_invalidation(self):
         # Don't really care, will draw whatever
         pass
 
     def _check_value(self, key, value):
-        # Nothing to be set
-        pass
+        if key == 'refresh_rate':
+            if value <= 0:
+                raise ValueError('Refresh rate must be a positive number')
+
+        if key == 'page':
+            if value < 0:
+                raise ValueError('Page must be a non-negative integer')
 
-    def __init__(self):
+    def __init__(self, seconds_to_plot=10, pixel_column_count=1000,
+                 channels_per_page=None, page=0, refresh_rate=30):
+        """
+        :param pixel_column_count: number of min/max bins per
+        seconds_to_plot. None turns decimation off.
+        :param refresh_rate: maximum number of redraws per second
+        """
         super().__init__()
-        self.widget = None  # type: nfbSignalViewer
+        self.seconds_to_plot = seconds_to_plot
+        self.pixel_column_count = pixel_column_count
+        self.channels_per_page = channels_per_page
+        self.page = page
+        self.refresh_rate = refresh_rate
+        # Container of _viewer, see _initialize
+        self.widget = None  # type: QWidget
+        self._viewer = None  # type: RawSignalViewer
+        self._frequency = None  # type: float
+        self._ch_names = None  # type: list
+
+        self._visible_channels = None  # type: slice
+        self._decimator = None  # type: MinMaxDecimator
+        self._pending_chunks = None  # type: list
+        self._time_of_the_last_draw = None  # type: float
+
+
+def _append_to_hdf5(output_array, timestamps_array, chunk, timestamps):
+    output_array.append(chunk)
+    timestamps_array.append(timestamps)
+
+
+def _close_hdf5_file(out_file, writer):
+    if writer is not None:
+        writer.stop()
+    out_file.close()
 
 
 class FileOutput(OutputNode):
@@ -441,55 +391,323 @@ class FileOutput(OutputNode):
     def _check_value(self, key, value):
         pass  # TODO: check that value as a string usable as a stream name
 
-    CHANGES_IN_THESE_REQUIRE_RESET = ('stream_name', )
+    # A reset starts the file anew
+    CHANGES_IN_THESE_REQUIRE_RESET = ('output_fname', 'compression',
+                                      'compression_level',
+                                      'use_background_writer',
+                                      'flush_every_x_seconds',
+                                      'max_queued_chunk_count')
 
-    UPSTREAM_CHANGES_IN_THESE_REQUIRE_REINITIALIZATION = ('mne_info', )
-    SAVERS_FOR_UPSTREAM_MUTABLE_OBJECTS = {'mne_info':
-                                           lambda info: (info['sfreq'], ) +
-                                           channel_labels_saver(info)}
+    UPSTREAM_CHANGES_IN_THESE_REQUIRE_REINITIALIZATION = ('mne_info', 'dtype')
+    SAVERS_FOR_UPSTREAM_MUTABLE_OBJECTS = {
+        'mne_info': channel_labels_and_frequency_saver}
+
+    # Dropped chunks are reported at most this often
+    DROPPED_CHUNKS_WARNING_INTERVAL_SECONDS = 5.0
 
     def _reset(self):
         self._should_reinitialize = True
         self.initialize()
 
-    def __init__(self, output_fname='output.h5'):
+    def __init__(self, output_fname='output.h5', use_background_writer=True,
+                 compression=None, compression_level=5,
+                 flush_every_x_seconds=1.0, max_queued_chunk_count=1000):
+        """
+        Saves the input to an hdf5 file: CHANNELS x TIME array 'data',
+        acquisition time of each sample in 'timestamps' and mne_info in the
+        attributes of 'data'.
+
+        :param use_background_writer: if True, chunks are written from
+        a separate thread and the pipeline never waits for the disk.
+        Chunks that do not fit into a queue of max_queued_chunk_count are
+        dropped and counted in dropped_chunk_count.
+        :param compression: None or one of tables.Filters complib values,
+        e.g. 'blosc:lz4'
+
+        """
         super().__init__()
         self.output_fname = output_fname
-        self.out_file = None
+        self.use_background_writer = use_background_writer
+        self.compression = compression
+        self.compression_level = compression_level
+        self.flush_every_x_seconds = flush_every_x_seconds
+        self.max_queued_chunk_count = max_queued_chunk_count
+
+        self.out_file = None  # type: tables.File
+        self.output_array = None  # type: tables.EArray
+        self.timestamps_array = None  # type: tables.EArray
+        self._writer = None  # type: BackgroundChunkWriter
+        self._file_finalizer = None  # type: weakref.finalize
+        self._dtype = None  # type: np.dtype
+        self._frequency = None  # type: float
+        self._unreported_dropped_chunk_count = 0
+        self._time_of_the_last_drop_warning = None  # type: float
+
+    @property
+    def dropped_chunk_count(self):
+        return self._writer.dropped_chunk_count if self._writer else 0
 
     def _initialize(self):
-        if self.out_file:  # for resets
-            self.out_file.close()
+        import tables
+
+        self.close()  # for resets
 
         info = self.traverse_back_and_find('mne_info')
+        self._dtype = np.dtype(self.traverse_back_and_find('dtype'))
+        self._frequency = info['sfreq']
         col_size = info['nchan']
         self.out_file = tables.open_file(self.output_fname, mode='w')
-        atom = tables.Float64Atom()
+        atom = tables.Atom.from_dtype(self._dtype)
+        filters = make_filters(self.compression, self.compression_level)
 
         self.output_array = self.out_file.create_earray(
-            self.out_file.root, 'data', atom, (col_size, 0))
+            self.out_file.root, 'data', atom, (col_size, 0),
+            chunkshape=choose_chunkshape(col_size, self._dtype),
+            filters=filters)
+        self.output_array.attrs.mne_info = info  # pickled by tables
+        self.output_array.attrs.sfreq = self._frequency
+        self.output_array.attrs.ch_names = info['ch_names']
+
+        self.timestamps_array = self.out_file.create_earray(
+            self.out_file.root, 'timestamps', tables.Float64Atom(), (0, ),
+            filters=filters)
+
+        if self.use_background_writer:
+            # Not a bound method: the thread must not keep the node alive
+            self._writer = BackgroundChunkWriter(
+                write_function=partial(_append_to_hdf5, self.output_array,
+                                       self.timestamps_array),
+                flush_function=self.out_file.flush,
+                max_queued_chunk_count=self.max_queued_chunk_count,
+                flush_every_x_seconds=self.flush_every_x_seconds)
+            self._writer.start()
+
+        # Closes the file if close() is never called: when the node is
+        # garbage collected or at exit. tables warns about the files that
+        # are still open from its own atexit hook which has been registered
+        # on import and so runs after ours.
+        self._file_finalizer = weakref.finalize(
+            self, _close_hdf5_file, self.out_file, self._writer)
+        self._file_finalizer.atexit = False
+        atexit.register(self._file_finalizer)
+
+        self._unreported_dropped_chunk_count = 0
+        self._time_of_the_last_drop_warning = None
 
     def _update(self):
-        chunk = self.input_node.output
-        self.output_array.append(chunk)
+        # The upstream array might be changed in place later on, hence a copy
+        chunk = np.array(make_time_dimension_second(self.input_node.output),
+                         dtype=self._dtype)
+        # Acquisition time of each sample based on that of the last one
+        last_sample_time = self.acquisition_time or time.time()
+        sample_count = chunk.shape[1]
+        timestamps = (last_sample_time -
+                      np.arange(sample_count - 1, -1, -1) / self._frequency)
+
+        if self._writer is not None:
+            if not self._writer.put(chunk, timestamps):
+                self._on_chunk_dropped()
+            if self.metrics is not None:
+                self.metrics.queue_depth = self._writer.queued_chunk_count
+        else:
+            _append_to_hdf5(self.output_array, self.timestamps_array,
+                            chunk, timestamps)
+
+    def _on_chunk_dropped(self):
+        if self.metrics is not None:
+            self.metrics.dropped_chunk_count += 1
+        self._unreported_dropped_chunk_count += 1
+
+        current_time = time.time()
+        if (self._time_of_the_last_drop_warning is None or
+                current_time - self._time_of_the_last_drop_warning >=
+                self.DROPPED_CHUNKS_WARNING_INTERVAL_SECONDS):
+            self.logger.warning(
+                'Writer queue is full. {} chunk(s) dropped since the last'
+                ' warning, {} in total.'.format(
+                    self._unreported_dropped_chunk_count,
+                    self.dropped_chunk_count))
+            self._unreported_dropped_chunk_count = 0
+            self._time_of_the_last_drop_warning = current_time
+
+    def close(self):
+        """Writes whatever has been queued and closes the file"""
+        if self._file_finalizer is not None:
+            atexit.unregister(self._file_finalizer)
+            self._file_finalizer()  # does nothing if called before
+            self._file_finalizer = None
+        self._writer = None
+        self.out_file = None
+
+    def __del__(self):
+        self.close()
 
 
 class TorchOutput(OutputNode):
+    """
+    Runs a torch model on a sliding window of the input.
+
+    The last window_length seconds of the input are kept in a ring buffer.
+    Every batch_every_x_chunks chunks the window is copied into
+    a preallocated 1 x CHANNELS x TIME float32 tensor and model is applied to
+    it in torch.inference_mode on a separate thread. The latest prediction
+    is published as output. If the model is still busy with the previous
+    window, the current one is skipped so that the pipeline never waits.
+
+    If model is None, output is the input chunk as a tensor.
 
-    CHANGES_IN_THESE_REQUIRE_RESET = ()
-    UPSTREAM_CHANGES_IN_THESE_REQUIRE_REINITIALIZATION = ()
+    acquisition_time is that of the last sample of the window behind
+    a prediction, but only on the update that publishes the prediction: it
+    is None while the same prediction stays as output so that its latency is
+    recorded once. prediction_acquisition_time always has it.
+
+    thread_count is passed to torch.set_num_threads on initialization.
+    That setting is process-wide: it applies to every torch model in the
+    process and stays after the node is gone.
+
+    """
+
+    CHANGES_IN_THESE_REQUIRE_RESET = ('model', 'window_length',
+                                      'batch_every_x_chunks', 'thread_count',
+                                      'use_background_thread')
+    UPSTREAM_CHANGES_IN_THESE_REQUIRE_REINITIALIZATION = ('mne_info', )
+    SAVERS_FOR_UPSTREAM_MUTABLE_OBJECTS = {
+        'mne_info': channel_labels_and_frequency_saver}
+
+    def __init__(self, model=None, window_length=1, batch_every_x_chunks=1,
+                 thread_count=None, use_background_thread=True):
+        super().__init__()
+        self.model = model  # type: torch.nn.Module
+        self.window_length = window_length  # seconds
+        self.batch_every_x_chunks = batch_every_x_chunks
+        # torch intra-op threads of the whole process, None to leave as is
+        self.thread_count = thread_count
+        self.use_background_thread = use_background_thread
+
+        self.prediction = None  # type: torch.Tensor
+        # Acquisition time of the last sample of the window behind prediction
+        self.prediction_acquisition_time = None  # type: float
+        self.skipped_window_count = 0
+
+        self._window_buffer = None  # type: RingBuffer
+        self._staging_tensor = None  # type: torch.Tensor
+        self._chunks_since_last_batch = 0
+        self._executor = None  # type: ThreadPoolExecutor
+        self._pending_prediction = None  # type: Future
+        self._pending_acquisition_time = None  # type: float
+        self._prediction_is_new = False
 
     def _on_input_history_invalidation(self):
-        pass
+        if self._window_buffer is not None:
+            self._window_buffer.clear()
+        self._chunks_since_last_batch = 0
 
     def _check_value(self, key, value):
-        pass  # TODO: check that value as a string usable as a stream name
+        if key == 'window_length':
+            if value <= 0:
+                raise ValueError('Window length must be a positive number')
+
+        if key == 'batch_every_x_chunks':
+            if value < 1:
+                raise ValueError('batch_every_x_chunks must be at least 1')
 
     def _reset(self):
-        pass
+        self._should_reinitialize = True
+        self.initialize()
+        output_history_is_no_longer_valid = True
+        return output_history_is_no_longer_valid
 
     def _initialize(self):
-        pass
+        self._shutdown_executor()
+        self.prediction = None
+        self.prediction_acquisition_time = None
+        self.skipped_window_count = 0
+        self._chunks_since_last_batch = 0
+        self._window_buffer = None
+
+        if self.model is None:
+            return
+
+        import torch
+
+        mne_info = self.traverse_back_and_find('mne_info')
+        channel_count = mne_info['nchan']
+        window_sample_count = int(self.window_length * mne_info['sfreq'])
+        self._window_buffer = create_ring_buffer(row_cnt=channel_count,
+                                                 maxlen=window_sample_count)
+        self._staging_tensor = torch.empty(
+            (1, channel_count, window_sample_count), dtype=torch.float32)
+
+        if self.thread_count is not None:
+            # Process-wide, see the class docstring
+            torch.set_num_threads(self.thread_count)
+        self.model.eval()
+
+        if self.use_background_thread:
+            self._executor = ThreadPoolExecutor(max_workers=1)
 
     def _update(self):
-        self.output = torch.from_numpy(self.input_node.output)
+        if self.model is None:
+            import torch
+            self.output = torch.from_numpy(self.input_node.output)
+            return
+
+        self._window_buffer.extend(
+            make_time_dimension_second(self.input_node.output))
+        self._chunks_since_last_batch += 1
+        self._prediction_is_new = False
+
+        self._collect_prediction()
+
+        window_is_full = (self._window_buffer.data.shape[1] ==
+                          self._window_buffer.maxlen)
+        if (window_is_full and
+                self._chunks_since_last_batch >= self.batch_every_x_chunks):
+            self._chunks_since_last_batch = 0
+            self._submit_window()
+
+        self.output = self.prediction
+        # Latency is recorded by update() only when acquisition_time is set,
+        # so a prediction that has already been published does not count
+        # again
+        self.acquisition_time = (self.prediction_acquisition_time
+                                 if self._prediction_is_new else None)
+
+    def _submit_window(self):
+        if self._pending_prediction is not None:
+            # The model has not finished with the previous window
+            self.skipped_window_count += 1
+            return
+
+        self._staging_tensor.numpy()[0] = self._window_buffer.data
+        if self._executor is not None:
+            self._pending_prediction = self._executor.submit(
+                self._predict, self._staging_tensor)
+            self._pending_acquisition_time = self.acquisition_time
+        else:
+            self.prediction = self._predict(self._staging_tensor)
+            self.prediction_acquisition_time = self.acquisition_time
+            self._prediction_is_new = True
+
+    def _collect_prediction(self):
+        if (self._pending_prediction is not None and
+                self._pending_prediction.done()):
+            future, self._pending_prediction = self._pending_prediction, None
+            self.prediction = future.result()
+            self.prediction_acquisition_time = self._pending_acquisition_time
+            self._prediction_is_new = True
+
+    def _predict(self, window):
+        import torch
+        with torch.inference_mode():
+            return self.model(window)
+
+    def close(self):
+        """Stops the worker thread once the prediction in progress is done"""
+        self._shutdown_executor()
+
+    def _shutdown_executor(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self._pending_prediction = None
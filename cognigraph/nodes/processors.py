@@ -1,20 +1,13 @@
-import time
-
 from typing import Tuple
 import math
-
-from vendor.nfb.pynfb.protocols.ssd.topomap_selector_ica import ICADialog
+import contextlib
+from fractions import Fraction
+from copy import deepcopy
+import threading
+from concurrent.futures import ThreadPoolExecutor, CancelledError
 
 import numpy as np
 import mne
-from numpy.linalg import svd
-from scipy.optimize import linprog
-from sklearn.preprocessing import normalize
-from mne.preprocessing import find_outliers
-from mne.minimum_norm import apply_inverse_raw  # , make_inverse_operator
-from mne.minimum_norm import make_inverse_operator as mne_make_inverse_operator
-from mne.beamformer import apply_lcmv_raw
-from ..helpers.make_lcmv import make_lcmv
 
 from .node import ProcessorNode
 from ..helpers.matrix_functions import (make_time_dimension_second,
@@ -22,21 +15,39 @@ from ..helpers.matrix_functions import (make_time_dimension_second,
                                         last_sample)
 from ..helpers.inverse_model import (get_default_forward_file,
                                      get_clean_forward,
-                                     make_inverse_operator,
-                                     matrix_from_inverse_operator)
-
-from ..helpers.pynfb import (pynfb_ndarray_function_wrapper,
-                             ExponentialMatrixSmoother)
-from ..helpers.channels import channel_labels_saver
+                                     get_inverse_model_matrix_and_decomposition,
+                                     make_inverse_operator_decomposition,
+                                     pick_columns_from_matrix)
+
+from ..helpers.filters import butter_sos, SOSFilter, ExponentialSmoother
+from ..helpers.envelope import (CFIRFilter, ExponentialSmoothingEnvelope,
+                                ExponentialRMSEnvelope, CFIREnvelope)
+from ..helpers.connectivity import (ConnectivityEstimator,
+                                    SUPPORTED_METHODS as
+                                    SUPPORTED_CONNECTIVITY_METHODS)
+from ..helpers.spectrum import (WindowedPSD, make_band_matrix,
+                                SUPPORTED_TAPERS)
+from ..helpers.ring_buffer import create_ring_buffer
+from ..helpers.decimation import PolyphaseResampler
+from ..helpers.roi import (read_parcellation, ROIReducer,
+                           SUPPORTED_METHODS as SUPPORTED_ROI_METHODS)
+from ..helpers.ica import (fit_ica, find_artifact_components,
+                           make_rejection_matrix,
+                           SUPPORTED_METHODS as SUPPORTED_ICA_METHODS)
+from ..helpers.asr import calibrate_asr, ASRFilter
+from ..helpers.channels import channel_labels_and_frequency_saver
 from ..helpers.aux_tools import nostdout
-from .. import TIME_AXIS
-from vendor.nfb.pynfb.signal_processing import filters
+from .. import TIME_AXIS, DTYPE
+
+# sklearn, scipy.optimize, picard and the numba-compiled make_lcmv take
+# seconds to import, so the nodes that need them import them on first use.
 
 
 class Preprocessing(ProcessorNode):
     CHANGES_IN_THESE_REQUIRE_RESET = ('collect_for_x_seconds', )
     UPSTREAM_CHANGES_IN_THESE_REQUIRE_REINITIALIZATION = ('mne_info', )
-    SAVERS_FOR_UPSTREAM_MUTABLE_OBJECTS = {'mne_info': channel_labels_saver}
+    SAVERS_FOR_UPSTREAM_MUTABLE_OBJECTS = {
+        'mne_info': channel_labels_and_frequency_saver}
 
     def __init__(self, collect_for_x_seconds: int=60):
         super().__init__()
@@ -69,6 +80,7 @@ class Preprocessing(ProcessorNode):
 
         elif not self._enough_collected:  # We just got enough samples
             self._enough_collected = True
+            from mne.preprocessing import find_outliers
             standard_deviations = self._calculate_standard_deviations()
             self._bad_channel_indices = find_outliers(standard_deviations)
             if any(self._bad_channel_indices):
@@ -122,14 +134,24 @@ class Preprocessing(ProcessorNode):
 
 
 class InverseModel(ProcessorNode):
+    """
+    Applies a linear inverse model to the sensor data and outputs one row per
+    source. If parcellation is set (see ROIAggregator), outputs one row per
+    ROI instead: for the linear roi_methods the reduction is multiplied into
+    the inverse model matrix, so the source time courses are never computed.
+
+    """
     SUPPORTED_METHODS = ['MNE', 'dSPM', 'sLORETA']
     UPSTREAM_CHANGES_IN_THESE_REQUIRE_REINITIALIZATION = ('mne_info', )
     CHANGES_IN_THESE_REQUIRE_RESET = ('mne_inverse_model_file_path',
                                       'mne_forward_model_file_path',
-                                      'snr', 'method')
-    SAVERS_FOR_UPSTREAM_MUTABLE_OBJECTS = {'mne_info': channel_labels_saver}
+                                      'snr', 'method', 'parcellation',
+                                      'roi_method', 'subjects_dir')
+    SAVERS_FOR_UPSTREAM_MUTABLE_OBJECTS = {
+        'mne_info': channel_labels_and_frequency_saver}
 
-    def __init__(self, forward_model_path=None, snr=1.0, method='MNE'):
+    def __init__(self, forward_model_path=None, snr=1.0, method='MNE',
+                 parcellation=None, roi_method='mean', subjects_dir=None):
         super().__init__()
 
         self.snr = snr
@@ -141,9 +163,36 @@ class InverseModel(ProcessorNode):
         self._inverse_model_matrix = None
         self.method = method
 
+        self.parcellation = parcellation
+        self.roi_method = roi_method
+        self.subjects_dir = subjects_dir
+        self._roi_reducer = None  # type: ROIReducer
+        # _inverse_model_matrix with the ROI reduction multiplied in and the
+        # matrix it was computed from
+        self._fused_matrix = None  # type: np.ndarray
+        self._fused_matrix_source = None  # type: np.ndarray
+
+        # Makes the matrices for other values of snr and method (see _reset).
+        # None while it is being built in the background.
+        self._inverse_operator_decomposition = None  # type: InverseOperatorDecomposition
+        self._initialized_with_forward_model_file_path = None  # type: str
+        self._initialized_with_roi_settings = None  # type: tuple
+
+        # Names of the channels that correspond to the columns of
+        # _inverse_model_matrix
+        self._inverse_model_matrix_ch_names = None  # type: list
+
+        # When bad channels change, the new matrix is computed in the
+        # background (see _on_bad_channels_change). The future returns
+        # (matrix, decomposition).
+        self._executor = None  # type: ThreadPoolExecutor
+        self._pending_inverse_model_matrix = None  # type: Future
+        self._pending_inverse_model_matrix_ch_names = None  # type: list
+
     def _initialize(self):
+        self.close()  # for reinitializations
+
         mne_info = self.traverse_back_and_find('mne_info')
-        self._bad_channels = mne_info['bads']
 
         if self._user_provided_forward_model_file_path is None:
             self._default_forward_model_file_path =\
@@ -152,28 +201,49 @@ class InverseModel(ProcessorNode):
         self.fwd, missing_ch_names = get_clean_forward(
             self.mne_forward_model_file_path, mne_info)
         mne_info['bads'] = list(set(mne_info['bads'] + missing_ch_names))
+        self._bad_channels = list(mne_info['bads'])
 
-        inverse_operator = make_inverse_operator(self.fwd, mne_info)
-        self._inverse_model_matrix = matrix_from_inverse_operator(
-            inverse_operator=inverse_operator, mne_info=mne_info,
-            snr=self.snr, method=self.method)
+        self._initialized_with_forward_model_file_path =\
+            self.mne_forward_model_file_path
+        self._inverse_model_matrix, self._inverse_operator_decomposition =\
+            get_inverse_model_matrix_and_decomposition(
+                self.mne_forward_model_file_path, self.fwd, mne_info,
+                snr=self.snr, method=self.method)
+        self._inverse_model_matrix_ch_names = self._good_channel_names(
+            mne_info)
+        if self._inverse_operator_decomposition is None:
+            # The matrix has been read from the cache
+            self._pending_inverse_model_matrix = self._submit(
+                self._decompose, self._inverse_model_matrix,
+                deepcopy(self.fwd), deepcopy(mne_info))
+            self._pending_inverse_model_matrix_ch_names =\
+                self._inverse_model_matrix_ch_names
+
+        self._initialized_with_roi_settings = self._roi_settings
+        self._fused_matrix = self._fused_matrix_source = None
+        if self.parcellation is None:
+            self._roi_reducer = None
+            channel_count = self.fwd['nsource']
+            channel_labels = ['vertex #{}'.format(i + 1)
+                              for i in range(channel_count)]
+        else:
+            src = self.fwd['src']
+            self._roi_reducer = ROIReducer(
+                read_parcellation(src, self.parcellation, self.subjects_dir),
+                src, method=self.roi_method,
+                inverse_model_matrix=self._inverse_model_matrix)
+            channel_labels = self._roi_reducer.roi_names
 
         frequency = mne_info['sfreq']
-        # channel_count = self._inverse_model_matrix.shape[0]
-        channel_count = self.fwd['nsource']
-        channel_labels = ['vertex #{}'.format(i + 1)
-                          for i in range(channel_count)]
         self.mne_info = mne.create_info(channel_labels, frequency)
 
     def _update(self):
         mne_info = self.traverse_back_and_find('mne_info')
         bads = mne_info['bads']
         if bads != self._bad_channels:
-            inverse_operator = make_inverse_operator(self.fwd, mne_info)
-            self._inverse_model_matrix = matrix_from_inverse_operator(
-                inverse_operator=inverse_operator, mne_info=mne_info,
-                snr=self.snr, method=self.method)
-            self._bad_channels = bads
+            self._on_bad_channels_change(mne_info)
+            self._bad_channels = list(bads)
+        self._swap_in_pending_inverse_model_matrix()
 
         input_array = self.input_node.output
         raw_array = mne.io.RawArray(input_array, mne_info, verbose='ERROR')
@@ -181,6 +251,83 @@ class InverseModel(ProcessorNode):
         data = raw_array.get_data()
         self.output = self._apply_inverse_model_matrix(data)
 
+    def _on_bad_channels_change(self, mne_info):
+        """
+        Recomputing the matrix takes seconds, so it is done in the
+        background. Meanwhile the current matrix is used without the columns
+        of the channels that have become bad. Channels that have become good
+        get zero weights until the new matrix is swapped in.
+
+        """
+        good_ch_names = self._good_channel_names(mne_info)
+        self._inverse_model_matrix = pick_columns_from_matrix(
+            self._inverse_model_matrix, good_ch_names,
+            self._inverse_model_matrix_ch_names)
+        self._inverse_model_matrix_ch_names = good_ch_names
+        self._compute_inverse_model_matrix_in_background(mne_info)
+
+    def _compute_inverse_model_matrix_in_background(self, mne_info):
+        self._inverse_operator_decomposition = None
+        self._discard_pending_inverse_model_matrix()
+        # Copies, because both can change while the matrix is being computed
+        self._pending_inverse_model_matrix = self._submit(
+            self._compute_inverse_model_matrix,
+            self.mne_forward_model_file_path, deepcopy(self.fwd),
+            deepcopy(mne_info), self.snr, self.method)
+        self._pending_inverse_model_matrix_ch_names =\
+            self._good_channel_names(mne_info)
+
+    def _submit(self, function, *args):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        return self._executor.submit(function, *args)
+
+    @staticmethod
+    def _compute_inverse_model_matrix(forward_model_path, fwd, mne_info,
+                                      snr, method):
+        inverse_model_matrix, decomposition =\
+            get_inverse_model_matrix_and_decomposition(
+                forward_model_path, fwd, mne_info, snr=snr, method=method)
+        if decomposition is None:
+            # The matrix has been read from the cache
+            decomposition = make_inverse_operator_decomposition(
+                fwd, mne_info)
+        return inverse_model_matrix, decomposition
+
+    @staticmethod
+    def _decompose(inverse_model_matrix, fwd, mne_info):
+        return (inverse_model_matrix,
+                make_inverse_operator_decomposition(fwd, mne_info))
+
+    def _swap_in_pending_inverse_model_matrix(self):
+        future = self._pending_inverse_model_matrix
+        if future is None or not future.done():
+            return
+        self._pending_inverse_model_matrix = None
+        # Re-raises any exception from the background thread
+        self._inverse_model_matrix, self._inverse_operator_decomposition =\
+            future.result()
+        self._inverse_model_matrix_ch_names =\
+            self._pending_inverse_model_matrix_ch_names
+
+    def _discard_pending_inverse_model_matrix(self):
+        if self._pending_inverse_model_matrix is not None:
+            self._pending_inverse_model_matrix.cancel()
+            self._pending_inverse_model_matrix = None
+
+    def close(self):
+        """Discards the matrix being computed and stops the worker thread"""
+        self._discard_pending_inverse_model_matrix()
+        if self._executor is not None:
+            # A computation that has already started is not waited for
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    @staticmethod
+    def _good_channel_names(mne_info):
+        goods = mne.pick_types(mne_info, eeg=True, meg=False, exclude='bads')
+        return [mne_info['ch_names'][i] for i in goods]
+
     def _on_input_history_invalidation(self):
         # The methods implemented in this node do not rely on past inputs
         pass
@@ -197,9 +344,36 @@ class InverseModel(ProcessorNode):
                 raise ValueError(
                     'snr (signal-to-noise ratio) must be a positive number.')
 
+        if key == 'roi_method':
+            if value not in SUPPORTED_ROI_METHODS:
+                raise ValueError(
+                    'ROI method {} is not supported.'.format(value) +
+                    ' Use one of: {}'.format(SUPPORTED_ROI_METHODS))
+
+    @property
+    def _roi_settings(self) -> tuple:
+        return self.parcellation, self.roi_method, self.subjects_dir
+
     def _reset(self):
-        self._should_reinitialize = True
-        self.initialize()
+        if (self._initialized_with_forward_model_file_path ==
+                self.mne_forward_model_file_path and
+                self._initialized_with_roi_settings == self._roi_settings):
+            # Only snr or method have changed, so the SVD can be reused
+            mne_info = self.traverse_back_and_find('mne_info')
+            if self._inverse_operator_decomposition is None:
+                # It is still being built: the current matrix is used until
+                # the background thread has built it again with the new
+                # parameters
+                self._compute_inverse_model_matrix_in_background(mne_info)
+            else:
+                self._inverse_model_matrix =\
+                    self._inverse_operator_decomposition.matrix(
+                        snr=self.snr, method=self.method)
+                self._inverse_model_matrix_ch_names =\
+                    self._good_channel_names(mne_info)
+        else:
+            self._should_reinitialize = True
+            self.initialize()
         output_history_is_no_longer_valid = True
         return output_history_is_no_longer_valid
 
@@ -213,36 +387,117 @@ class InverseModel(ProcessorNode):
         # This setter is for public use, hence the "user_provided"
         self._user_provided_forward_model_file_path = value
 
+    @property
+    def inverse_model_matrix(self) -> np.ndarray:
+        """VERTICES x CHANNELS, the channels being the good ones"""
+        return self._inverse_model_matrix
+
     def _apply_inverse_model_matrix(self, input_array: np.ndarray):
         W = self._inverse_model_matrix  # VERTICES x CHANNELS
+        reducer = self._roi_reducer
+        if reducer is not None and reducer.is_linear:
+            # W is replaced rather than changed in place, so it is enough to
+            # compare identities to know when to multiply it in again
+            if self._fused_matrix_source is not W:
+                self._fused_matrix = reducer.fuse(W)
+                self._fused_matrix_source = W
+            W = self._fused_matrix  # ROIS x CHANNELS
         output_array = W.dot(make_time_dimension_second(input_array))
+        if reducer is not None and not reducer.is_linear:
+            output_array = reducer.apply(output_array)
         return put_time_dimension_back_from_second(output_array)
 
 
+class Resample(ProcessorNode):
+    """
+    Changes the sampling frequency of the input to frequency, or to the
+    nearest frequency that is a ratio up / down of the input one with
+    down <= MAX_DENOMINATOR. Amplifiers often stream at several kHz while
+    source estimation and feedback need a few hundred Hz, so putting this
+    node first makes every node downstream proportionally cheaper.
+
+    The output mne_info is that of the input with the new sfreq, which
+    makes the nodes downstream reinitialize. The anti-aliasing filter
+    delays the output by group_delay seconds.
+
+    """
+    MAX_DENOMINATOR = 1000
+
+    UPSTREAM_CHANGES_IN_THESE_REQUIRE_REINITIALIZATION = ('mne_info', )
+    CHANGES_IN_THESE_REQUIRE_RESET = ('frequency', )
+    SAVERS_FOR_UPSTREAM_MUTABLE_OBJECTS = {
+        'mne_info': channel_labels_and_frequency_saver}
+
+    def __init__(self, frequency: float=250.0):
+        super().__init__()
+        self.frequency = frequency  # type: float
+        self.mne_info = None  # type: mne.Info
+        self._resampler = None  # type: PolyphaseResampler
+
+    @property
+    def group_delay(self) -> float:
+        if self._resampler is None:
+            return None
+        return self._resampler.group_delay / self.mne_info['sfreq']
+
+    def _initialize(self):
+        input_mne_info = self.traverse_back_and_find('mne_info')
+        input_frequency = input_mne_info['sfreq']
+        ratio = Fraction(self.frequency / input_frequency).limit_denominator(
+            self.MAX_DENOMINATOR)
+        self._resampler = PolyphaseResampler(
+            ratio.numerator, ratio.denominator,
+            channel_count=input_mne_info['nchan'])
+
+        frequency = input_frequency * ratio.numerator / ratio.denominator
+        self.mne_info = deepcopy(input_mne_info)
+        # Newer mne only lets sfreq and lowpass be set while unlocked
+        unlock = getattr(self.mne_info, '_unlock', contextlib.nullcontext)
+        with unlock():
+            self.mne_info['sfreq'] = frequency
+            if self.mne_info['lowpass'] > frequency / 2:
+                self.mne_info['lowpass'] = frequency / 2
+
+    def _update(self):
+        input_array = make_time_dimension_second(self.input_node.output)
+        self.output = put_time_dimension_back_from_second(
+            self._resampler.apply(input_array))
+
+    def _check_value(self, key, value):
+        if key == 'frequency':
+            if value <= 0:
+                raise ValueError('Frequency must be a positive number')
+
+    def _reset(self):
+        self._should_reinitialize = True
+        self.initialize()
+        output_history_is_no_longer_valid = True
+        return output_history_is_no_longer_valid
+
+    def _on_input_history_invalidation(self):
+        self._resampler.reset()
+
+
 class LinearFilter(ProcessorNode):
     UPSTREAM_CHANGES_IN_THESE_REQUIRE_REINITIALIZATION = ('mne_info', )
     CHANGES_IN_THESE_REQUIRE_RESET = ('lower_cutoff', 'upper_cutoff')
     SAVERS_FOR_UPSTREAM_MUTABLE_OBJECTS = {'mne_info':
-                                           lambda info: (info['nchan'], )}
+                                           lambda info: (info['nchan'],
+                                                         info['sfreq'])}
 
     def __init__(self, lower_cutoff, upper_cutoff):
         super().__init__()
         self.lower_cutoff = lower_cutoff
         self.upper_cutoff = upper_cutoff
-        self._linear_filter = None  # type: filters.ButterFilter
+        self._linear_filter = None  # type: SOSFilter
 
     def _initialize(self):
         mne_info = self.traverse_back_and_find('mne_info')
         frequency = mne_info['sfreq']
         channel_count = mne_info['nchan']
-        if not (self.lower_cutoff is None and self.upper_cutoff is None):
-            band = (self.lower_cutoff, self.upper_cutoff)
-
-            self._linear_filter = filters.ButterFilter(
-                band, fs=frequency, n_channels=channel_count)
-
-            self._linear_filter.apply = pynfb_ndarray_function_wrapper(
-                self._linear_filter.apply)
+        sos = butter_sos((self.lower_cutoff, self.upper_cutoff), frequency)
+        if sos is not None:
+            self._linear_filter = SOSFilter(sos, channel_count=channel_count)
         else:
             self._linear_filter = None
 
@@ -287,22 +542,56 @@ class LinearFilter(ProcessorNode):
 
 
 class EnvelopeExtractor(ProcessorNode):
-    def __init__(self, factor=0.9):
+    """
+    Extracts the envelope of a band-passed signal with one of the methods:
+
+    'Exponential smoothing': exponentially smoothed absolute value, factor
+    is the weight of the previous value.
+    'Exponential RMS': square root of the exponentially smoothed square.
+    'cFIR': absolute value of a complex FIR filter approximating the
+    analytic signal in band with a delay of delay seconds. It band-passes
+    the signal itself, so a LinearFilter is not needed before it.
+
+    group_delay is the delay of the envelope in seconds for the current
+    method and settings.
+
+    """
+    def __init__(self, factor=0.9, method='Exponential smoothing',
+                 band=(8, 12), delay=0.05):
         super().__init__()
-        self.method = 'Exponential smoothing'
+        self.method = method
         self.factor = factor
-        self._envelope_extractor = None  # type: ExponentialMatrixSmoother
+        self.band = band
+        self.delay = delay
+        self._envelope_extractor = None  # type: ExponentialSmoothingEnvelope
+        self._frequency = None  # type: float
+
+    @property
+    def group_delay(self) -> float:
+        if self._envelope_extractor is None:
+            return None
+        return self._envelope_extractor.group_delay / self._frequency
 
     def _initialize(self):
-        channel_count = self.traverse_back_and_find('mne_info')['nchan']
-        self._envelope_extractor = ExponentialMatrixSmoother(
-            factor=self.factor, column_count=channel_count)
-        self._envelope_extractor.apply = pynfb_ndarray_function_wrapper(
-            self._envelope_extractor.apply)
+        mne_info = self.traverse_back_and_find('mne_info')
+        channel_count = mne_info['nchan']
+        self._frequency = mne_info['sfreq']
+
+        if self.method == 'cFIR':
+            self._envelope_extractor = CFIREnvelope(
+                self.band, self._frequency,
+                delay=int(round(self.delay * self._frequency)),
+                channel_count=channel_count)
+        elif self.method == 'Exponential RMS':
+            self._envelope_extractor = ExponentialRMSEnvelope(
+                factor=self.factor, channel_count=channel_count)
+        else:
+            self._envelope_extractor = ExponentialSmoothingEnvelope(
+                factor=self.factor, channel_count=channel_count)
 
     def _update(self):
         input = self.input_node.output
-        self.output = self._envelope_extractor.apply(np.abs(input))
+        self.output = self._envelope_extractor.apply(input)
 
     def _check_value(self, key, value):
         if key == 'factor':
@@ -312,9 +601,19 @@ class EnvelopeExtractor(ProcessorNode):
         if key == 'method':
             if value not in self.SUPPORTED_METHODS:
                 raise ValueError(
-                    'Method {} is not supported.' +
+                    'Method {} is not supported.'
                     ' Use one of: {}'.format(value, self.SUPPORTED_METHODS))
 
+        if key == 'band':
+            lower_cutoff, upper_cutoff = value
+            if not 0 < lower_cutoff < upper_cutoff:
+                raise ValueError('Band must have a positive lower cutoff '
+                                 'below its upper cutoff')
+
+        if key == 'delay':
+            if value < 0:
+                raise ValueError('Delay must be a non-negative number')
+
     def _reset(self):
         self._should_reinitialize = True
         self.initialize()
@@ -325,10 +624,408 @@ class EnvelopeExtractor(ProcessorNode):
         self._envelope_extractor.reset()
 
     UPSTREAM_CHANGES_IN_THESE_REQUIRE_REINITIALIZATION = ('mne_info', )
-    CHANGES_IN_THESE_REQUIRE_RESET = ('method', 'factor')
-    SUPPORTED_METHODS = ('Exponential smoothing', )
+    CHANGES_IN_THESE_REQUIRE_RESET = ('method', 'factor', 'band', 'delay')
+    SUPPORTED_METHODS = ('Exponential smoothing', 'Exponential RMS', 'cFIR')
     SAVERS_FOR_UPSTREAM_MUTABLE_OBJECTS = {'mne_info':
-                                           lambda info: (info['nchan'],)}
+                                           lambda info: (info['nchan'],
+                                                         info['sfreq'])}
+
+
+class FilterBank(ProcessorNode):
+    """
+    Band-pass filters the input in each of the bands and extracts the
+    envelopes in one pass instead of a LinearFilter -> EnvelopeExtractor
+    chain per band.
+
+    The output has a row for every band and channel, band after band: row
+    i * channel_count + j is channel j in bands[i], so that the downstream
+    nodes get the usual CHANNELS x TIME array. band_output is the same data
+    as a BANDS x CHANNELS x TIME view. With average_channels the output is
+    BANDS x TIME: the mean over the channels, e.g. over the vertices of an
+    ROI.
+
+    output_type 'envelope' smoothes the absolute value of the filtered
+    signal like EnvelopeExtractor, 'power' smoothes its square.
+
+    """
+    SUPPORTED_OUTPUT_TYPES = ('envelope', 'power')
+    DEFAULT_BANDS = ((1, 4), (4, 8), (8, 12), (12, 30), (30, 45))
+
+    UPSTREAM_CHANGES_IN_THESE_REQUIRE_REINITIALIZATION = ('mne_info', )
+    CHANGES_IN_THESE_REQUIRE_RESET = ('bands', 'factor', 'output_type',
+                                      'average_channels')
+    SAVERS_FOR_UPSTREAM_MUTABLE_OBJECTS = {
+        'mne_info': channel_labels_and_frequency_saver}
+
+    def __init__(self, bands=DEFAULT_BANDS, factor=0.9,
+                 output_type='envelope', average_channels=False):
+        super().__init__()
+        self.bands = tuple(tuple(band) for band in bands)
+        self.factor = factor
+        self.output_type = output_type
+        self.average_channels = average_channels
+        self.mne_info = None
+
+        self._band_filters = None  # type: list
+        # Smoothes all bands and channels at once
+        self._smoother = None  # type: ExponentialSmoother
+        self._channel_count = None  # type: int
+
+    @property
+    def band_names(self):
+        return ['{:g}-{:g} Hz'.format(*band) for band in self.bands]
+
+    @property
+    def band_output(self) -> np.ndarray:
+        """The last output as a BANDS x CHANNELS x TIME (or BANDS x TIME with
+        average_channels) array"""
+        if self.output is None or self.average_channels:
+            return self.output
+        return self.output.reshape(
+            len(self.bands), self._channel_count, -1)
+
+    def _initialize(self):
+        mne_info = self.traverse_back_and_find('mne_info')
+        frequency = mne_info['sfreq']
+        self._channel_count = mne_info['nchan']
+
+        self._band_filters = [
+            SOSFilter(butter_sos(band, frequency),
+                      channel_count=self._channel_count)
+            for band in self.bands]
+        output_row_count = len(self.bands) * self._channel_count
+        self._smoother = ExponentialSmoother(self.factor,
+                                             channel_count=output_row_count)
+
+        if self.average_channels:
+            channel_labels = self.band_names
+        else:
+            channel_labels = ['{} {}'.format(ch_name, band_name)
+                              for band_name in self.band_names
+                              for ch_name in mne_info['ch_names']]
+        self.mne_info = mne.create_info(channel_labels, frequency)
+
+    def _update(self):
+        input_array = self.input_node.output
+        channel_count = self._channel_count
+        filtered = np.empty(
+            (len(self.bands) * channel_count, input_array.shape[TIME_AXIS]),
+            dtype=DTYPE)
+        for i, band_filter in enumerate(self._band_filters):
+            filtered[i * channel_count:(i + 1) * channel_count, :] =\
+                band_filter.apply(input_array)
+
+        if self.output_type == 'power':
+            np.square(filtered, out=filtered)
+        else:
+            np.abs(filtered, out=filtered)
+        envelopes = self._smoother.apply(filtered)
+
+        if self.average_channels:
+            self.output = envelopes.reshape(
+                len(self.bands), channel_count, -1).mean(axis=1)
+        else:
+            self.output = envelopes
+
+    def _check_value(self, key, value):
+        if key == 'bands':
+            if len(value) == 0:
+                raise ValueError('At least one band is required')
+            for lower_cutoff, upper_cutoff in value:
+                if not 0 < lower_cutoff < upper_cutoff:
+                    raise ValueError(
+                        'Band ({}, {}) must have a positive lower cutoff '
+                        'below its upper cutoff'.format(lower_cutoff,
+                                                        upper_cutoff))
+
+        if key == 'factor':
+            if value <= 0 or value >= 1:
+                raise ValueError('Factor must be a number between 0 and 1')
+
+        if key == 'output_type':
+            if value not in self.SUPPORTED_OUTPUT_TYPES:
+                raise ValueError(
+                    'Output type {} is not supported. Use one of: {}'.format(
+                        value, self.SUPPORTED_OUTPUT_TYPES))
+
+    def _reset(self):
+        self._should_reinitialize = True
+        self.initialize()
+        output_history_is_no_longer_valid = True
+        return output_history_is_no_longer_valid
+
+    def _on_input_history_invalidation(self):
+        for band_filter in self._band_filters:
+            band_filter.reset()
+        self._smoother.reset()
+
+
+class SpectralPower(ProcessorNode):
+    """
+    Power spectra of the input in sliding windows of window_length seconds
+    that start hop seconds apart, with a Hann taper (Welch's method) or with
+    DPSS tapers (the multitaper method, 2 * time_bandwidth - 1 tapers).
+
+    Every window gives one output sample, so the output sampling frequency
+    is 1 / hop and a chunk can produce no samples at all, or several. Each
+    output row is a channel in one of the bands: the power in the band
+    (the integral of the power spectral density) with row i * channel_count
+    + j for channel j in bands[i], as in FilterBank. With bands set to None
+    the rows are frequency bins instead, with power spectral densities.
+
+    """
+    SUPPORTED_TAPERS = SUPPORTED_TAPERS
+    DEFAULT_BANDS = FilterBank.DEFAULT_BANDS
+
+    UPSTREAM_CHANGES_IN_THESE_REQUIRE_REINITIALIZATION = ('mne_info', )
+    CHANGES_IN_THESE_REQUIRE_RESET = ('window_length', 'hop', 'taper',
+                                      'time_bandwidth', 'bands')
+    SAVERS_FOR_UPSTREAM_MUTABLE_OBJECTS = {
+        'mne_info': channel_labels_and_frequency_saver}
+
+    def __init__(self, window_length: float=1.0, hop: float=0.1,
+                 taper: str='hann', time_bandwidth: float=4.0,
+                 bands=DEFAULT_BANDS):
+        super().__init__()
+        self.window_length = window_length  # type: float
+        self.hop = hop  # type: float
+        self.taper = taper  # type: str
+        self.time_bandwidth = time_bandwidth  # type: float
+        if bands is not None:
+            bands = tuple(tuple(band) for band in bands)
+        self.bands = bands
+        self.mne_info = None
+
+        self._channel_count = None  # type: int
+        self._window_sample_count = None  # type: int
+        self._hop_sample_count = None  # type: int
+        self._psd = None  # type: WindowedPSD
+        self._band_matrix = None  # type: np.ndarray
+        self._buffer = None  # type: RingBuffer
+        self._piece_sample_count = None  # type: int
+        # Index of the first sample of the next window, see RingBuffer.windows
+        self._next_window_start = 0
+
+    @property
+    def frequencies(self) -> np.ndarray:
+        """Frequencies of the bins of the spectra"""
+        if self._psd is None:
+            return None
+        return self._psd.frequencies
+
+    @property
+    def band_output(self) -> np.ndarray:
+        """The last output as a BANDS (or FREQUENCIES) x CHANNELS x TIME
+        array"""
+        if self.output is None:
+            return None
+        output = make_time_dimension_second(self.output)
+        return output.reshape(-1, self._channel_count, output.shape[1])
+
+    def _initialize(self):
+        mne_info = self.traverse_back_and_find('mne_info')
+        frequency = mne_info['sfreq']
+        self._channel_count = mne_info['nchan']
+        self._window_sample_count = int(round(self.window_length * frequency))
+        self._hop_sample_count = max(1, int(round(self.hop * frequency)))
+
+        self._psd = WindowedPSD(self._window_sample_count, frequency,
+                                taper=self.taper,
+                                time_bandwidth=self.time_bandwidth)
+        if self.bands is None:
+            self._band_matrix = None
+            row_names = ['{:g} Hz'.format(f) for f in self._psd.frequencies]
+        else:
+            self._band_matrix = make_band_matrix(self._psd.frequencies,
+                                                 self.bands)
+            row_names = ['{:g}-{:g} Hz'.format(*band) for band in self.bands]
+
+        # Chunks are put into the buffer in pieces of at most
+        # _piece_sample_count samples, so that no window is overwritten
+        # before it is read
+        buffer_sample_count = (2 * self._window_sample_count +
+                               self._hop_sample_count)
+        self._piece_sample_count = (buffer_sample_count -
+                                    self._window_sample_count)
+        self._buffer = create_ring_buffer(row_cnt=self._channel_count,
+                                          maxlen=buffer_sample_count)
+        self._next_window_start = 0
+
+        channel_labels = ['{} {}'.format(ch_name, row_name)
+                          for row_name in row_names
+                          for ch_name in mne_info['ch_names']]
+        self.mne_info = mne.create_info(
+            channel_labels, frequency / self._hop_sample_count)
+
+    def _update(self):
+        input_array = make_time_dimension_second(self.input_node.output)
+        input_array = input_array.astype(DTYPE, copy=False)
+
+        powers = list()
+        for start in range(0, input_array.shape[1], self._piece_sample_count):
+            self._buffer.extend(
+                input_array[:, start:start + self._piece_sample_count])
+            windows, self._next_window_start = self._buffer.windows(
+                self._window_sample_count, self._hop_sample_count,
+                first_window_start=self._next_window_start)
+            if windows.shape[1] > 0:
+                powers.append(self._psd.apply(windows))
+        if powers:
+            # CHANNELS x WINDOWS x FREQUENCIES
+            power = np.concatenate(powers, axis=1)
+        else:
+            power = np.empty((self._channel_count, 0,
+                              len(self._psd.frequencies)), dtype=DTYPE)
+        if self._band_matrix is not None:
+            power = power.dot(self._band_matrix)  # CHANNELS x WINDOWS x BANDS
+
+        # Bands (or bins) after bands, channels after channels within them
+        row_count = power.shape[2] * power.shape[0]
+        output = power.transpose(2, 0, 1).reshape(row_count, power.shape[1])
+        self.output = put_time_dimension_back_from_second(output)
+
+    def _check_value(self, key, value):
+        if key in ('window_length', 'hop', 'time_bandwidth'):
+            if value <= 0:
+                raise ValueError('{} must be positive'.format(key))
+
+        if key == 'taper':
+            if value not in self.SUPPORTED_TAPERS:
+                raise ValueError(
+                    'Taper {} is not supported. Use one of: {}'.format(
+                        value, self.SUPPORTED_TAPERS))
+
+        if key == 'bands' and value is not None:
+            if len(value) == 0:
+                raise ValueError('At least one band is required')
+            for lower_cutoff, upper_cutoff in value:
+                if not 0 <= lower_cutoff < upper_cutoff:
+                    raise ValueError(
+                        'Band ({}, {}) must have a non-negative lower cutoff '
+                        'below its upper cutoff'.format(lower_cutoff,
+                                                        upper_cutoff))
+
+    def _reset(self):
+        self._should_reinitialize = True
+        self.initialize()
+        output_history_is_no_longer_valid = True
+        return output_history_is_no_longer_valid
+
+    def _on_input_history_invalidation(self):
+        self._buffer.clear()
+        self._next_window_start = 0
+
+
+class Connectivity(ProcessorNode):
+    """
+    Connectivity between pairs of input channels, e.g. the ROIs of an
+    InverseModel with a parcellation or of an ROIAggregator, in a band.
+    See ConnectivityEstimator for the methods. The band-limited analytic
+    signals come from a cFIR filter (see CFIRFilter) with a delay of
+    delay seconds, and the window is exponential with a time constant of
+    window_length seconds.
+
+    pairs is a list of channel name (or index) pairs. By default it is all
+    the pairs, which for thousands of channels is better avoided. There is
+    one output row per pair, labelled 'first-second', and like MCE the value
+    after the last sample of a chunk is repeated over the whole chunk.
+
+    """
+    SUPPORTED_METHODS = SUPPORTED_CONNECTIVITY_METHODS
+
+    UPSTREAM_CHANGES_IN_THESE_REQUIRE_REINITIALIZATION = ('mne_info', )
+    CHANGES_IN_THESE_REQUIRE_RESET = ('method', 'band', 'delay',
+                                      'window_length', 'pairs')
+    SAVERS_FOR_UPSTREAM_MUTABLE_OBJECTS = {
+        'mne_info': channel_labels_and_frequency_saver}
+
+    def __init__(self, method: str='PLV', band=(8, 12), delay: float=0.05,
+                 window_length: float=1.0, pairs: list=None):
+        super().__init__()
+        self.method = method  # type: str
+        self.band = band
+        self.delay = delay  # type: float
+        self.window_length = window_length  # type: float
+        self.pairs = pairs  # type: list
+        self.mne_info = None
+
+        self._filter = None  # type: CFIRFilter
+        self._estimator = None  # type: ConnectivityEstimator
+
+    def _initialize(self):
+        mne_info = self.traverse_back_and_find('mne_info')
+        frequency = mne_info['sfreq']
+        ch_names = mne_info['ch_names']
+        channel_count = mne_info['nchan']
+
+        delay = int(round(self.delay * frequency))
+        self._filter = CFIRFilter(self.band, frequency, delay, channel_count)
+
+        if self.pairs is None:
+            pairs = None
+        else:
+            pairs = [[ch_names.index(channel)
+                      if isinstance(channel, str) else channel
+                      for channel in pair] for pair in self.pairs]
+        factor = math.exp(-1 / (self.window_length * frequency))
+        self._estimator = ConnectivityEstimator(
+            self.method, channel_count, factor, pairs=pairs)
+
+        channel_labels = ['{}-{}'.format(ch_names[first], ch_names[second])
+                          for first, second in self._estimator.pairs]
+        self.mne_info = mne.create_info(channel_labels, frequency)
+
+    def _update(self):
+        input_array = make_time_dimension_second(self.input_node.output)
+        sample_count = input_array.shape[1]
+        if sample_count == 0:
+            self.output = np.empty((len(self._estimator.pairs), 0),
+                                   dtype=DTYPE)
+        else:
+            values = self._estimator.apply(self._filter.apply(input_array))
+            self.output = np.repeat(values[:, np.newaxis], sample_count,
+                                    axis=1)
+        self.output = put_time_dimension_back_from_second(self.output)
+
+    def _check_value(self, key, value):
+        if key == 'method':
+            if value not in self.SUPPORTED_METHODS:
+                raise ValueError(
+                    'Method {} is not supported.'
+                    ' Use one of: {}'.format(value, self.SUPPORTED_METHODS))
+
+        if key == 'band':
+            lower_cutoff, upper_cutoff = value
+            if not 0 < lower_cutoff < upper_cutoff:
+                raise ValueError('Band must have a positive lower cutoff '
+                                 'below its upper cutoff')
+
+        if key == 'delay':
+            if value < 0:
+                raise ValueError('Delay must be a non-negative number')
+
+        if key == 'window_length':
+            if value <= 0:
+                raise ValueError('Window length must be a positive number')
+
+        if key == 'pairs' and value is not None:
+            if len(value) == 0:
+                raise ValueError('At least one pair is required')
+            for pair in value:
+                if len(pair) != 2 or pair[0] == pair[1]:
+                    raise ValueError(
+                        'Pair {} must consist of two different '
+                        'channels'.format(pair))
+
+    def _reset(self):
+        self._should_reinitialize = True
+        self.initialize()
+        output_history_is_no_longer_valid = True
+        return output_history_is_no_longer_valid
+
+    def _on_input_history_invalidation(self):
+        self._filter.reset()
+        self._estimator.reset()
 
 
 class Beamformer(ProcessorNode):
@@ -339,7 +1036,8 @@ class Beamformer(ProcessorNode):
                                       'fixed_orientation',
                                       'mne_forward_model_file_path')
 
-    SAVERS_FOR_UPSTREAM_MUTABLE_OBJECTS = {'mne_info': channel_labels_saver}
+    SAVERS_FOR_UPSTREAM_MUTABLE_OBJECTS = {
+        'mne_info': channel_labels_and_frequency_saver}
 
     def __init__(self, snr: float=1.0, output_type: str='power',
                  is_adaptive: bool=False, fixed_orientation: bool=True,
@@ -406,6 +1104,7 @@ class Beamformer(ProcessorNode):
         self.fwd_surf = mne.convert_forward_solution(
                     fwd, surf_ori=True, force_fixed=False)
         if not self.is_adaptive:
+            from ..helpers.make_lcmv import make_lcmv
             self._filters = make_lcmv(
                     info=self._mne_info, forward=self.fwd_surf,
                     data_cov=self._Rxx, reg=0.05, pick_ori='max-power',
@@ -414,40 +1113,32 @@ class Beamformer(ProcessorNode):
             self._filters = None
 
     def _update(self):
-        t1 = time.time()
+        from mne.beamformer import apply_lcmv_raw
+        from ..helpers.make_lcmv import make_lcmv
+
+        # Timings of the whole update are in self.metrics, see
+        # Pipeline.enable_metrics
         input_array = self.input_node.output
         raw_array = mne.io.RawArray(
             input_array, self._mne_info, verbose='ERROR')
 
         raw_array.pick_types(eeg=True, meg=False, stim=False, exclude='bads')
         raw_array.set_eeg_reference(ref_channels='average', projection=True)
-        t2 = time.time()
-        self.logger.debug('Prepare arrays in {:.1f} ms'.format(
-                    (t2 - t1) * 1000))
 
         if self.is_adaptive:
             self._update_covariance_matrix(input_array)
-            t1 = time.time()
             self._filters = make_lcmv(info=self._mne_info,
                                       forward=self.fwd_surf,
                                       data_cov=self._Rxx, reg=0.5,
                                       pick_ori='max-power',
                                       weight_norm='unit-noise-gain',
                                       reduce_rank=False)
-            t2 = time.time()
-            self.logger.debug('Assembled lcmv instance in {:.1f} ms'.format(
-                        (t2 - t1) * 1000))
 
         self._filters['source_nn'] = []
-        t1 = time.time()
         stc = apply_lcmv_raw(raw=raw_array, filters=self._filters,
                              max_ori_out='signed')
-        t2 = time.time()
-        self.logger.debug('Applied lcmv inverse in {:.1f} ms'.format(
-                    (t2 - t1) * 1000))
 
         output = stc.data
-        t1 = time.time()
         if self.fixed_orientation is True:
             if self.output_type == 'power':
                 output = output ** 2
@@ -459,10 +1150,6 @@ class Beamformer(ProcessorNode):
                 output = np.sqrt(output)
 
         self.output = output
-        t2 = time.time()
-        self.logger.debug(
-                'Finalized in {:.1f} ms'.format(
-                    (t2 - t1) * 1000))
 
     @property
     def mne_forward_model_file_path(self):
@@ -511,10 +1198,7 @@ class Beamformer(ProcessorNode):
                     'Beamformer type (adaptive vs nonadaptive) is not set')
 
     def _update_covariance_matrix(self, input_array):
-        t1 = time.time()
         alpha = self._forgetting_factor_per_sample
-        sample_count = input_array.shape[TIME_AXIS]
-        self.logger.debug('Number of samples: {}'.format(sample_count))
         new_Rxx_data = self._Rxx.data
 
         raw_array = mne.io.RawArray(
@@ -523,22 +1207,13 @@ class Beamformer(ProcessorNode):
         raw_array.set_eeg_reference(ref_channels='average', projection=True)
         input_array_nobads = raw_array.get_data()
 
-        t2 = time.time()
-        self.logger.debug(
-            'Prepared covariance update in {:.2f} ms'.format((t2 - t1) * 1000))
         samples = make_time_dimension_second(input_array_nobads).T
         new_Rxx_data = (alpha * new_Rxx_data +
                         (1 - alpha) * samples.T.dot(samples))
-        t3 = time.time()
-        self.logger.debug(
-            'Updated matrix data in {:.2f} ms'.format((t3 - t2) * 1000))
 
         self._Rxx = mne.Covariance(new_Rxx_data, self._Rxx.ch_names,
                                    raw_array.info['bads'],
                                    raw_array.info['projs'], nfree=1)
-        t4 = time.time()
-        self.logger.debug('Created instance of covariance' +
-                          ' in {:.2f} ms'.format((t4 - t4) * 1000))
 
 
 # TODO: implement this function
@@ -609,6 +1284,10 @@ class MCE(ProcessorNode):
         # pass
 
     def _initialize(self):
+        from numpy.linalg import svd
+        from mne.minimum_norm import (
+            make_inverse_operator as mne_make_inverse_operator)
+
         print('INITIALIZING MCE NODE ...')
         mne_info = self.traverse_back_and_find('mne_info')
         # mne_info['custom_ref_applied'] = True
@@ -654,6 +1333,10 @@ class MCE(ProcessorNode):
         self.V = V
 
     def _update(self):
+        from mne.minimum_norm import apply_inverse_raw
+        from scipy.optimize import linprog
+        from sklearn.preprocessing import normalize
+
         input_array = self.input_node.output
         last_slice = last_sample(input_array)
         n_src = self.mne_inv['nsource']
@@ -709,93 +1392,462 @@ class MCE(ProcessorNode):
                     'snr (signal-to-noise ratio) must be a positive number.')
 
 
+class ROIAggregator(ProcessorNode):
+    """
+    Reduces the output of a source-space node (InverseModel, Beamformer or
+    MCE) from one row per source to one row per label of a FreeSurfer
+    parcellation: 'aparc' (68 labels), 'aparc.a2009s' (148 labels) or a list
+    of mne.Label objects. See ROIReducer for the methods; 'pca_flip' needs an
+    InverseModel upstream.
+
+    With an InverseModel right upstream it is cheaper to set its parcellation
+    instead: the reduction is then multiplied into the inverse model matrix.
+
+    """
+    SUPPORTED_METHODS = SUPPORTED_ROI_METHODS
+    UPSTREAM_CHANGES_IN_THESE_REQUIRE_REINITIALIZATION = (
+        'mne_info', 'mne_forward_model_file_path')
+    CHANGES_IN_THESE_REQUIRE_RESET = ('parcellation', 'method',
+                                      'subjects_dir')
+    SAVERS_FOR_UPSTREAM_MUTABLE_OBJECTS = {
+        'mne_info': channel_labels_and_frequency_saver}
+
+    def __init__(self, parcellation='aparc', method: str='mean',
+                 subjects_dir: str=None):
+        super().__init__()
+        self.parcellation = parcellation
+        self.method = method  # type: str
+        self.subjects_dir = subjects_dir  # type: str
+        self.mne_info = None  # type: mne.Info
+        self._roi_reducer = None  # type: ROIReducer
+        # The upstream matrix that the pca_flip weights were computed for
+        self._inverse_model_matrix = None  # type: np.ndarray
+
+    def _initialize(self):
+        input_mne_info = self.traverse_back_and_find('mne_info')
+        forward_model_file_path = self.traverse_back_and_find(
+            'mne_forward_model_file_path')
+        src = mne.read_source_spaces(forward_model_file_path,
+                                     verbose='ERROR')
+
+        if self.method == 'pca_flip':
+            try:
+                inverse_model_matrix = self.traverse_back_and_find(
+                    'inverse_model_matrix')
+            except AttributeError:
+                raise ValueError(
+                    'Method pca_flip needs an InverseModel upstream')
+        else:
+            inverse_model_matrix = None
+        self._inverse_model_matrix = inverse_model_matrix
+
+        self._roi_reducer = ROIReducer(
+            read_parcellation(src, self.parcellation, self.subjects_dir),
+            src, method=self.method,
+            inverse_model_matrix=inverse_model_matrix)
+        if input_mne_info['nchan'] != self._roi_reducer.source_count:
+            raise ValueError(
+                'The input has {} rows but the forward model has {} sources'
+                .format(input_mne_info['nchan'],
+                        self._roi_reducer.source_count))
+
+        self.mne_info = mne.create_info(self._roi_reducer.roi_names,
+                                        input_mne_info['sfreq'])
+
+    def _update(self):
+        if self.method == 'pca_flip':
+            # InverseModel swaps in a new matrix when snr, method or the bad
+            # channels change without reinitializing the nodes downstream
+            inverse_model_matrix = self.traverse_back_and_find(
+                'inverse_model_matrix')
+            if inverse_model_matrix is not self._inverse_model_matrix:
+                self._roi_reducer.set_inverse_model_matrix(
+                    inverse_model_matrix)
+                self._inverse_model_matrix = inverse_model_matrix
+
+        input_array = make_time_dimension_second(self.input_node.output)
+        self.output = put_time_dimension_back_from_second(
+            self._roi_reducer.apply(input_array.astype(DTYPE, copy=False)))
+
+    def _check_value(self, key, value):
+        if key == 'method':
+            if value not in self.SUPPORTED_METHODS:
+                raise ValueError(
+                    'Method {} is not supported.'.format(value) +
+                    ' Use one of: {}'.format(self.SUPPORTED_METHODS))
+
+    def _reset(self):
+        self._should_reinitialize = True
+        self.initialize()
+        output_history_is_no_longer_valid = True
+        return output_history_is_no_longer_valid
+
+    def _on_input_history_invalidation(self):
+        # The reduction does not rely on past inputs
+        pass
+
+
 class ICARejection(ProcessorNode):
+    """
+    Removes artifact components found by ICA from the good EEG channels.
 
-    def __init__(self, collect_for_x_seconds: int=60):
+    The first collect_for_x_seconds of data, filtered to 1-200 Hz, are
+    collected and ICA is fitted to them in the background. The input is
+    passed through untouched until the components to reject are known;
+    ica_progress tells how far the fitting has got. With
+    component_selection='auto' the components that correlate with the EOG
+    or ECG channels or have outlying kurtosis are rejected as soon as the
+    fit is done. With 'manual' nothing is rejected until reject_components
+    is called, e.g. from the GUI.
+
+    Changing a parameter discards the fit in progress. A fastica fit stops
+    at its next iteration, but infomax and picard fits run to the end in
+    the background, competing with the next fit for the CPU.
+
+    """
+    SUPPORTED_METHODS = SUPPORTED_ICA_METHODS
+    SUPPORTED_COMPONENT_SELECTIONS = ('auto', 'manual')
+
+    def __init__(self, collect_for_x_seconds: int=60, method='fastica',
+                 n_components: int=None, component_selection='auto'):
         super().__init__()
         self.collect_for_x_seconds = collect_for_x_seconds  # type: int
+        self.method = method
+        self.n_components = n_components
+        self.component_selection = component_selection
 
         self._samples_collected = None  # type: int
         self._samples_to_be_collected = None  # type: int
         self._enough_collected = None  # type: bool
 
+        # COMPONENTS x CHANNELS and CHANNELS x COMPONENTS, the channels
+        # being the good EEG ones
+        self.unmixing_matrix = None  # type: np.ndarray
+        self.mixing_matrix = None  # type: np.ndarray
+        self.rejected_components = []  # type: list
+        # Fraction of the maximum number of iterations done by the fit
+        self.ica_progress = 0.0  # type: float
+        # Replaced rather than changed in place, so that it can be set from
+        # another thread (see reject_components)
+        self._rejection_matrix = None  # type: np.ndarray
+
+        self._executor = None  # type: ThreadPoolExecutor
+        self._pending_ica = None  # type: Future
+        self._pending_ica_cancelled = None  # type: threading.Event
+
         self._reset_statistics()
-        self._ica_rejector = None
 
     def _on_input_history_invalidation(self):
-        self._reset_statistics()
+        # Once collection is over the fit does not depend on the new data
+        if self._pending_ica is None and self.unmixing_matrix is None:
+            self._reset_statistics()
+            self._linear_filter.reset()
+            self._reference_filter.reset()
 
     def _check_value(self, key, value):
-        pass
+        if key == 'method':
+            if value not in self.SUPPORTED_METHODS:
+                raise ValueError(
+                    'Method {} is not supported.'.format(value) +
+                    ' Use one of: {}'.format(self.SUPPORTED_METHODS))
 
-    CHANGES_IN_THESE_REQUIRE_RESET = ('collect_for_x_seconds', )
+        if key == 'component_selection':
+            if value not in self.SUPPORTED_COMPONENT_SELECTIONS:
+                raise ValueError(
+                    'Component selection {} is not supported.'.format(value) +
+                    ' Use one of: {}'.format(
+                        self.SUPPORTED_COMPONENT_SELECTIONS))
+
+        if key == 'collect_for_x_seconds':
+            if value <= 0:
+                raise ValueError(
+                    'collect_for_x_seconds must be a positive number.')
+
+        if key == 'n_components':
+            if value is not None and value < 1:
+                raise ValueError('n_components must be None or positive.')
+
+    CHANGES_IN_THESE_REQUIRE_RESET = ('collect_for_x_seconds', 'method',
+                                      'n_components', 'component_selection')
 
     def _initialize(self):
+        self.close()  # for reinitializations
+        self._forget_ica()
+
         self._mne_info = self.traverse_back_and_find('mne_info')
         self._frequency = self._mne_info['sfreq']
         self._good_ch_inds = mne.pick_types(self._mne_info, eeg=True,
                                             meg=False, stim=False,
                                             exclude='bads')
+        self._reference_ch_inds = mne.pick_types(self._mne_info, meg=False,
+                                                 eeg=False, eog=True,
+                                                 ecg=True, exclude='bads')
 
-        channels = self._mne_info['chs']
-        self._ch_locs = np.array([ch['loc'] for ch in channels])
-
-        n_ch = len(self._good_ch_inds)
         self._samples_to_be_collected = int(math.ceil(
             self.collect_for_x_seconds * self._frequency))
         self._collected_timeseries = np.zeros(
-                [n_ch, self._samples_to_be_collected])
-        self._linear_filter = filters.ButterFilter(
-                [1, 200], fs=self._frequency,
-                n_channels=len(self._good_ch_inds))
-        self._linear_filter.apply = pynfb_ndarray_function_wrapper(
-                self._linear_filter.apply)
+                [len(self._good_ch_inds), self._samples_to_be_collected])
+        self._collected_references = np.zeros(
+                [len(self._reference_ch_inds), self._samples_to_be_collected])
+        sos = butter_sos((1, 200), self._frequency)
+        self._linear_filter = SOSFilter(
+                sos, channel_count=len(self._good_ch_inds), dtype=np.float64)
+        self._reference_filter = SOSFilter(
+                sos, channel_count=len(self._reference_ch_inds),
+                dtype=np.float64)
+        self._reset_statistics()
 
     def _reset(self) -> bool:
-        self._reset_statistics()
-        self._input_history_is_no_longer_valid = True
-        return self._input_history_is_no_longer_valid
+        self._should_reinitialize = True
+        self.initialize()
+        output_history_is_no_longer_valid = True
+        return output_history_is_no_longer_valid
 
     def _reset_statistics(self):
         self._samples_collected = 0
         self._enough_collected = False
 
     def _update(self):
-        # Have we collected enough samples without the new input?
-        self.output = self.input_node.output
+        input_array = self.input_node.output
+        self._swap_in_pending_ica()
 
-        enough_collected = self._samples_collected >=\
-            self._samples_to_be_collected
-        if not enough_collected:
-            if self.input_node.output is not None and\
-                    self.input_node.output.shape[TIME_AXIS] > 0:
-                self._update_statistics()
+        if not self._enough_collected and input_array.shape[TIME_AXIS] > 0:
+            self._update_statistics()
+            if self._samples_collected >= self._samples_to_be_collected:
+                self._enough_collected = True
+                self._start_fitting_ica()
 
-        elif not self._enough_collected:  # We just got enough samples
-            self._enough_collected = True
-            print('COLLECTED ENOUGH SAMPLES')
-            ica = ICADialog(
-                self._collected_timeseries.T,
-                list(np.array(self._mne_info['ch_names'])[self._good_ch_inds]),
-                self._ch_locs[self._good_ch_inds, :], self._frequency)
-
-            ica.exec_()
-            self._ica_rejector = ica.rejection.val.T
+        rejection_matrix = self._rejection_matrix
+        if rejection_matrix is None:
+            self.output = input_array
         else:
-            self.output[self._good_ch_inds, :] = np.dot(
-                    self._ica_rejector,
-                    self.input_node.output[self._good_ch_inds, :])
+            output_array = input_array.copy()
+            output_array[self._good_ch_inds, :] = rejection_matrix.dot(
+                input_array[self._good_ch_inds, :])
+            self.output = output_array
 
     def _update_statistics(self):
-        input_array = self.input_node.output.astype(np.dtype('float64'))
         n = self._samples_collected
-        m = input_array.shape[TIME_AXIS]  # number of new samples
-        self._samples_collected += m
-        self._collected_timeseries[:, n:n + m] = self._linear_filter.apply(
-                input_array[self._good_ch_inds, :])
+        # The part of the chunk past the end of the collection is not used
+        m = min(self.input_node.output.shape[TIME_AXIS],
+                self._samples_to_be_collected - n)
         # Using float64 is necessary because otherwise rounding error
         # in recursive formula accumulate
-        pass
+        input_array = self.input_node.output[:, :m].astype(np.float64)
+        self._collected_timeseries[:, n:n + m] = self._linear_filter.apply(
+                input_array[self._good_ch_inds, :])
+        self._collected_references[:, n:n + m] =\
+            self._reference_filter.apply(
+                input_array[self._reference_ch_inds, :])
+        self._samples_collected += m
+
+    def _start_fitting_ica(self):
+        self._discard_pending_ica()
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        cancelled = threading.Event()
+
+        def progress(fraction):
+            if cancelled.is_set():
+                # Stops the iterations of a fit that is no longer needed.
+                # Only fastica calls progress between iterations: a
+                # discarded infomax or picard fit keeps its worker thread
+                # busy until it ends.
+                raise CancelledError()
+            self.ica_progress = fraction
+
+        self.ica_progress = 0.0
+        self._pending_ica_cancelled = cancelled
+        # The collected arrays are not touched again until the next
+        # initialization, which allocates new ones
+        self._pending_ica = self._executor.submit(
+            self._fit_ica, self._collected_timeseries,
+            self._collected_references, self.method, self.n_components,
+            self.component_selection == 'auto', progress)
+
+    @staticmethod
+    def _fit_ica(data, references, method, n_components, select_components,
+                 progress):
+        unmixing, mixing = fit_ica(data, method=method,
+                                   n_components=n_components,
+                                   progress=progress)
+        components = []
+        if select_components:
+            sources = unmixing.dot(data - data.mean(axis=1, keepdims=True))
+            components = find_artifact_components(sources, references)
+        return unmixing, mixing, components
+
+    def _swap_in_pending_ica(self):
+        future = self._pending_ica
+        if future is None or not future.done():
+            return
+        self._pending_ica = self._pending_ica_cancelled = None
+        # Re-raises any exception from the background thread
+        self.unmixing_matrix, self.mixing_matrix, components = future.result()
+        self.ica_progress = 1.0
+        self.reject_components(components)
+
+    def _discard_pending_ica(self):
+        if self._pending_ica is not None:
+            self._pending_ica_cancelled.set()
+            self._pending_ica.cancel()
+            self._pending_ica = self._pending_ica_cancelled = None
+
+    def close(self):
+        """Discards the fit in progress and stops the worker thread"""
+        self._discard_pending_ica()
+        if self._executor is not None:
+            # A fastica fit stops at its next iteration, the other methods
+            # finish in the background
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def _forget_ica(self):
+        self.unmixing_matrix = self.mixing_matrix = None
+        self.rejected_components = []
+        self._rejection_matrix = None
+        self.ica_progress = 0.0
+
+    def reject_components(self, components):
+        """
+        Rejects the components with the given indices (rows of
+        unmixing_matrix) instead of the ones rejected so far. Can be called
+        from another thread: the rejection matrix is swapped in whole.
+
+        """
+        if self.unmixing_matrix is None:
+            raise ValueError('ICA has not been fitted yet.')
+        components = sorted(set(int(c) for c in components))
+        if components:
+            rejection_matrix = make_rejection_matrix(
+                self.unmixing_matrix, self.mixing_matrix,
+                components).astype(DTYPE)
+        else:
+            rejection_matrix = None
+        self.rejected_components = components
+        self._rejection_matrix = rejection_matrix
 
     UPSTREAM_CHANGES_IN_THESE_REQUIRE_REINITIALIZATION = ('mne_info', )
-    SAVERS_FOR_UPSTREAM_MUTABLE_OBJECTS = {'mne_info': channel_labels_saver}
+    SAVERS_FOR_UPSTREAM_MUTABLE_OBJECTS = {
+        'mne_info': channel_labels_and_frequency_saver}
+
+
+class ASR(ProcessorNode):
+    """
+    Artifact subspace reconstruction of the good EEG channels (see
+    helpers/asr.py). The first collect_for_x_seconds of data are collected
+    the way Preprocessing does it and passed through as they are; they
+    should be mostly clean. From then on, in every window of window_length
+    seconds, updated every step seconds, the principal components whose
+    RMS exceeds that of the calibration data by more than cutoff standard
+    deviations are reconstructed from the rest. The input should be
+    high-passed, e.g. by LinearFilter.
+
+    """
+    CHANGES_IN_THESE_REQUIRE_RESET = ('collect_for_x_seconds', 'cutoff',
+                                      'window_length', 'step',
+                                      'max_dimension')
+    UPSTREAM_CHANGES_IN_THESE_REQUIRE_REINITIALIZATION = ('mne_info', )
+    SAVERS_FOR_UPSTREAM_MUTABLE_OBJECTS = {
+        'mne_info': channel_labels_and_frequency_saver}
+
+    def __init__(self, collect_for_x_seconds: int=60, cutoff: float=20.0,
+                 window_length: float=0.5, step: float=0.032,
+                 max_dimension: float=0.66):
+        super().__init__()
+        self.collect_for_x_seconds = collect_for_x_seconds  # type: int
+        self.cutoff = cutoff
+        self.window_length = window_length
+        self.step = step
+        self.max_dimension = max_dimension
+
+        self._samples_collected = None  # type: int
+        self._samples_to_be_collected = None  # type: int
+        self._enough_collected = None  # type: bool
+        self._initialized_with_collect_for_x_seconds = None  # type: int
+        self._asr_filter = None  # type: ASRFilter
+
+        self._reset_statistics()
+
+    def _initialize(self):
+        mne_info = self.traverse_back_and_find('mne_info')
+        self._frequency = mne_info['sfreq']
+        self._good_ch_inds = mne.pick_types(mne_info, eeg=True, meg=False,
+                                            stim=False, exclude='bads')
+
+        self._initialized_with_collect_for_x_seconds =\
+            self.collect_for_x_seconds
+        self._samples_to_be_collected = int(math.ceil(
+            self.collect_for_x_seconds * self._frequency))
+        self._collected_timeseries = np.zeros(
+            [len(self._good_ch_inds), self._samples_to_be_collected],
+            dtype=DTYPE)
+        self._reset_statistics()
+
+    def _update(self):
+        input_array = self.input_node.output
+        if self._enough_collected:
+            output_array = input_array.copy()
+            output_array[self._good_ch_inds, :] = self._asr_filter.apply(
+                input_array[self._good_ch_inds, :])
+            self.output = output_array
+            return
+
+        if input_array.shape[TIME_AXIS] > 0:
+            self._update_statistics()
+        if self._samples_collected >= self._samples_to_be_collected:
+            self._enough_collected = True
+            self._calibrate()
+        self.output = input_array
+
+    def _update_statistics(self):
+        n = self._samples_collected
+        # The part of the chunk past the end of the collection is not used
+        m = min(self.input_node.output.shape[TIME_AXIS],
+                self._samples_to_be_collected - n)
+        self._collected_timeseries[:, n:n + m] =\
+            self.input_node.output[self._good_ch_inds, :m]
+        self._samples_collected += m
+
+    def _calibrate(self):
+        mixing, threshold = calibrate_asr(
+            self._collected_timeseries, self._frequency, cutoff=self.cutoff,
+            window_length=self.window_length)
+        self._asr_filter = ASRFilter(
+            mixing, threshold,
+            window_length=int(round(self.window_length * self._frequency)),
+            step=max(1, int(round(self.step * self._frequency))),
+            max_dimension=self.max_dimension)
+
+    def _reset(self) -> bool:
+        if (self._enough_collected and
+                self._initialized_with_collect_for_x_seconds ==
+                self.collect_for_x_seconds):
+            # The calibration data are still there
+            self._calibrate()
+        else:
+            self._should_reinitialize = True
+            self.initialize()
+        output_history_is_no_longer_valid = True
+        return output_history_is_no_longer_valid
+
+    def _reset_statistics(self):
+        self._samples_collected = 0
+        self._enough_collected = False
+        self._asr_filter = None
+
+    def _on_input_history_invalidation(self):
+        if self._enough_collected:
+            self._asr_filter.reset()
+        else:
+            self._reset_statistics()
+
+    def _check_value(self, key, value):
+        if key in ('collect_for_x_seconds', 'cutoff', 'window_length',
+                   'step'):
+            if value <= 0:
+                raise ValueError('{} must be a positive number.'.format(key))
+
+        if key == 'max_dimension':
+            if not 0 <= value < 1:
+                raise ValueError('max_dimension must be in [0, 1).')
@@ -10,7 +10,8 @@ from .. import TIME_AXIS, DTYPE
 from .node import SourceNode
 from ..helpers.lsl import (convert_lsl_chunk_to_numpy_array,
                            convert_lsl_format_to_numpy,
-                           read_channel_labels_from_info)
+                           read_channel_labels_from_info,
+                           get_lsl_clock_offset)
 from ..helpers.brainvision import (read_brain_vision_data,
                                    read_fif_data,
                                    read_edf_data)
@@ -26,11 +27,14 @@ class LSLStreamSource(SourceNode):
               # TODO: move here
 
     SECONDS_TO_WAIT_FOR_THE_STREAM = 0.5
+    SECONDS_TO_WAIT_FOR_TIME_CORRECTION = 1.0
 
     def __init__(self, stream_name=None):
         super().__init__()
         self.source_name = stream_name
         self._inlet = None  # type: lsl.StreamInlet
+        # Converts timestamps of the stream to time.time()
+        self._clock_offset = None  # type: float
 
     @property
     def stream_name(self):
@@ -61,9 +65,21 @@ class LSLStreamSource(SourceNode):
             channel_labels, channel_types = read_channel_labels_from_info(self._inlet.info())
             self.mne_info = mne.create_info(channel_labels, frequency, ch_types=channel_types)
 
+            # The stream might come from another machine with its own clock
+            try:
+                time_correction = self._inlet.time_correction(
+                    timeout=self.SECONDS_TO_WAIT_FOR_TIME_CORRECTION)
+            except (RuntimeError, TimeoutError):  # pylsl's TimeoutError is a RuntimeError
+                self.logger.warning('Could not get the time correction for {}. '
+                                    'Latencies might be off.'.format(self.source_name))
+                time_correction = 0
+            self._clock_offset = get_lsl_clock_offset() + time_correction
+
     def _update(self):
         lsl_chunk, timestamps = self._inlet.pull_chunk()
         self.output = convert_lsl_chunk_to_numpy_array(lsl_chunk, dtype=self.dtype)
+        if timestamps:
+            self.acquisition_time = timestamps[-1] + self._clock_offset
 
 
 class FileSource(SourceNode):
@@ -84,6 +100,11 @@ class FileSource(SourceNode):
         self.loop_the_file = False
         self.is_alive = True
 
+        # How many samples to read is decided based on the time that has
+        # passed according to this function. Replace it to read the file
+        # faster or slower than in real time.
+        self.clock = time.time
+
         self._time_of_the_last_update = None
         self._samples_already_read = None
 
@@ -146,7 +167,7 @@ class FileSource(SourceNode):
         if self.data is None:
             return
 
-        current_time = time.time()
+        current_time = self.clock()
 
         if self._time_of_the_last_update is not None:
 
@@ -166,6 +187,9 @@ class FileSource(SourceNode):
             self.output = get_a_time_slice(self.data, start_idx=self._samples_already_read, stop_idx=stop_idx)
             actual_samples_in_chunk = self.output.shape[TIME_AXIS]
             self._samples_already_read = self._samples_already_read + actual_samples_in_chunk
+            if actual_samples_in_chunk > 0:
+                # The samples are considered acquired when they are read
+                self.acquisition_time = time.time()
 
             # If we do hit the end we need to either start again or stop completely depending on loop_the_file
             if self._samples_already_read == samples_in_data:
@@ -5,6 +5,7 @@ from . import TIME_AXIS
 from .nodes.node import Node, SourceNode, ProcessorNode, OutputNode
 from .helpers.decorators import accepts
 from .helpers.misc import class_name_of
+from .helpers.metrics import NodeMetrics
 
 import logging
 
@@ -32,6 +33,8 @@ class Pipeline(object):
         self._outputs = list()  # type: List[OutputNode]
         self._inputs_of_outputs = list()  # type: List[(SourceNode, ProcessorNode)]
         self.logger = logging.getLogger(type(self).__name__)
+        # Timings of update_all_nodes, None unless metrics are enabled
+        self._metrics = None  # type: NodeMetrics
 
     @property
     def source(self):
@@ -41,6 +44,7 @@ class Pipeline(object):
     @accepts(object, SourceNode)
     def source(self, input_node):
         self._source = input_node
+        self._track(input_node)
         self._reconnect_the_first_processor(input_node)
         self._reconnect_outputs_to_last_node()  # In case some outputs were added before anything else
 
@@ -63,6 +67,7 @@ class Pipeline(object):
             last_node = self._last_node_before_outputs()
             processor_node.input_node = processor_node.input_node or last_node
             self._processors.append(processor_node)
+            self._track(processor_node)
             self._reconnect_outputs_to_last_node()
         else:
             msg = "Trying to add a {} that has already been added".format(class_name_of(processor_node))
@@ -73,6 +78,7 @@ class Pipeline(object):
         """If input_node is None, output_node will be kept connected to whatever node that is currently last"""
         if output_node not in self._outputs:
             self._outputs.append(output_node)
+            self._track(output_node)
             # If input_node is None we will need to reconnect output_node. So we keep track of those Nones.
             self._inputs_of_outputs.append(input_node)
             output_node.input_node = input_node or self._last_node_before_outputs()
@@ -97,19 +103,64 @@ class Pipeline(object):
                 'Finish initialization in {:.1f} ms'.format((t2 - t1) * 1000))
 
     def update_all_nodes(self):
-        self.logger.info('Start update ' + '>' * 6)
-        t1 = time.time()
-        for node in self.all_nodes:
-            node.update()
-            if node is self.source and node.output is not None and node.output.size > 0:
-                pass  # print(node.output.shape[TIME_AXIS])
-        t2 = time.time()
-        self.logger.info('Finish in {:.1f} ms'.format((t2 - t1) * 1000))
+        # No logging here: this is called hundreds of times a second.
+        # Use enable_metrics and metrics to see how long updates take.
+        metrics = self._metrics
+        if metrics is None:
+            for node in self.all_nodes:
+                node.update()
+        else:
+            t1 = time.perf_counter()
+            for node in self.all_nodes:
+                node.update()
+            metrics.histograms['update'].record(time.perf_counter() - t1)
+            metrics.update_count += 1
 
     def run(self):
         while self.source.is_alive:  # TODO: also stop if all outputs are dead
-            for node in self.all_nodes:
-                node.update()
+            self.update_all_nodes()
+
+    def enable_metrics(self):
+        """
+        Starts collecting update, initialization and reset timings and
+        sample counts for every node. Until this is called, collecting them
+        costs nothing.
+
+        """
+        self._metrics = NodeMetrics()
+        for node in self.all_nodes:
+            self._track(node)
+
+    def disable_metrics(self):
+        self._metrics = None
+        for node in self.all_nodes:
+            node.metrics = None
+
+    def metrics(self) -> dict:
+        """
+        Returns {node name: NodeMetrics.snapshot()} with an additional
+        'Pipeline' entry for update_all_nodes as a whole. Nodes of the same
+        class are named <class name>_2, <class name>_3, etc. in the order they
+        appear in the pipeline.
+
+        """
+        if self._metrics is None:
+            raise ValueError('Metrics are disabled. Call enable_metrics first')
+        snapshots = {'Pipeline': self._metrics.snapshot()}
+        class_counts = dict()
+        for node in self.all_nodes:
+            class_name = class_name_of(node)
+            class_counts[class_name] = class_counts.get(class_name, 0) + 1
+            if class_counts[class_name] == 1:
+                name = class_name
+            else:
+                name = '{}_{}'.format(class_name, class_counts[class_name])
+            snapshots[name] = node.metrics.snapshot()
+        return snapshots
+
+    def _track(self, node):
+        if self._metrics is not None and node.metrics is None:
+            node.metrics = NodeMetrics()
 
     def _reconnect_outputs_to_last_node(self):
         """Reconnects all outputs that did not have an input node specified when added"""
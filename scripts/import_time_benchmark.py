@@ -0,0 +1,73 @@
+"""
+Measures how long it takes to import cognigraph modules in a fresh
+interpreter and how much memory that takes.
+
+Usage:
+    python scripts/import_time_benchmark.py [--repeat 5] [--max-seconds 3]
+
+With --max-seconds the script exits with status 1 if the median import time
+of any module exceeds the limit, so it can be used as a check in CI.
+tests/test_imports.py checks that none of the heavy dependencies are
+imported at all.
+
+"""
+import sys
+import json
+import argparse
+import subprocess
+from statistics import median
+
+MODULES = (
+    'cognigraph.nodes.sources',
+    'cognigraph.nodes.processors',
+    'cognigraph.nodes.outputs',
+    'cognigraph.pipeline',
+)
+
+# Runs in the fresh interpreter. ru_maxrss is in kilobytes on Linux.
+MEASURE = '''
+import sys, time, json, resource
+t = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - t
+print(json.dumps({{
+    'seconds': elapsed,
+    'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'module_count': len(sys.modules),
+}}))
+'''
+
+
+def measure(module):
+    completed = subprocess.run(
+        [sys.executable, '-c', MEASURE.format(module=module)],
+        stdout=subprocess.PIPE, check=True, universal_newlines=True)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--max-seconds', type=float, default=None)
+    args = parser.parse_args()
+
+    too_slow = list()
+    print('{:<32}{:>10}{:>12}{:>10}'.format('module', 'seconds', 'max RSS, MB',
+                                            'modules'))
+    for module in MODULES:
+        runs = [measure(module) for _ in range(args.repeat)]
+        seconds = median(run['seconds'] for run in runs)
+        print('{:<32}{:>10.3f}{:>12.1f}{:>10d}'.format(
+            module, seconds, median(run['max_rss_mb'] for run in runs),
+            runs[0]['module_count']))
+        if args.max_seconds is not None and seconds > args.max_seconds:
+            too_slow.append(module)
+
+    if too_slow:
+        print('Slower than {} s: {}'.format(args.max_seconds,
+                                             ', '.join(too_slow)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -13,6 +13,8 @@ with open(os.path.join('cognigraph', '__init__.py'), 'r') as fid:
 setup(
     name='cognigraph',
     version=VERSION,
+    # multiprocessing.shared_memory (SharedRingBuffer) needs 3.8
+    python_requires='>=3.8',
     install_requires=[
         'pyqtgraph',
         'pyqt5',
@@ -32,5 +34,8 @@ setup(
         'vispy',
         'PyOpenGL',
         'PyOpenGL_accelerate'
-    ]
+    ],
+    entry_points={
+        'console_scripts': ['cognigraph = cognigraph.cli:main'],
+    }
 )
@@ -0,0 +1,74 @@
+import pytest
+
+from cognigraph.helpers import inverse_model
+
+
+@pytest.fixture(autouse=True)
+def inverse_matrix_cache_dir(tmp_path, monkeypatch):
+    """Keeps the tests from writing inverse matrices to the user's cache"""
+    cache_dir = tmp_path / 'inverse-matrices'
+    monkeypatch.setattr(inverse_model, 'INVERSE_MATRIX_CACHE_DIR',
+                        str(cache_dir))
+    return cache_dir
+
+
+@pytest.fixture(scope='session')
+def toy_forward(tmp_path_factory):
+    """
+    (forward model file path, info): a fixed orientation forward solution
+    for 20 EEG channels and 20 sources in each hemisphere of subject 'toy'
+    in a spherical head model. info has an average reference projector, as
+    inverse modeling requires.
+
+    """
+    import numpy as np
+    import mne
+    from scipy.spatial import ConvexHull
+
+    rng = np.random.RandomState(0)
+
+    def random_directions(count):
+        directions = rng.randn(count, 3)
+        return directions / np.linalg.norm(directions, axis=1, keepdims=True)
+
+    # Electrodes on the upper half of a 9 cm sphere
+    electrode_directions = random_directions(20)
+    electrode_directions[:, 2] = np.abs(electrode_directions[:, 2])
+    ch_names = ['EEG {:03d}'.format(i + 1) for i in range(20)]
+    montage = mne.channels.make_dig_montage(
+        ch_pos=dict(zip(ch_names, 0.09 * electrode_directions)),
+        coord_frame='head')
+    info = mne.create_info(ch_names, 500., 'eeg')
+    info.set_montage(montage)
+    info = mne.io.RawArray(np.zeros((len(ch_names), 1)), info,
+                           verbose='ERROR').set_eeg_reference(
+        projection=True, verbose='ERROR').info
+
+    sphere = mne.make_sphere_model((0., 0., 0.), 0.09, info, verbose='ERROR')
+    # Each hemisphere is the convex hull of 20 points on a 5 cm half-sphere
+    FIFF = mne.io.constants.FIFF
+    hemispheres = list()
+    for hemi_id, side in ((FIFF.FIFFV_MNE_SURF_LEFT_HEMI, -1),
+                          (FIFF.FIFFV_MNE_SURF_RIGHT_HEMI, 1)):
+        directions = random_directions(20)
+        directions[:, 0] = side * np.abs(directions[:, 0])
+        rr = 0.05 * directions
+        tris = ConvexHull(rr).simplices.astype(np.int32)
+        hemispheres.append(dict(
+            id=hemi_id, type='surf', subject_his_id='toy',
+            coord_frame=FIFF.FIFFV_COORD_HEAD,
+            np=len(rr), rr=rr, nn=directions, ntri=len(tris), tris=tris,
+            nuse=len(rr), inuse=np.ones(len(rr), int),
+            vertno=np.arange(len(rr)), nuse_tri=0, use_tris=None,
+            nearest=None, nearest_dist=None, pinfo=None, patch_inds=None,
+            dist=None, dist_limit=None))
+    src = mne.SourceSpaces(hemispheres)
+    fwd = mne.make_forward_solution(info, None, src, sphere, meg=False,
+                                    verbose='ERROR')
+    fwd = mne.convert_forward_solution(fwd, surf_ori=True, force_fixed=True,
+                                       verbose='ERROR')
+
+    forward_file_path = str(
+        tmp_path_factory.mktemp('forward') / 'toy-fwd.fif')
+    mne.write_forward_solution(forward_file_path, fwd, verbose='ERROR')
+    return forward_file_path, info
@@ -0,0 +1,82 @@
+import pytest
+import numpy as np
+import mne
+
+from cognigraph import DTYPE
+from cognigraph.nodes.processors import ASR
+from cognigraph.nodes.sources import FileSource
+
+FREQUENCY = 250
+
+
+@pytest.fixture
+def data():
+    rng = np.random.RandomState(0)
+    data = rng.randn(9, 9).dot(rng.randn(9, 10 * FREQUENCY))
+    artifact = np.zeros_like(data)
+    artifact[:, 2000:2250] = np.outer(rng.randn(9), 50 * np.hanning(250))
+    return data.astype(DTYPE), artifact.astype(DTYPE)
+
+
+@pytest.fixture
+def asr(data):
+    info = mne.create_info(['Fp1', 'Fp2', 'F3', 'F4', 'Cz', 'P3', 'P4',
+                            'O1', 'O2', 'STI'], FREQUENCY,
+                           ['eeg'] * 9 + ['stim'])
+    input_node = FileSource()
+    input_node.mne_info = info
+    asr = ASR(collect_for_x_seconds=4)
+    asr.input_node = input_node
+    return asr
+
+
+def _feed(asr, array, chunk_size=50):
+    outputs = []
+    for start in range(0, array.shape[1], chunk_size):
+        asr.input_node.output = array[:, start:start + chunk_size]
+        asr._update()
+        outputs.append(asr.output)
+    return np.hstack(outputs)
+
+
+def _with_stim_channel(array):
+    return np.vstack([array, np.ones((1, array.shape[1]), dtype=DTYPE)])
+
+
+def test_calibrates_and_removes_artifacts(asr, data):
+    clean, artifact = data
+    asr.initialize()
+    output = _feed(asr, _with_stim_channel(clean + artifact))
+    assert(asr._enough_collected)
+    assert(output.dtype == DTYPE)
+
+    # Calibration data are passed through
+    assert(np.array_equal(output[:9, :1000], clean[:, :1000]))
+    residual_power = np.mean(np.square(output[:9] - clean)[:, 2000:2250])
+    artifact_power = np.mean(np.square(artifact[:, 2000:2250]))
+    assert(residual_power < 0.1 * artifact_power)
+    # The stim channel is left as it is
+    assert(np.all(output[9] == 1))
+
+
+def test_changing_cutoff_reuses_calibration_data(asr, data):
+    clean, _ = data
+    asr.initialize()
+    _feed(asr, _with_stim_channel(clean[:, :1000]))
+    assert(asr._enough_collected)
+
+    asr.cutoff = 5
+    asr.update()  # Resets
+    assert(asr._enough_collected)
+    assert(asr._asr_filter is not None)
+
+    asr.collect_for_x_seconds = 2
+    asr.update()  # Resets
+    assert(not asr._enough_collected)
+
+
+def test_invalid_values(asr):
+    with pytest.raises(ValueError):
+        asr.cutoff = 0
+    with pytest.raises(ValueError):
+        asr.max_dimension = 1
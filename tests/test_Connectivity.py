@@ -0,0 +1,48 @@
+import pytest
+import numpy as np
+import mne
+
+from cognigraph import DTYPE
+from cognigraph.nodes.processors import Connectivity
+from cognigraph.nodes.sources import FileSource
+
+FREQUENCY = 500
+
+
+@pytest.fixture
+def connectivity():
+    info = mne.create_info(['Fz', 'Cz', 'Pz', 'Oz'], FREQUENCY, 'eeg')
+    input_node = FileSource()
+    input_node.mne_info = info
+    input_node.output = np.random.RandomState(0).randn(
+        info['nchan'], 100).astype(DTYPE)
+    connectivity = Connectivity()
+    connectivity.input_node = input_node
+    return connectivity
+
+
+@pytest.mark.parametrize('method', Connectivity.SUPPORTED_METHODS)
+def test_update(connectivity, method):
+    connectivity.method = method
+    connectivity.initialize()
+    connectivity._update()
+    assert(connectivity.output.shape == (6, 100))
+    assert(connectivity.output.dtype == DTYPE)
+    assert(connectivity.mne_info['ch_names'][0] == 'Fz-Cz')
+
+
+def test_pairs(connectivity):
+    connectivity.pairs = [('Oz', 'Fz'), (1, 2)]
+    connectivity.initialize()
+    connectivity._update()
+    assert(connectivity.mne_info['ch_names'] == ['Oz-Fz', 'Cz-Pz'])
+    assert(connectivity.output.shape == (2, 100))
+
+
+def test_check_value(connectivity):
+    with pytest.raises(ValueError):
+        connectivity.method = 'wPLI'
+    with pytest.raises(ValueError):
+        connectivity.pairs = [('Fz', 'Fz')]
+    with pytest.raises(ValueError):
+        connectivity.window_length = 0
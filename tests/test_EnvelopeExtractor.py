@@ -0,0 +1,51 @@
+import pytest
+import numpy as np
+import mne
+
+from cognigraph import DTYPE
+from cognigraph.nodes.processors import EnvelopeExtractor
+from cognigraph.nodes.sources import FileSource
+
+FREQUENCY = 500
+
+
+@pytest.fixture
+def envelope_extractor():
+    info = mne.create_info(['Fz', 'Cz', 'Pz'], FREQUENCY, 'eeg')
+    input_node = FileSource()
+    input_node.mne_info = info
+    input_node.output = np.random.RandomState(0).randn(
+        info['nchan'], 100).astype(DTYPE)
+    envelope_extractor = EnvelopeExtractor()
+    envelope_extractor.input_node = input_node
+    return envelope_extractor
+
+
+@pytest.mark.parametrize('method', EnvelopeExtractor.SUPPORTED_METHODS)
+def test_update(envelope_extractor, method):
+    envelope_extractor.method = method
+    envelope_extractor.initialize()
+    envelope_extractor._update()
+    assert(envelope_extractor.output.shape == (3, 100))
+    assert(envelope_extractor.output.dtype == DTYPE)
+    assert(np.all(envelope_extractor.output >= 0))
+
+
+def test_group_delay(envelope_extractor):
+    assert(envelope_extractor.group_delay is None)
+    envelope_extractor.initialize()
+    assert(np.isclose(envelope_extractor.group_delay, 9 / FREQUENCY))
+
+    envelope_extractor.method = 'cFIR'
+    envelope_extractor.delay = 0.1
+    envelope_extractor.reset()
+    assert(np.isclose(envelope_extractor.group_delay, 0.1))
+
+
+def test_check_value(envelope_extractor):
+    with pytest.raises(ValueError):
+        envelope_extractor.method = 'Hilbert'
+    with pytest.raises(ValueError):
+        envelope_extractor.band = (12, 8)
+    with pytest.raises(ValueError):
+        envelope_extractor.delay = -1
@@ -0,0 +1,119 @@
+import gc
+import time
+import logging
+
+import pytest
+import numpy as np
+import mne
+
+from cognigraph import DTYPE
+from cognigraph.nodes.outputs import FileOutput
+from cognigraph.nodes.sources import FileSource
+from cognigraph.helpers.metrics import NodeMetrics
+
+tables = pytest.importorskip('tables')
+
+FREQUENCY = 100
+CHANNEL_COUNT = 3
+CHUNK_SIZE = 10
+
+
+@pytest.fixture
+def input_node():
+    input_node = FileSource()
+    input_node.mne_info = mne.create_info(CHANNEL_COUNT, FREQUENCY, 'eeg')
+    input_node.dtype = DTYPE
+    input_node.output = np.zeros((CHANNEL_COUNT, CHUNK_SIZE), dtype=DTYPE)
+    return input_node
+
+
+def _make_file_output(input_node, output_fname, **kwargs):
+    file_output = FileOutput(output_fname=str(output_fname), **kwargs)
+    file_output.input_node = input_node
+    file_output.initialize()
+    return file_output
+
+
+def _write_chunks(file_output, chunk_count):
+    rng = np.random.RandomState(0)
+    chunks = list()
+    for i in range(chunk_count):
+        chunk = rng.randn(CHANNEL_COUNT, CHUNK_SIZE).astype(DTYPE)
+        file_output.input_node.output = chunk
+        file_output.input_node.acquisition_time = 1000.0 + i
+        file_output.update()
+        chunks.append(chunk)
+    return chunks
+
+
+@pytest.mark.parametrize('use_background_writer', [True, False])
+def test_round_trip(input_node, tmp_path, use_background_writer):
+    output_fname = tmp_path / 'output.h5'
+    file_output = _make_file_output(
+        input_node, output_fname, use_background_writer=use_background_writer)
+    chunks = _write_chunks(file_output, 5)
+    file_output.close()
+
+    with tables.open_file(str(output_fname), mode='r') as out_file:
+        data = out_file.root.data.read()
+        timestamps = out_file.root.timestamps.read()
+        ch_names = list(out_file.root.data.attrs.ch_names)
+
+    assert(data.dtype == DTYPE)
+    assert(data.shape == (CHANNEL_COUNT, 5 * CHUNK_SIZE))
+    assert(np.array_equal(data, np.hstack(chunks)))
+    assert(ch_names == input_node.mne_info['ch_names'])
+
+    # The last sample of chunk i has been acquired at 1000 + i
+    assert(timestamps.shape == (5 * CHUNK_SIZE, ))
+    assert(np.allclose(timestamps[CHUNK_SIZE - 1::CHUNK_SIZE],
+                       1000.0 + np.arange(5)))
+    assert(np.allclose(np.diff(timestamps.reshape(5, CHUNK_SIZE), axis=1),
+                       1 / FREQUENCY))
+
+
+def test_counts_dropped_chunks_and_warns_once(input_node, tmp_path, caplog):
+    file_output = _make_file_output(input_node, tmp_path / 'output.h5',
+                                    max_queued_chunk_count=1)
+    file_output.metrics = NodeMetrics()
+    # With the writer thread stopped nothing leaves the queue
+    file_output._writer.stop()
+
+    with caplog.at_level(logging.WARNING, logger='FileOutput'):
+        _write_chunks(file_output, 5)
+
+    assert(file_output.dropped_chunk_count == 4)
+    assert(file_output.metrics.dropped_chunk_count == 4)
+    assert(len(caplog.records) == 1)
+    file_output.close()
+
+
+def test_file_is_closed_when_node_is_collected(input_node, tmp_path):
+    output_fname = tmp_path / 'output.h5'
+    file_output = _make_file_output(input_node, output_fname)
+    _write_chunks(file_output, 2)
+    file_output.input_node = None  # the input node keeps its receivers
+    del file_output
+    gc.collect()
+
+    assert(not tables.file._open_files.get_handlers_by_name(
+        str(output_fname)))
+    with tables.open_file(str(output_fname), mode='r') as out_file:
+        assert(out_file.root.data.shape == (CHANNEL_COUNT, 2 * CHUNK_SIZE))
+
+
+def test_timestamps_default_to_the_current_time(input_node, tmp_path):
+    output_fname = tmp_path / 'output.h5'
+    file_output = _make_file_output(input_node, output_fname,
+                                    use_background_writer=False)
+    input_node.acquisition_time = None
+    time_before = time.time()
+    file_output.update()
+    time_after = time.time()
+    file_output.close()
+
+    with tables.open_file(str(output_fname), mode='r') as out_file:
+        timestamps = out_file.root.timestamps.read()
+    assert(time_before <= timestamps[-1] <= time_after)
+    assert(np.isclose(timestamps[-1] - timestamps[0],
+                      (CHUNK_SIZE - 1) / FREQUENCY))
@@ -0,0 +1,70 @@
+import pytest
+import numpy as np
+import mne
+from scipy.signal import lfilter, sosfilt
+
+from cognigraph import DTYPE
+from cognigraph.helpers.filters import butter_sos
+from cognigraph.nodes.processors import FilterBank
+from cognigraph.nodes.sources import FileSource
+
+BANDS = ((4, 8), (8, 12), (12, 30))
+FREQUENCY = 500
+
+
+@pytest.fixture
+def input_node():
+    info = mne.create_info(['Fz', 'Cz', 'Pz', 'Oz'], FREQUENCY, 'eeg')
+    input_node = FileSource()
+    input_node.mne_info = info
+    input_node.output = np.random.RandomState(0).randn(
+        info['nchan'], 200).astype(DTYPE)
+    return input_node
+
+
+@pytest.fixture
+def filter_bank(input_node):
+    filter_bank = FilterBank(bands=BANDS)
+    filter_bank.input_node = input_node
+    filter_bank.initialize()
+    return filter_bank
+
+
+def test_update(filter_bank, input_node):
+    filter_bank._update()
+    channel_count = input_node.mne_info['nchan']
+    assert(filter_bank.output.shape == (len(BANDS) * channel_count, 200))
+    assert(filter_bank.band_output.shape == (len(BANDS), channel_count, 200))
+    assert(filter_bank.mne_info['nchan'] == len(BANDS) * channel_count)
+    assert(filter_bank.mne_info['ch_names'][channel_count] == 'Fz 8-12 Hz')
+
+
+def test_same_as_filter_and_envelope_per_band(filter_bank, input_node):
+    filter_bank._update()
+    factor = filter_bank.factor
+    data = input_node.output.astype(np.float64)
+    for band, band_output in zip(BANDS, filter_bank.band_output):
+        filtered = sosfilt(butter_sos(band, FREQUENCY), data)
+        envelope = lfilter([1 - factor], [1, -factor], np.abs(filtered))
+        assert(np.allclose(band_output, envelope, atol=1e-4))
+
+
+def test_average_channels(filter_bank):
+    filter_bank._update()
+    band_output = filter_bank.band_output
+
+    filter_bank.average_channels = True
+    filter_bank.reset()
+    filter_bank._update()
+    assert(filter_bank.output.shape == (len(BANDS), 200))
+    assert(filter_bank.mne_info['ch_names'] == filter_bank.band_names)
+    assert(np.allclose(filter_bank.output, band_output.mean(axis=1)))
+
+
+def test_check_value(filter_bank):
+    with pytest.raises(ValueError):
+        filter_bank.bands = ()
+    with pytest.raises(ValueError):
+        filter_bank.bands = ((12, 8), )
+    with pytest.raises(ValueError):
+        filter_bank.output_type = 'amplitude'
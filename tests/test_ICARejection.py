@@ -0,0 +1,156 @@
+import threading
+from concurrent.futures import CancelledError
+
+import pytest
+import numpy as np
+import mne
+
+from cognigraph import DTYPE
+from cognigraph.nodes import processors
+from cognigraph.nodes.processors import ICARejection
+from cognigraph.nodes.sources import FileSource
+
+
+FREQUENCY = 500
+SAMPLE_COUNT = 5000
+CHUNK_SIZE = 500  # 1 second
+
+
+@pytest.fixture
+def data():
+    # Four sources mixed into five EEG channels and blinks seen by the
+    # EOG channel as well
+    rng = np.random.RandomState(0)
+    t = np.arange(SAMPLE_COUNT) / FREQUENCY
+    blinks = np.zeros(SAMPLE_COUNT)
+    for start in range(250, SAMPLE_COUNT, 1000):
+        blinks[start:start + 100] = 20 * np.hanning(100)
+    sources = np.vstack([np.sin(2 * np.pi * 10 * t),
+                         np.sign(np.sin(2 * np.pi * 7 * t)),
+                         rng.laplace(size=SAMPLE_COUNT), blinks])
+    eeg = rng.randn(5, 4).dot(sources)
+    eog = blinks + 0.1 * rng.randn(SAMPLE_COUNT)
+    return np.vstack([eeg, eog]).astype(DTYPE), blinks
+
+
+@pytest.fixture
+def ica_rejection(data):
+    info = mne.create_info(['Fp1', 'Fp2', 'Cz', 'O1', 'O2', 'EOG'],
+                           FREQUENCY, ['eeg'] * 5 + ['eog'])
+    input_node = FileSource()
+    input_node.mne_info = info
+    input_node.output = data[0][:, :CHUNK_SIZE]
+    ica_rejection = ICARejection(collect_for_x_seconds=4)
+    ica_rejection.input_node = input_node
+    return ica_rejection
+
+
+def _collect(ica_rejection, input_array):
+    # Stops as soon as the 4 seconds have been collected, so that the fit
+    # is not swapped in by a later update
+    for start in range(0, 4 * CHUNK_SIZE, CHUNK_SIZE):
+        ica_rejection.input_node.output = input_array[
+            :, start:start + CHUNK_SIZE]
+        ica_rejection._update()
+
+
+def _wait_for_ica(ica_rejection):
+    future = ica_rejection._pending_ica
+    assert(future is not None)
+    future.result(timeout=60)
+    ica_rejection._swap_in_pending_ica()
+
+
+def test_passes_input_through_until_fitted(ica_rejection, data):
+    ica_rejection.initialize()
+    for start in range(0, 4 * CHUNK_SIZE, CHUNK_SIZE):
+        assert(ica_rejection._pending_ica is None)
+        ica_rejection.input_node.output = data[0][:, start:start + CHUNK_SIZE]
+        ica_rejection._update()
+        assert(ica_rejection.output is ica_rejection.input_node.output)
+    # 4 seconds collected. The fit is only swapped in by the next update.
+    assert(ica_rejection._pending_ica is not None)
+
+
+def test_rejects_artifacts_automatically(ica_rejection, data):
+    ica_rejection.initialize()
+    _collect(ica_rejection, data[0])
+    _wait_for_ica(ica_rejection)
+    assert(ica_rejection.ica_progress == 1.0)
+    assert(len(ica_rejection.rejected_components) > 0)
+
+    input_array, blinks = data
+    ica_rejection.input_node.output = input_array
+    ica_rejection._update()
+    output = ica_rejection.output
+    assert(output.dtype == DTYPE)
+    for channel in range(5):
+        assert(abs(np.corrcoef(output[channel],
+                               blinks)[0, 1]) < 0.1)
+    # The EOG channel itself and the input are left as they are
+    assert(np.array_equal(output[5], input_array[5]))
+    assert(np.array_equal(ica_rejection.input_node.output,
+                          input_array))
+
+
+def test_manual_selection(ica_rejection, data):
+    ica_rejection.component_selection = 'manual'
+    ica_rejection.initialize()
+    with pytest.raises(ValueError):
+        ica_rejection.reject_components([0])
+
+    _collect(ica_rejection, data[0])
+    _wait_for_ica(ica_rejection)
+    assert(ica_rejection.rejected_components == [])
+    ica_rejection._update()
+    assert(ica_rejection.output is ica_rejection.input_node.output)
+
+    ica_rejection.reject_components([1])
+    ica_rejection._update()
+    assert(ica_rejection.rejected_components == [1])
+    assert(not np.array_equal(ica_rejection.output,
+                              ica_rejection.input_node.output))
+
+
+def test_reset_discards_the_fit(ica_rejection, data):
+    ica_rejection.initialize()
+    _collect(ica_rejection, data[0])
+    _wait_for_ica(ica_rejection)
+
+    ica_rejection.method = 'infomax'
+    ica_rejection.update()  # Resets
+    assert(ica_rejection.unmixing_matrix is None)
+    assert(ica_rejection._samples_collected == 0)
+
+
+def test_close_stops_the_fit(ica_rejection, data, monkeypatch):
+    # The fit waits for close, so that it can't end before
+    closed = threading.Event()
+    fit_ica = processors.fit_ica
+
+    def fit_ica_after_close(*args, **kwargs):
+        closed.wait(timeout=60)
+        return fit_ica(*args, **kwargs)
+    monkeypatch.setattr(processors, 'fit_ica', fit_ica_after_close)
+
+    ica_rejection.initialize()
+    _collect(ica_rejection, data[0])
+    future = ica_rejection._pending_ica
+    executor = ica_rejection._executor
+    assert(future is not None)
+
+    ica_rejection.close()
+    closed.set()
+    assert(ica_rejection._pending_ica is None)
+    assert(ica_rejection._executor is None)
+    with pytest.raises(CancelledError):
+        future.result(timeout=60)
+    with pytest.raises(RuntimeError):
+        executor.submit(print)  # has been shut down
+
+
+def test_unsupported_values(ica_rejection):
+    with pytest.raises(ValueError):
+        ica_rejection.method = 'jade'
+    with pytest.raises(ValueError):
+        ica_rejection.component_selection = 'random'
@@ -63,3 +63,21 @@ def test_update(inv_model):
 def test_check_value(inv_model):
     with pytest.raises(ValueError):
         inv_model.snr = -1
+
+
+def test_update_after_bad_channel_change(inv_model):
+    inv_model.initialize()
+    info = inv_model.input_node.mne_info
+    old_matrix_shape = inv_model._inverse_model_matrix.shape
+    new_bad = inv_model._inverse_model_matrix_ch_names[0]
+    info['bads'] = info['bads'] + [new_bad]
+
+    # Does not wait for the new matrix
+    inv_model._update()
+    assert(inv_model._inverse_model_matrix.shape[1] ==
+           old_matrix_shape[1] - 1)
+
+    inv_model._pending_inverse_model_matrix.result()
+    inv_model._update()
+    assert(inv_model._pending_inverse_model_matrix is None)
+    assert(new_bad not in inv_model._inverse_model_matrix_ch_names)
@@ -0,0 +1,70 @@
+import pytest
+import numpy as np
+import mne
+
+from cognigraph import DTYPE
+from cognigraph.nodes import outputs
+from cognigraph.nodes.outputs import LSLStreamOutput
+from cognigraph.nodes.sources import FileSource
+
+CHANNEL_COUNT = 5
+
+
+class FakeOutlet(object):
+    def __init__(self, name, channel_labels, **kwargs):
+        self.name = name
+        self.channel_labels = channel_labels
+        self.chunks = list()
+
+    def push_chunk(self, chunk, timestamp):
+        self.chunks.append((np.array(chunk), timestamp))
+
+
+@pytest.fixture
+def lsl_stream_output(monkeypatch):
+    monkeypatch.setattr(outputs, 'create_lsl_outlet', FakeOutlet)
+    monkeypatch.setattr(outputs, 'get_lsl_clock_offset', lambda: 0.0)
+
+    input_node = FileSource()
+    input_node.source_name = 'source'
+    input_node.dtype = DTYPE
+    input_node.mne_info = mne.create_info(CHANNEL_COUNT, 100, 'eeg')
+    lsl_stream_output = LSLStreamOutput(stream_name='out')
+    lsl_stream_output.input_node = input_node
+    return lsl_stream_output
+
+
+def test_channels_are_split_across_outlets(lsl_stream_output):
+    lsl_stream_output.max_channels_per_outlet = 2
+    lsl_stream_output.initialize()
+
+    outlets = lsl_stream_output._outlets
+    ch_names = lsl_stream_output.input_node.mne_info['ch_names']
+    assert([outlet.name for outlet in outlets] ==
+           ['out_part0', 'out_part1', 'out_part2'])
+    assert([outlet.channel_labels for outlet in outlets] ==
+           [ch_names[0:2], ch_names[2:4], ch_names[4:5]])
+
+    # Larger than the initial buffers
+    sample_count = 2 * LSLStreamOutput.INITIAL_BUFFER_SAMPLE_COUNT + 1
+    chunk = np.random.RandomState(0).randn(
+        CHANNEL_COUNT, sample_count).astype(DTYPE)
+    lsl_stream_output.input_node.output = chunk
+    lsl_stream_output.input_node.acquisition_time = 1000.0
+    lsl_stream_output.update()
+
+    for outlet, channel_slice in zip(outlets, (slice(0, 2), slice(2, 4),
+                                               slice(4, 5))):
+        assert(len(outlet.chunks) == 1)
+        lsl_chunk, timestamp = outlet.chunks[0]
+        assert(np.array_equal(lsl_chunk, chunk[channel_slice].T))
+        assert(timestamp == 1000.0)
+
+
+def test_a_single_outlet_keeps_the_stream_name(lsl_stream_output):
+    lsl_stream_output.initialize()
+
+    outlets = lsl_stream_output._outlets
+    assert(len(outlets) == 1)
+    assert(outlets[0].name == 'out')
+    assert(len(outlets[0].channel_labels) == CHANNEL_COUNT)
@@ -0,0 +1,55 @@
+import pytest
+import numpy as np
+import mne
+
+from cognigraph import DTYPE
+from cognigraph.nodes.processors import Resample, LinearFilter
+from cognigraph.nodes.sources import FileSource
+
+
+@pytest.fixture
+def resample():
+    info = mne.create_info(['Fz', 'Cz', 'Pz'], 1000, 'eeg')
+    input_node = FileSource()
+    input_node.mne_info = info
+    input_node.output = np.random.RandomState(0).randn(
+        info['nchan'], 100).astype(DTYPE)
+    resample = Resample(frequency=250)
+    resample.input_node = input_node
+    return resample
+
+
+def test_update(resample):
+    resample.initialize()
+    resample._update()
+    assert(resample.output.shape == (3, 25))
+    assert(resample.output.dtype == DTYPE)
+    assert(resample.mne_info['sfreq'] == 250)
+    assert(resample.mne_info['ch_names'] == ['Fz', 'Cz', 'Pz'])
+    assert(resample.input_node.mne_info['sfreq'] == 1000)
+
+
+def test_rational_ratio(resample):
+    resample.input_node.mne_info = mne.create_info(['Fz', 'Cz', 'Pz'],
+                                                   512, 'eeg')
+    resample.initialize()
+    assert(resample.mne_info['sfreq'] == 250)
+    assert(resample.mne_info['lowpass'] <= 125)
+
+
+def test_downstream_nodes_reinitialize(resample):
+    linear_filter = LinearFilter(lower_cutoff=1, upper_cutoff=40)
+    linear_filter.input_node = resample
+    resample.initialize()
+    linear_filter.initialize()
+
+    resample.frequency = 500
+    resample.update()  # Resets
+    resample.update()
+    linear_filter.update()
+    assert(linear_filter._saved_from_upstream['mne_info'] == (3, 500))
+
+
+def test_check_value(resample):
+    with pytest.raises(ValueError):
+        resample.frequency = 0
@@ -0,0 +1,113 @@
+import sys
+
+import pytest
+import numpy as np
+from cognigraph import DTYPE
+from cognigraph.helpers.ring_buffer import (RingBuffer, RingBufferSlow,
+                                            RingBufferMirrored,
+                                            create_ring_buffer)
+
+linux_only = pytest.mark.skipif(not sys.platform.startswith('linux'),
+                                reason='Mirrored memory requires Linux')
+
+
+@pytest.fixture(params=[(1, 6), (3, 100), (7, 1000)])
+def buffer_size(request):
+    return request.param
+
+
+def _extend_randomly(buffers, row_cnt, maxlen):
+    rng = np.random.RandomState(0)
+    for _ in range(100):
+        new_sample_cnt = rng.randint(0, 2 * maxlen)
+        chunk = rng.randn(row_cnt, new_sample_cnt).astype(DTYPE)
+        for buffer in buffers:
+            buffer.extend(chunk)
+        yield chunk
+
+
+def test_slow_and_fast_agree(buffer_size):
+    row_cnt, maxlen = buffer_size
+    buffers = (RingBufferSlow(row_cnt, maxlen), RingBuffer(row_cnt, maxlen))
+    for _ in _extend_randomly(buffers, row_cnt, maxlen):
+        assert(np.array_equal(buffers[0].data, buffers[1].data))
+
+
+@linux_only
+def test_mirrored_agrees_with_ring_buffer(buffer_size):
+    row_cnt, maxlen = buffer_size
+    buffers = (RingBuffer(row_cnt, maxlen),
+               RingBufferMirrored(row_cnt, maxlen))
+    for _ in _extend_randomly(buffers, row_cnt, maxlen):
+        assert(np.array_equal(buffers[0].data, buffers[1].data))
+
+
+@linux_only
+def test_mirrored_data_is_a_view():
+    buffer = RingBufferMirrored(row_cnt=2, maxlen=10)
+    buffer.extend(np.ones((2, 7)))
+    buffer.extend(np.ones((2, 7)))
+    assert(np.shares_memory(buffer.data, buffer._data))
+
+
+def test_clear(buffer_size):
+    row_cnt, maxlen = buffer_size
+    buffer = create_ring_buffer(row_cnt, maxlen)
+    buffer.extend(np.ones((row_cnt, maxlen // 2 + 1)))
+    buffer.clear()
+    assert(buffer.data.shape == (row_cnt, 0))
+
+
+def test_wrong_shape():
+    buffer = create_ring_buffer(row_cnt=2, maxlen=10)
+    with pytest.raises(ValueError):
+        buffer.extend(np.ones((3, 5)))
+
+
+@pytest.fixture(params=[RingBuffer, RingBufferMirrored])
+def buffer_class(request):
+    if (request.param is RingBufferMirrored and
+            not sys.platform.startswith('linux')):
+        pytest.skip('Mirrored memory requires Linux')
+    return request.param
+
+
+def test_dtype(buffer_class):
+    assert(buffer_class(2, 10).data.dtype == DTYPE)
+    assert(buffer_class(2, 10, dtype=np.float64).data.dtype == np.float64)
+
+
+def test_nd_frames(buffer_class):
+    buffer = buffer_class((2, 3), maxlen=5)
+    chunk = np.arange(2 * 3 * 7).reshape((2, 3, 7))
+    buffer.extend(chunk)
+    assert(np.array_equal(buffer.data, chunk[..., -5:]))
+    with pytest.raises(ValueError):
+        buffer.extend(np.ones((2, 4, 1)))
+
+
+def test_last_and_sample_indices(buffer_class):
+    buffer = buffer_class(1, maxlen=10)
+    buffer.extend(np.arange(25).reshape((1, 25)))
+    assert(buffer.next_sample_index == 25)
+    assert(buffer.first_sample_index == 15)
+    assert(np.array_equal(buffer.last(3), [[22, 23, 24]]))
+    assert(buffer.last(100).shape == (1, 10))
+
+
+def test_windows(buffer_class):
+    buffer = buffer_class(2, maxlen=20)
+    chunk = np.arange(2 * 12).reshape((2, 12))
+    buffer.extend(chunk)
+
+    windows, next_start = buffer.windows(window_length=4, hop=3)
+    assert(windows.shape == (2, 3, 4))
+    assert(np.array_equal(windows[:, 1], chunk[:, 3:7]))
+    assert(next_start == 9)
+
+    # Only the windows that have not been seen yet
+    buffer.extend(chunk)
+    windows, next_start = buffer.windows(4, 3, first_window_start=next_start)
+    assert(windows.shape == (2, 4, 4))
+    assert(np.array_equal(windows[:, 0], buffer.data[:, 9 - 4:13 - 4]))
+    assert(next_start == 21)
@@ -0,0 +1,90 @@
+import threading
+import multiprocessing
+
+import pytest
+import numpy as np
+from cognigraph.helpers.shared_ring_buffer import SharedRingBuffer
+
+
+@pytest.fixture
+def shared_buffer():
+    shared_buffer = SharedRingBuffer(row_cnt=3, maxlen=100)
+    yield shared_buffer
+    shared_buffer.close()
+
+
+def _read_all(consumer, sample_cnt):
+    chunks = list()
+    read_sample_cnt = 0
+    while read_sample_cnt < sample_cnt:
+        chunk = consumer.read(timeout=5)
+        assert(chunk.shape[1] > 0)
+        chunks.append(chunk.copy())
+        read_sample_cnt += chunk.shape[1]
+    consumer.release()
+    return np.concatenate(chunks, axis=1)
+
+
+def test_write_and_read(shared_buffer):
+    chunk = np.arange(3 * 70, dtype=shared_buffer._payload.dtype).reshape(
+        (3, 70))
+    for _ in range(5):  # wraps around
+        assert(shared_buffer.write(chunk))
+        assert(np.array_equal(_read_all(shared_buffer, 70), chunk))
+
+
+def test_non_blocking_read_of_empty_buffer(shared_buffer):
+    assert(shared_buffer.read(block=False).shape == (3, 0))
+    assert(shared_buffer.read(timeout=0.01).shape == (3, 0))
+
+
+def test_overrun(shared_buffer):
+    assert(shared_buffer.write(np.ones((3, 60))))
+    assert(not shared_buffer.write(np.ones((3, 60))))
+    assert(shared_buffer.overrun_chunk_count == 1)
+    assert(shared_buffer.overrun_sample_count == 60)
+    assert(shared_buffer.unread_sample_count == 60)
+
+
+def test_samples_stay_until_released(shared_buffer):
+    shared_buffer.write(np.ones((3, 60)))
+    shared_buffer.read()
+    assert(not shared_buffer.write(np.ones((3, 60))))
+    shared_buffer.release()
+    assert(shared_buffer.write(np.ones((3, 60))))
+
+
+def test_between_threads(shared_buffer):
+    data = np.random.rand(3, 1000).astype(shared_buffer._payload.dtype)
+    consumer = SharedRingBuffer.attach(shared_buffer.name)
+
+    def produce():
+        for start in range(0, 1000, 50):
+            while not shared_buffer.write(data[:, start:start + 50]):
+                pass
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+    received = _read_all(consumer, 1000)
+    producer.join()
+    consumer.close()
+
+    assert(np.array_equal(received, data))
+
+
+def _produce_in_another_process(name, chunk_cnt):
+    producer = SharedRingBuffer.attach(name)
+    for i in range(chunk_cnt):
+        while not producer.write(np.full((3, 10), i)):
+            pass
+    producer.close()
+
+
+def test_between_processes(shared_buffer):
+    process = multiprocessing.Process(target=_produce_in_another_process,
+                                      args=(shared_buffer.name, 50))
+    process.start()
+    received = _read_all(shared_buffer, 500)
+    process.join()
+
+    assert(np.array_equal(received[0], np.repeat(np.arange(50), 10)))
@@ -0,0 +1,78 @@
+import pytest
+import numpy as np
+import mne
+
+from cognigraph import DTYPE
+from cognigraph.nodes.processors import SpectralPower
+from cognigraph.nodes.sources import FileSource
+
+FREQUENCY = 500
+
+
+@pytest.fixture
+def spectral_power():
+    info = mne.create_info(['Fz', 'Cz', 'Pz'], FREQUENCY, 'eeg')
+    input_node = FileSource()
+    input_node.mne_info = info
+    spectral_power = SpectralPower(window_length=0.5, hop=0.1)
+    spectral_power.input_node = input_node
+    return spectral_power
+
+
+def _feed(spectral_power, signal, chunk_size):
+    outputs = list()
+    for start in range(0, signal.shape[1], chunk_size):
+        spectral_power.input_node.output = signal[:, start:start + chunk_size]
+        spectral_power._update()
+        outputs.append(spectral_power.output)
+    return np.concatenate(outputs, axis=1)
+
+
+@pytest.fixture
+def signal():
+    return np.random.RandomState(0).randn(3, 1000).astype(DTYPE)
+
+
+def test_initialize(spectral_power):
+    spectral_power.initialize()
+    band_count = len(SpectralPower.DEFAULT_BANDS)
+    assert(spectral_power.mne_info['nchan'] == band_count * 3)
+    assert(spectral_power.mne_info['ch_names'][1] == 'Cz 1-4 Hz')
+    assert(spectral_power.mne_info['sfreq'] == 10)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 50, 1000])
+def test_a_sample_per_hop(spectral_power, signal, chunk_size):
+    spectral_power.initialize()
+    output = _feed(spectral_power, signal, chunk_size)
+    # Windows of 250 samples starting at 0, 50, ..., 750
+    assert(output.shape == (15, 16))
+    assert(output.dtype == DTYPE)
+    assert(np.all(output >= 0))
+
+
+def test_chunks_give_the_same_result(spectral_power, signal):
+    spectral_power.initialize()
+    whole = _feed(spectral_power, signal, 1000)
+    spectral_power._on_input_history_invalidation()
+    chunked = _feed(spectral_power, signal, 33)
+    assert(np.allclose(whole, chunked))
+
+
+def test_frequency_bins(spectral_power, signal):
+    spectral_power.bands = None
+    spectral_power.taper = 'dpss'
+    spectral_power.initialize()
+    output = _feed(spectral_power, signal, 100)
+    assert(len(spectral_power.frequencies) == 126)
+    assert(output.shape == (126 * 3, 16))
+    assert(spectral_power.band_output.shape == (126, 3, 2))
+
+
+def test_check_value(spectral_power):
+    with pytest.raises(ValueError):
+        spectral_power.taper = 'boxcar'
+    with pytest.raises(ValueError):
+        spectral_power.hop = 0
+    with pytest.raises(ValueError):
+        spectral_power.bands = ((8, 4), )
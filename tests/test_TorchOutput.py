@@ -0,0 +1,110 @@
+import pytest
+import numpy as np
+import mne
+
+from cognigraph import DTYPE
+from cognigraph.nodes.outputs import TorchOutput
+from cognigraph.nodes.sources import FileSource
+from cognigraph.helpers.metrics import NodeMetrics
+
+torch = pytest.importorskip('torch')
+
+FREQUENCY = 100
+CHANNEL_COUNT = 3
+CHUNK_SIZE = 5
+WINDOW_LENGTH = 0.1  # 10 samples
+
+
+class MeanOverTime(torch.nn.Module):
+    """1 x CHANNELS x TIME -> 1 x CHANNELS x 1"""
+    def __init__(self, sample_count):
+        super().__init__()
+        self.linear = torch.nn.Linear(sample_count, 1)
+        with torch.no_grad():
+            self.linear.weight.fill_(1 / sample_count)
+            self.linear.bias.zero_()
+
+    def forward(self, window):
+        return self.linear(window)
+
+
+@pytest.fixture
+def data():
+    return np.random.RandomState(0).randn(
+        CHANNEL_COUNT, 10 * CHUNK_SIZE).astype(DTYPE)
+
+
+@pytest.fixture
+def torch_output():
+    input_node = FileSource()
+    input_node.mne_info = mne.create_info(CHANNEL_COUNT, FREQUENCY, 'eeg')
+    torch_output = TorchOutput(
+        model=MeanOverTime(int(WINDOW_LENGTH * FREQUENCY)),
+        window_length=WINDOW_LENGTH)
+    torch_output.input_node = input_node
+    return torch_output
+
+
+def _feed_chunk(torch_output, data, chunk_index):
+    torch_output.input_node.output = data[
+        :, chunk_index * CHUNK_SIZE:(chunk_index + 1) * CHUNK_SIZE]
+    torch_output.input_node.acquisition_time = 1000.0 + chunk_index
+    torch_output.update()
+
+
+def test_synchronous_prediction(torch_output, data):
+    torch_output.use_background_thread = False
+    torch_output.initialize()
+
+    _feed_chunk(torch_output, data, 0)
+    assert(torch_output.output is None)  # the window is not full yet
+
+    _feed_chunk(torch_output, data, 1)
+    assert(torch_output.output.shape == (1, CHANNEL_COUNT, 1))
+    assert(np.allclose(torch_output.output.numpy()[0, :, 0],
+                       data[:, :2 * CHUNK_SIZE].mean(axis=1), atol=1e-6))
+    assert(torch_output.acquisition_time == 1001.0)
+
+
+def test_background_prediction(torch_output, data):
+    torch_output.initialize()
+    _feed_chunk(torch_output, data, 0)
+    _feed_chunk(torch_output, data, 1)
+
+    future = torch_output._pending_prediction
+    assert(future is not None)
+    future.result(timeout=10)
+
+    # The prediction is picked up on the next update
+    _feed_chunk(torch_output, data, 2)
+    assert(np.allclose(torch_output.output.numpy()[0, :, 0],
+                       data[:, :2 * CHUNK_SIZE].mean(axis=1), atol=1e-6))
+    assert(torch_output.acquisition_time == 1001.0)
+    torch_output._shutdown_executor()
+
+
+def test_passes_input_through_without_a_model(torch_output, data):
+    torch_output.model = None
+    torch_output.initialize()
+    _feed_chunk(torch_output, data, 0)
+    assert(isinstance(torch_output.output, torch.Tensor))
+    assert(np.array_equal(torch_output.output.numpy(), data[:, :CHUNK_SIZE]))
+
+
+def test_latency_is_recorded_once_per_prediction(torch_output, data):
+    torch_output.use_background_thread = False
+    torch_output.batch_every_x_chunks = 2
+    torch_output.initialize()
+    torch_output.metrics = NodeMetrics()
+
+    for chunk_index in range(4):
+        _feed_chunk(torch_output, data, chunk_index)
+        if chunk_index == 2:
+            # The prediction from the first window is still the output
+            assert(torch_output.output is not None)
+            assert(torch_output.acquisition_time is None)
+            assert(torch_output.prediction_acquisition_time == 1001.0)
+
+    # Windows ending with chunks 1 and 3
+    assert(torch_output.metrics.update_count == 4)
+    assert(torch_output.metrics.histograms['latency'].count == 2)
@@ -0,0 +1,52 @@
+import pytest
+import numpy as np
+import mne
+
+from cognigraph import DTYPE
+from cognigraph.nodes.processors import EnvelopeExtractor
+from cognigraph.nodes.sources import FileSource
+from cognigraph.helpers.metrics import NodeMetrics
+
+FREQUENCY = 500
+
+
+@pytest.fixture
+def envelope_extractor():
+    input_node = FileSource()
+    input_node.mne_info = mne.create_info(['Fz', 'Cz'], FREQUENCY, 'eeg')
+    input_node.output = np.random.RandomState(0).randn(2, 100).astype(DTYPE)
+    envelope_extractor = EnvelopeExtractor()
+    envelope_extractor.input_node = input_node
+    envelope_extractor.initialize()
+    return envelope_extractor
+
+
+def test_is_inherited_from_the_input_node(envelope_extractor):
+    envelope_extractor.input_node.acquisition_time = 1000.0
+    envelope_extractor.update()
+    assert(envelope_extractor.acquisition_time == 1000.0)
+
+    envelope_extractor.input_node.acquisition_time = None
+    envelope_extractor.update()
+    assert(envelope_extractor.acquisition_time is None)
+
+
+def test_is_passed_through_by_disabled_nodes(envelope_extractor):
+    envelope_extractor.disabled = True
+    envelope_extractor.input_node.acquisition_time = 1000.0
+    envelope_extractor.update()
+    assert(envelope_extractor.acquisition_time == 1000.0)
+
+
+def test_latency_is_recorded_when_known(envelope_extractor):
+    envelope_extractor.metrics = NodeMetrics()
+
+    envelope_extractor.input_node.acquisition_time = None
+    envelope_extractor.update()
+    assert(envelope_extractor.metrics.histograms['latency'].count == 0)
+
+    envelope_extractor.input_node.acquisition_time = 1000.0
+    envelope_extractor.update()
+    latency = envelope_extractor.metrics.histograms['latency']
+    assert(latency.count == 1)
+    assert(latency.max > 0)
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from cognigraph import DTYPE
+from cognigraph.helpers.asr import calibrate_asr, ASRFilter
+
+FREQUENCY = 250
+WINDOW_LENGTH = 125
+
+
+@pytest.fixture
+def mixing():
+    return np.random.RandomState(0).randn(16, 16)
+
+
+@pytest.fixture
+def asr_filter(mixing):
+    clean = mixing.dot(np.random.RandomState(1).randn(16, 30 * FREQUENCY))
+    return ASRFilter(*calibrate_asr(clean, FREQUENCY),
+                     window_length=WINDOW_LENGTH)
+
+
+def test_calibration(mixing):
+    clean = mixing.dot(np.random.RandomState(1).randn(16, 30 * FREQUENCY))
+    asr_mixing, threshold = calibrate_asr(clean, FREQUENCY)
+    # The mixing matrix is the square root of the covariance
+    assert(np.allclose(asr_mixing.dot(asr_mixing), mixing.dot(mixing.T),
+                       rtol=0.1, atol=0.5))
+    with pytest.raises(ValueError):
+        calibrate_asr(clean[:, :10], FREQUENCY)
+
+
+def test_clean_data_are_passed_through(asr_filter, mixing):
+    data = mixing.dot(np.random.RandomState(2).randn(
+        16, 10 * FREQUENCY)).astype(DTYPE)
+    output = asr_filter.apply(data)
+    assert(output.dtype == DTYPE)
+    assert(np.array_equal(output, data))
+
+
+def test_artifacts_are_removed(asr_filter, mixing):
+    rng = np.random.RandomState(2)
+    data = mixing.dot(rng.randn(16, 10 * FREQUENCY))
+    artifact = np.zeros_like(data)
+    artifact[:, 1000:1250] = np.outer(rng.randn(16), 50 * np.hanning(250))
+
+    output = np.hstack([
+        asr_filter.apply((data + artifact)[:, start:start + 10])
+        for start in range(0, data.shape[1], 10)])
+    residual_power = np.mean(np.square(output - data)[:, 1000:1250])
+    artifact_power = np.mean(np.square(artifact[:, 1000:1250]))
+    assert(residual_power < 0.1 * artifact_power)
+    # Away from the artifact nothing changes
+    assert(np.allclose(output[:, :900], data[:, :900], atol=1e-4))
+    assert(np.allclose(output[:, 1500:], data[:, 1500:], atol=1e-4))
+
+
+def test_chunk_size_does_not_matter(asr_filter, mixing):
+    rng = np.random.RandomState(2)
+    data = mixing.dot(rng.randn(16, 4 * FREQUENCY))
+    data[:, 500:600] += np.outer(rng.randn(16), 50 * np.hanning(100))
+    whole = asr_filter.apply(data)
+    asr_filter.reset()
+    chunks = [asr_filter.apply(data[:, start:start + 7])
+              for start in range(0, data.shape[1], 7)]
+    assert(np.allclose(np.hstack(chunks), whole, atol=1e-3))
@@ -0,0 +1,62 @@
+import pytest
+import numpy as np
+
+pytest.importorskip('PyQt5')
+pytest.importorskip('vispy')
+
+from cognigraph.gui import brain_painter  # noqa: E402
+from cognigraph.gui.brain_painter import BrainPainter  # noqa: E402
+
+
+def _make_hemi(rng, vertex_count, use_tris, vertno):
+    return {'rr': rng.rand(vertex_count, 3) / 10,  # meters
+            'use_tris': np.array(use_tris),
+            'vertno': np.array(vertno)}
+
+
+@pytest.fixture
+def source_space():
+    rng = np.random.RandomState(0)
+    # Vertices 0 and 2 of the left and 0 of the right hemisphere are not on
+    # the decimated mesh
+    lh = _make_hemi(rng, 6, [[1, 3, 5], [3, 4, 5]], [3, 5])
+    rh = _make_hemi(rng, 5, [[1, 2, 3], [2, 4, 3]], [1, 2, 4])
+    return [lh, rh]
+
+
+@pytest.fixture
+def painter(source_space, monkeypatch):
+    monkeypatch.setattr(brain_painter.mne, 'read_forward_solution',
+                        lambda fname, verbose=None: {'src': source_space})
+    return BrainPainter(mesh_resolution=BrainPainter.MESH_RESOLUTIONS.LOW)
+
+
+def test_low_resolution_mesh(painter, source_space):
+    lh, rh = source_space
+    sources_idx, vertexes, faces =\
+        painter._get_low_resolution_mesh_from_forward_solution('fwd.fif')
+
+    # Only the vertices of the triangles are kept, lh first
+    assert(vertexes.shape == (8, 3))
+    assert(np.array_equal(faces, [[0, 1, 3], [1, 2, 3],
+                                  [4, 5, 6], [5, 7, 6]]))
+    assert(np.array_equal(sources_idx, [1, 3, 4, 5, 7]))
+
+    # Vertices are in millimeters and each hemisphere is moved as a whole
+    for hemi, vertex_slice in ((lh, slice(0, 4)), (rh, slice(4, 8))):
+        used_vertexes = hemi['rr'][np.unique(hemi['use_tris'])] * 1000
+        shifts = vertexes[vertex_slice] - used_vertexes
+        assert(np.allclose(shifts, shifts[0]))
+
+    # Triangles are the same as in the source space
+    original_triangles = np.r_[lh['rr'][lh['use_tris']] * 1000,
+                               rh['rr'][rh['use_tris']] * 1000]
+    triangles = vertexes[faces]
+    assert(np.allclose(np.diff(triangles, axis=1),
+                       np.diff(original_triangles, axis=1)))
+
+
+def test_sources_off_the_mesh(painter, source_space):
+    source_space[0]['vertno'] = np.array([0, 3])
+    with pytest.raises(ValueError):
+        painter._get_low_resolution_mesh_from_forward_solution('fwd.fif')
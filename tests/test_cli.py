@@ -0,0 +1,24 @@
+import pytest
+from cognigraph.cli import SimulatedClock, build_pipeline
+
+
+def test_simulated_clock():
+    clock = SimulatedClock(step=0.5)
+    assert(clock() == 0.5)
+    assert(clock() == 1.0)
+
+
+def test_gui_outputs_are_not_supported():
+    config = {'source': {'class': 'FileSource'},
+              'outputs': [{'class': 'SignalViewer'}]}
+    with pytest.raises(ValueError):
+        build_pipeline(config)
+
+
+def test_ica_rejection_does_not_need_the_gui():
+    config = {'source': {'class': 'FileSource'},
+              'processors': [{'class': 'ICARejection',
+                              'component_selection': 'auto'}]}
+    pipeline = build_pipeline(config)
+    ica_rejection = pipeline.all_nodes[1]
+    assert(ica_rejection.component_selection == 'auto')
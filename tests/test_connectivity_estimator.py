@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from cognigraph.helpers.connectivity import (ConnectivityEstimator,
+                                             SUPPORTED_METHODS, all_pairs)
+
+
+@pytest.fixture
+def analytic_signal():
+    rng = np.random.RandomState(0)
+    signal = rng.randn(5, 2000) + 1j * rng.randn(5, 2000)
+    # Channel 1 is channel 0 with a constant phase lag and amplitude noise
+    signal[1] = signal[0] * np.exp(0.7j) * (1 + 0.3 * rng.rand(2000))
+    return signal.astype(np.complex64)
+
+
+def _apply_in_chunks(estimator, signal, chunk_size):
+    for start in range(0, signal.shape[1], chunk_size):
+        values = estimator.apply(signal[:, start:start + chunk_size])
+    return values
+
+
+@pytest.mark.parametrize('method', SUPPORTED_METHODS)
+def test_chunks_and_pair_subsets_give_the_same_result(analytic_signal,
+                                                      method):
+    all_at_once = ConnectivityEstimator(method, 5, factor=0.99).apply(
+        analytic_signal)
+    chunked = _apply_in_chunks(ConnectivityEstimator(method, 5, factor=0.99),
+                               analytic_signal, chunk_size=13)
+    pairs = all_pairs(5)[[0, 5, 9]]
+    subset = ConnectivityEstimator(method, 5, factor=0.99,
+                                   pairs=pairs).apply(analytic_signal)
+    assert(all_at_once.shape == (10, ))
+    assert(np.allclose(all_at_once, chunked, atol=1e-4))
+    assert(np.allclose(all_at_once[[0, 5, 9]], subset, atol=1e-4))
+
+
+def test_coupled_channels(analytic_signal):
+    plv, imaginary_coherence, aec = [
+        ConnectivityEstimator(method, 5, factor=0.99).apply(analytic_signal)
+        for method in SUPPORTED_METHODS]
+    # Pair 0 is (0, 1), the others are independent
+    assert(np.isclose(plv[0], 1, atol=1e-4))
+    assert(np.all(plv[1:] < 0.5))
+    assert(np.isclose(imaginary_coherence[0], -np.sin(0.7), atol=0.05))
+    assert(np.all(np.abs(imaginary_coherence[1:]) < 0.5))
+    assert(aec[0] > 0.9)
+
+
+def test_zero_lag_coupling_is_ignored(analytic_signal):
+    analytic_signal[2] = 2 * analytic_signal[3]
+    imaginary_coherence = ConnectivityEstimator(
+        'Imaginary coherence', 5, factor=0.99,
+        pairs=[(2, 3)]).apply(analytic_signal)
+    plv = ConnectivityEstimator('PLV', 5, factor=0.99,
+                                pairs=[(2, 3)]).apply(analytic_signal)
+    assert(np.allclose(imaginary_coherence, 0, atol=1e-4))
+    assert(np.allclose(plv, 1, atol=1e-4))
+
+
+def test_unsupported_method():
+    with pytest.raises(ValueError):
+        ConnectivityEstimator('wPLI', 5, factor=0.99)
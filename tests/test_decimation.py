@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from scipy.signal import firwin, upfirdn
+
+from cognigraph import DTYPE
+from cognigraph.helpers.decimation import PolyphaseResampler, MinMaxDecimator
+
+
+def _apply_in_chunks(resampler, signal, chunk_sizes=(1, 7, 0, 100, 33, 600)):
+    outputs = list()
+    start = 0
+    i = 0
+    while start < signal.shape[1]:
+        stop = start + chunk_sizes[i % len(chunk_sizes)]
+        outputs.append(resampler.apply(signal[:, start:stop]))
+        start = stop
+        i += 1
+    return np.concatenate(outputs, axis=1)
+
+
+@pytest.mark.parametrize('up, down', [(1, 1), (1, 4), (2, 3), (5, 2),
+                                      (125, 256)])
+def test_chunks_give_the_same_result_as_upfirdn(up, down):
+    signal = np.random.RandomState(0).randn(3, 3000).astype(DTYPE)
+    resampler = PolyphaseResampler(up, down, channel_count=3)
+    output = _apply_in_chunks(resampler, signal)
+    assert(output.dtype == DTYPE)
+    assert(output.shape == (3, -(-3000 * up // down)))
+
+    max_rate = max(up, down)
+    if max_rate == 1:
+        taps = np.ones(1)
+    else:
+        taps = firwin(20 * max_rate + 1, 1 / max_rate,
+                      window=('kaiser', 5.0)) * up
+    expected = upfirdn(taps, signal, up, down)[:, :output.shape[1]]
+    assert(np.allclose(output, expected, atol=1e-5))
+
+
+def test_sinusoid_is_delayed_by_group_delay():
+    frequency = 1000
+    times = np.arange(2000) / frequency
+    signal = np.sin(2 * np.pi * 10 * times)[np.newaxis].astype(DTYPE)
+    resampler = PolyphaseResampler(1, 4, channel_count=1)
+    output = resampler.apply(signal)[0]
+
+    output_times = ((np.arange(len(output)) - resampler.group_delay) * 4 /
+                    frequency)
+    expected = np.sin(2 * np.pi * 10 * output_times)
+    # Skip the samples while the filter is filled with the signal
+    assert(np.allclose(output[50:], expected[50:], atol=1e-2))
+
+
+def test_min_max_decimator_in_chunks():
+    signal = np.random.RandomState(0).randn(3, 1000).astype(DTYPE)
+    output = _apply_in_chunks(MinMaxDecimator(samples_per_bin=10, row_cnt=3),
+                              signal)
+    assert(output.dtype == DTYPE)
+    bins = signal.reshape(3, 100, 10)
+    assert(np.array_equal(output[:, 0::2], bins.min(axis=2)))
+    assert(np.array_equal(output[:, 1::2], bins.max(axis=2)))
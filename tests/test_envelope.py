@@ -0,0 +1,115 @@
+import numpy as np
+import pytest
+
+from cognigraph import DTYPE
+from cognigraph.helpers.envelope import (ExponentialSmoothingEnvelope,
+                                         ExponentialRMSEnvelope, CFIREnvelope,
+                                         CFIRFilter, OverlapSaveFilter,
+                                         cfir_taps,
+                                         default_cfir_tap_count)
+
+FREQUENCY = 500.0
+
+
+@pytest.fixture
+def amplitude():
+    times = np.arange(5000) / FREQUENCY
+    return 1 + 0.5 * np.sin(2 * np.pi * 0.3 * times)
+
+
+@pytest.fixture
+def signal(amplitude):
+    times = np.arange(len(amplitude)) / FREQUENCY
+    alpha = amplitude * np.sin(2 * np.pi * 10 * times)
+    noise = np.random.RandomState(0).randn(len(times))
+    return np.vstack((alpha, noise)).astype(DTYPE)
+
+
+def _apply_in_chunks(detector, signal, chunk_sizes=(1, 3, 0, 100, 7, 600)):
+    outputs = list()
+    start = 0
+    i = 0
+    while start < signal.shape[1]:
+        stop = start + chunk_sizes[i % len(chunk_sizes)]
+        outputs.append(detector.apply(signal[:, start:stop]))
+        start = stop
+        i += 1
+    return np.concatenate(outputs, axis=1)
+
+
+@pytest.mark.parametrize('detector', [
+    ExponentialSmoothingEnvelope(factor=0.9, channel_count=2),
+    ExponentialRMSEnvelope(factor=0.99, channel_count=2),
+    CFIREnvelope((8, 12), FREQUENCY, delay=25, channel_count=2)])
+def test_chunks_give_the_same_result_as_the_whole_signal(detector, signal):
+    whole = detector.apply(signal)
+    detector.reset()
+    chunked = _apply_in_chunks(detector, signal)
+    assert(whole.dtype == DTYPE)
+    assert(np.allclose(whole, chunked, atol=1e-5))
+
+
+def test_overlap_save_agrees_with_convolution():
+    rng = np.random.RandomState(0)
+    taps = rng.randn(50) + 1j * rng.randn(50)
+    signal = rng.randn(3, 1000).astype(DTYPE)
+    overlap_save_filter = OverlapSaveFilter(taps, channel_count=3)
+    output = _apply_in_chunks(overlap_save_filter, signal,
+                              chunk_sizes=(1, 500, 2, 200))
+    expected = np.array([np.convolve(row, taps)[:1000] for row in signal])
+    assert(np.allclose(output, expected, atol=1e-3))
+
+
+@pytest.mark.parametrize('delay', [25, 50])
+def test_cfir_filter_gives_the_delayed_analytic_signal(signal, delay):
+    from scipy.signal import hilbert
+
+    cfir_filter = CFIRFilter((8, 12), FREQUENCY, delay=delay, channel_count=2)
+    output = cfir_filter.apply(signal)[0]
+    analytic_signal = np.roll(hilbert(signal[0]), cfir_filter.group_delay)
+    # Skip the first second, while the filter is filled with the signal, and
+    # the edge effects of hilbert at the end
+    assert(np.abs(output - analytic_signal)[500:-500].max() < 0.05)
+
+
+@pytest.mark.parametrize('delay', [25, 50])
+def test_cfir_envelope_follows_the_amplitude(signal, amplitude, delay):
+    detector = CFIREnvelope((8, 12), FREQUENCY, delay=delay, channel_count=2)
+    envelope = detector.apply(signal)[0]
+    delayed_amplitude = np.roll(amplitude, detector.group_delay)
+    # Skip the first second, while the filter is filled with the signal
+    assert(np.abs(envelope - delayed_amplitude)[500:].max() < 0.05)
+
+
+def test_rms_of_a_sinusoid(signal, amplitude):
+    constant_amplitude = signal[:1] / amplitude
+    detector = ExponentialRMSEnvelope(factor=0.99, channel_count=1)
+    rms = detector.apply(constant_amplitude)[0, 1000:]
+    assert(np.allclose(rms * np.sqrt(2), 1, atol=0.1))
+
+
+@pytest.mark.parametrize('delay', [0, 25])
+def test_cfir_taps_solve_the_least_squares_problem(delay):
+    n_taps, n_fft = 100, 400
+    taps = cfir_taps((8, 12), FREQUENCY, delay, n_taps)
+
+    # The dense normal equations that the Toeplitz solver replaces
+    frequencies = np.arange(n_fft) / n_fft * FREQUENCY
+    ideal_response = 2 * np.exp(-2j * np.pi * np.arange(n_fft) / n_fft * delay)
+    ideal_response[(frequencies < 8) | (frequencies > 12)] = 0
+    weights = np.ones(n_fft)
+    weights[(frequencies > 4) & (frequencies < 8)] = 0
+    weights[(frequencies > 12) & (frequencies < 16)] = 0
+    F = np.exp(-2j * np.pi / n_fft * np.outer(np.arange(n_fft),
+                                              np.arange(n_taps)))
+    F_H_W = F.conj().T * weights
+    expected = np.linalg.solve(F_H_W.dot(F), F_H_W.dot(ideal_response))
+    assert(np.allclose(taps, expected, atol=1e-10))
+
+
+def test_default_cfir_tap_count():
+    # 4 periods of the band width
+    assert(default_cfir_tap_count((8, 12), FREQUENCY, delay=25) == 500)
+    assert(default_cfir_tap_count((8, 28), 5000, delay=250) == 1000)
+    # Long delays need more taps
+    assert(default_cfir_tap_count((8, 28), FREQUENCY, delay=150) == 301)
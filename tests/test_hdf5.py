@@ -0,0 +1,47 @@
+import threading
+
+import numpy as np
+from cognigraph.helpers.hdf5 import BackgroundChunkWriter, choose_chunkshape
+
+
+def test_chunkshape():
+    channel_count, sample_count = choose_chunkshape(
+        64, np.float32, target_byte_count=2 ** 18)
+    assert(channel_count == 64)
+    assert(sample_count == 2 ** 18 // (64 * 4))
+
+
+def test_writes_chunks_in_order_from_another_thread():
+    written = list()
+    writing_threads = set()
+
+    def write(chunk):
+        written.append(chunk)
+        writing_threads.add(threading.current_thread())
+
+    flushes = list()
+    writer = BackgroundChunkWriter(write, lambda: flushes.append(1))
+    writer.start()
+    for i in range(100):
+        assert(writer.put(i))
+    writer.stop()
+
+    assert(written == list(range(100)))
+    assert(writing_threads == {writer})
+    assert(len(flushes) >= 1)  # on stop
+    assert(writer.dropped_chunk_count == 0)
+
+
+def test_drops_chunks_when_queue_is_full():
+    written = list()
+    writer = BackgroundChunkWriter(written.append, max_queued_chunk_count=2)
+    # Not started, so nothing leaves the queue
+    assert(writer.put(0))
+    assert(writer.put(1))
+    assert(not writer.put(2))
+    assert(writer.dropped_chunk_count == 1)
+    assert(writer.queued_chunk_count == 2)
+
+    writer.start()
+    writer.stop()
+    assert(written == [0, 1])
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from cognigraph.helpers.ica import (fit_ica, find_artifact_components,
+                                    make_rejection_matrix)
+
+
+@pytest.fixture
+def sources():
+    # Three non-gaussian sources and blinks
+    rng = np.random.RandomState(0)
+    t = np.arange(10000)
+    blinks = np.zeros(len(t))
+    for start in range(500, len(t), 2000):
+        blinks[start:start + 100] = 20 * np.hanning(100)
+    return np.vstack([np.sin(t / 20), np.sign(np.sin(t / 33)),
+                      rng.laplace(size=len(t)), blinks])
+
+
+@pytest.fixture
+def mixing():
+    return np.random.RandomState(1).randn(6, 4)
+
+
+def test_fastica_recovers_the_sources(sources, mixing):
+    progress = []
+    unmixing, estimated_mixing = fit_ica(mixing.dot(sources),
+                                         progress=progress.append)
+    assert(unmixing.shape == (4, 6))
+    assert(estimated_mixing.shape == (6, 4))
+    assert(0 < progress[-1] <= 1)
+
+    # Every source is one of the estimated ones up to scale and sign
+    estimated = unmixing.dot(mixing.dot(sources))
+    correlations = np.abs(np.corrcoef(sources, estimated)[:4, 4:])
+    assert(np.all(correlations.max(axis=1) > 0.99))
+
+
+def test_n_components(sources, mixing):
+    unmixing, _ = fit_ica(mixing.dot(sources), n_components=2)
+    assert(unmixing.shape == (2, 6))
+
+
+def test_unsupported_method(sources, mixing):
+    with pytest.raises(ValueError):
+        fit_ica(mixing.dot(sources), method='jade')
+
+
+def test_artifact_components(sources):
+    rng = np.random.RandomState(2)
+    eog = sources[3] + 0.1 * rng.randn(sources.shape[1])
+    assert(find_artifact_components(sources[:3], eog[np.newaxis]) == [])
+    assert(find_artifact_components(sources, eog[np.newaxis]) == [3])
+    # Blinks are sparse, so they are found without a reference too
+    many_sources = np.vstack([rng.randn(10, sources.shape[1]), sources[3]])
+    assert(find_artifact_components(many_sources) == [10])
+
+
+def test_rejection_matrix_removes_the_components(sources, mixing):
+    data = mixing.dot(sources)
+    unmixing, estimated_mixing = fit_ica(data)
+    estimated = unmixing.dot(data - data.mean(axis=1, keepdims=True))
+    blink_component = np.argmax(np.abs(np.corrcoef(sources[3],
+                                                   estimated)[0, 1:]))
+    rejection_matrix = make_rejection_matrix(unmixing, estimated_mixing,
+                                             [blink_component])
+    cleaned = rejection_matrix.dot(data)
+    expected = mixing[:, :3].dot(sources[:3])
+    for channel, expected_channel in zip(cleaned, expected):
+        assert(abs(np.corrcoef(channel, sources[3])[0, 1]) < 0.01)
+        assert(np.corrcoef(channel, expected_channel)[0, 1] > 0.99)
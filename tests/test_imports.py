@@ -0,0 +1,23 @@
+import sys
+import subprocess
+
+import pytest
+
+# Dependencies that only some of the nodes need and that take seconds to
+# import. A headless pipeline should not pay for them.
+HEAVY_MODULES = ('torch', 'vispy', 'nibabel', 'tables', 'matplotlib',
+                 'pyqtgraph', 'PyQt5', 'sklearn', 'numba', 'scipy.optimize')
+
+
+@pytest.mark.parametrize('module', ['cognigraph.nodes.sources',
+                                    'cognigraph.nodes.processors',
+                                    'cognigraph.nodes.outputs',
+                                    'cognigraph.pipeline'])
+def test_heavy_dependencies_are_not_imported(module):
+    code = ('import sys; import {}; '
+            'print(" ".join(m for m in {!r} if m in sys.modules))'.format(
+                module, HEAVY_MODULES))
+    completed = subprocess.run([sys.executable, '-c', code],
+                               stdout=subprocess.PIPE, check=True,
+                               universal_newlines=True)
+    assert(completed.stdout.split() == [])
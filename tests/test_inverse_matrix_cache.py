@@ -0,0 +1,51 @@
+import numpy as np
+import mne
+
+from cognigraph.helpers import inverse_model
+
+
+def _count_computations(monkeypatch):
+    computations = []
+
+    def compute(fwd, mne_info, snr, method):
+        computations.append((snr, method))
+        return np.full((3, 2), len(computations), dtype=float), None
+
+    monkeypatch.setattr(inverse_model, '_compute_inverse_model_matrix',
+                        compute)
+    return computations
+
+
+def _get_matrix(forward_file_path, snr=1.0):
+    info = mne.create_info(['Fz', 'Cz'], 500, 'eeg')
+    inverse_model_matrix, _ = (
+        inverse_model.get_inverse_model_matrix_and_decomposition(
+            str(forward_file_path), None, info, snr=snr, method='MNE'))
+    return inverse_model_matrix
+
+
+def test_matrices_are_read_from_the_cache(tmp_path, monkeypatch,
+                                          inverse_matrix_cache_dir):
+    computations = _count_computations(monkeypatch)
+    forward_file_path = tmp_path / 'fake-fwd.fif'
+    forward_file_path.write_bytes(b'forward')
+
+    first = _get_matrix(forward_file_path)
+    assert(np.array_equal(_get_matrix(forward_file_path), first))
+    assert(len(computations) == 1)
+    assert(len(list(inverse_matrix_cache_dir.iterdir())) == 1)
+
+    _get_matrix(forward_file_path, snr=3.0)
+    assert(len(computations) == 2)
+
+
+def test_no_cache_dir_disables_the_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(inverse_model, 'INVERSE_MATRIX_CACHE_DIR', None)
+    computations = _count_computations(monkeypatch)
+    forward_file_path = tmp_path / 'fake-fwd.fif'
+    forward_file_path.write_bytes(b'forward')
+
+    _get_matrix(forward_file_path)
+    _get_matrix(forward_file_path)
+    assert(len(computations) == 2)
+    assert(list(tmp_path.iterdir()) == [forward_file_path])
@@ -0,0 +1,187 @@
+import pytest
+import numpy as np
+import mne
+
+from cognigraph import DTYPE
+from cognigraph.helpers.inverse_model import (
+    get_clean_forward, make_inverse_operator, InverseOperatorDecomposition)
+from cognigraph.nodes import processors
+from cognigraph.nodes.processors import InverseModel
+from cognigraph.nodes.sources import FileSource
+
+
+@pytest.mark.parametrize('method', ['MNE', 'dSPM', 'sLORETA'])
+@pytest.mark.parametrize('snr', [1.0, 3.0])
+def test_decomposition_matches_apply_inverse_raw(toy_forward, method, snr):
+    from mne.minimum_norm import apply_inverse_raw
+
+    forward_file_path, info = toy_forward
+    fwd, _ = get_clean_forward(forward_file_path, info)
+    inverse_operator = make_inverse_operator(fwd, info)
+    decomposition = InverseOperatorDecomposition(inverse_operator)
+
+    # Sources of unit impulses on each channel are the columns of the matrix
+    identity = mne.io.RawArray(np.eye(info['nchan']), info, verbose='ERROR')
+    stc = apply_inverse_raw(identity, inverse_operator, lambda2=1 / snr ** 2,
+                            method=method, verbose='ERROR')
+
+    matrix = decomposition.matrix(snr=snr, method=method)
+    assert(np.allclose(matrix, stc.data, rtol=1e-6, atol=0))
+
+
+@pytest.fixture
+def inverse_model(toy_forward):
+    forward_file_path, info = toy_forward
+    input_node = FileSource()
+    input_node.mne_info = info.copy()
+    input_node.output = np.random.RandomState(0).randn(
+        info['nchan'], 10).astype(DTYPE)
+    inverse_model = InverseModel(forward_model_path=forward_file_path)
+    inverse_model.input_node = input_node
+    return inverse_model
+
+
+def _wait_for_the_background_thread(inverse_model):
+    future = inverse_model._pending_inverse_model_matrix
+    assert(future is not None)
+    future.result(timeout=60)
+    inverse_model.update()
+    assert(inverse_model._pending_inverse_model_matrix is None)
+
+
+def _forbid_decomposing_on_this_thread(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError('Decomposed on the pipeline thread')
+    monkeypatch.setattr(processors, 'make_inverse_operator_decomposition',
+                        fail)
+
+
+def test_snr_and_method_changes_reuse_the_decomposition(
+        inverse_model, monkeypatch):
+    inverse_model.initialize()
+    decomposition = inverse_model._inverse_operator_decomposition
+    assert(decomposition is not None)
+
+    _forbid_decomposing_on_this_thread(monkeypatch)
+    inverse_model.snr = 3.0
+    inverse_model.method = 'dSPM'
+    inverse_model.update()  # Resets
+    assert(np.array_equal(inverse_model.inverse_model_matrix,
+                          decomposition.matrix(snr=3.0, method='dSPM')))
+    inverse_model.update()
+    assert(inverse_model.output.shape == (40, 10))
+    inverse_model.close()
+
+
+def test_decomposition_is_built_in_the_background_after_a_cache_hit(
+        inverse_model, toy_forward):
+    forward_file_path, info = toy_forward
+    inverse_model.initialize()  # fills the cache
+    inverse_model.close()
+
+    cached = InverseModel(forward_model_path=forward_file_path)
+    cached.input_node = inverse_model.input_node
+    cached.initialize()
+    assert(np.array_equal(cached.inverse_model_matrix,
+                          inverse_model.inverse_model_matrix))
+    assert(cached._inverse_operator_decomposition is None)
+
+    _wait_for_the_background_thread(cached)
+    assert(cached._inverse_operator_decomposition is not None)
+    cached.close()
+
+
+def test_bads_change_rebuilds_the_decomposition_in_the_background(
+        inverse_model, monkeypatch):
+    inverse_model.initialize()
+
+    inverse_model.input_node.mne_info['bads'] = ['EEG 010']
+    inverse_model.update()
+    assert(inverse_model._inverse_operator_decomposition is None)
+    assert('EEG 010' not in inverse_model._inverse_model_matrix_ch_names)
+
+    # A change of snr meanwhile is not computed on the pipeline thread
+    _forbid_decomposing_on_this_thread(monkeypatch)
+    inverse_model.snr = 3.0
+    inverse_model.update()
+    _wait_for_the_background_thread(inverse_model)
+
+    decomposition = inverse_model._inverse_operator_decomposition
+    assert(decomposition is not None)
+    assert(np.array_equal(inverse_model.inverse_model_matrix,
+                          decomposition.matrix(snr=3.0, method='MNE')))
+    assert(inverse_model.inverse_model_matrix.shape == (40, 19))
+    inverse_model.close()
+
+
+@pytest.fixture
+def toy_labels():
+    return [mne.Label(np.arange(10), hemi='lh', name='front-lh',
+                      subject='toy'),
+            mne.Label(np.arange(10, 20), hemi='lh', name='back-lh',
+                      subject='toy'),
+            mne.Label(np.arange(20), hemi='rh', name='rh', subject='toy')]
+
+
+def _whiten_the_input(inverse_model):
+    # Rows of the sensor data are orthonormal, so the fixed pca_flip weights,
+    # the components of the inverse model matrix, are also those of the data
+    input_node = inverse_model.input_node
+    q, _ = np.linalg.qr(np.random.RandomState(1).randn(
+        40, input_node.mne_info['nchan']))
+    input_node.output = q.T.astype(DTYPE)
+
+
+def _label_time_courses(sources, src, labels, mode):
+    stc = mne.SourceEstimate(sources, [hemi['vertno'] for hemi in src],
+                             tmin=0, tstep=1, subject='toy')
+    return mne.extract_label_time_course(stc, labels, src, mode=mode,
+                                         verbose='ERROR')
+
+
+@pytest.mark.parametrize('roi_method', ['mean', 'mean_flip', 'pca_flip'])
+def test_parcellation_gives_the_label_time_courses(
+        inverse_model, toy_forward, toy_labels, roi_method):
+    forward_file_path, _ = toy_forward
+    _whiten_the_input(inverse_model)
+    inverse_model.initialize()
+    inverse_model.update()
+    sources = inverse_model.output
+    inverse_model.close()
+
+    parcellated = InverseModel(forward_model_path=forward_file_path,
+                               parcellation=toy_labels,
+                               roi_method=roi_method)
+    parcellated.input_node = inverse_model.input_node
+    parcellated.initialize()
+    parcellated.update()
+    assert(parcellated.mne_info['ch_names'] == ['front-lh', 'back-lh', 'rh'])
+
+    src = mne.read_source_spaces(forward_file_path, verbose='ERROR')
+    expected = _label_time_courses(sources, src, toy_labels, roi_method)
+    assert(np.allclose(parcellated.output, expected, rtol=1e-4, atol=1e-6))
+    parcellated.close()
+
+
+def test_pca_flip_follows_the_snr_of_the_inverse_model(
+        inverse_model, toy_forward, toy_labels):
+    forward_file_path, _ = toy_forward
+    roi_aggregator = processors.ROIAggregator(parcellation=toy_labels,
+                                              method='pca_flip')
+    roi_aggregator.input_node = inverse_model
+    _whiten_the_input(inverse_model)
+    inverse_model.initialize()
+    roi_aggregator.initialize()
+
+    inverse_model.snr = 3.0
+    inverse_model.update()  # Resets
+    inverse_model.update()
+    roi_aggregator.update()  # Invalidates the input history
+    roi_aggregator.update()
+
+    src = mne.read_source_spaces(forward_file_path, verbose='ERROR')
+    expected = _label_time_courses(inverse_model.output, src, toy_labels,
+                                   'pca_flip')
+    assert(np.allclose(roi_aggregator.output, expected, rtol=1e-4,
+                       atol=1e-6))
+    inverse_model.close()
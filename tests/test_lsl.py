@@ -0,0 +1,18 @@
+import numpy as np
+
+from cognigraph.helpers.lsl import (allocate_lsl_chunk_buffer,
+                                    write_numpy_array_to_lsl_chunk)
+
+
+def test_write_numpy_array_to_lsl_chunk():
+    chunk_buffer = allocate_lsl_chunk_buffer(sample_count=8, channel_count=3,
+                                             dtype=np.float32)
+    array = np.random.RandomState(0).randn(3, 5)  # CHANNELS x TIME float64
+
+    lsl_chunk = write_numpy_array_to_lsl_chunk(array, chunk_buffer)
+
+    assert(lsl_chunk.shape == (5, 3))
+    assert(lsl_chunk.dtype == np.float32)
+    assert(lsl_chunk.flags['C_CONTIGUOUS'])
+    assert(np.shares_memory(lsl_chunk, chunk_buffer))
+    assert(np.allclose(lsl_chunk, array.T))
@@ -0,0 +1,51 @@
+import urllib.request
+
+import pytest
+import numpy as np
+from cognigraph.helpers.metrics import (LatencyHistogram, NodeMetrics,
+                                        MetricsServer, to_prometheus_text,
+                                        _bucket_index, _bucket_bounds)
+
+
+def test_buckets_cover_values():
+    for value in list(range(1000)) + [12345, 10 ** 6, 2 ** 40 + 7]:
+        lowest, highest = _bucket_bounds(_bucket_index(value))
+        assert(lowest <= value <= highest)
+        # Relative precision
+        assert(highest - lowest <= max(0, lowest * 2 / 32))
+
+
+def test_percentiles():
+    histogram = LatencyHistogram()
+    values = np.random.RandomState(0).exponential(0.005, size=10000)
+    for value in values:
+        histogram.record(value)
+
+    assert(histogram.count == 10000)
+    assert(histogram.max == values.max())
+    for q in (0.5, 0.9, 0.99):
+        exact = np.percentile(values, q * 100)
+        assert(histogram.percentile(q) == pytest.approx(exact, rel=0.07))
+
+
+def test_prometheus_text():
+    metrics = NodeMetrics()
+    metrics.histograms['update'].record(0.001)
+    metrics.samples_in = 10
+    text = to_prometheus_text({'LinearFilter': metrics.snapshot()})
+    assert('cognigraph_node_samples_in_total{node="LinearFilter"} 10' in text)
+    assert('cognigraph_node_update_seconds_count{node="LinearFilter"} 1'
+           in text)
+
+
+def test_server():
+    metrics = NodeMetrics()
+    server = MetricsServer(lambda: {'Node': metrics.snapshot()}, port=0)
+    server.start()
+    url = 'http://127.0.0.1:{}/metrics'.format(server.port)
+    try:
+        with urllib.request.urlopen(url) as response:
+            assert('cognigraph_node_update_count_total' in
+                   response.read().decode())
+    finally:
+        server.stop()
@@ -0,0 +1,114 @@
+import numpy as np
+import pytest
+import mne
+
+from cognigraph import DTYPE
+from cognigraph.helpers.roi import ROIReducer, read_parcellation
+
+
+@pytest.fixture
+def src():
+    # Two hemispheres of 10 sources with vertex numbers 0, 2, ..., 18 and
+    # the normals of the first 5 opposite to those of the last 5
+    normals = np.zeros((20, 3))
+    normals[:, 2] = 1
+    normals[:10, 2] = -1
+    return [{'vertno': np.arange(0, 20, 2), 'nn': normals,
+             'subject_his_id': 'fake'} for hemi in ('lh', 'rh')]
+
+
+@pytest.fixture
+def labels():
+    return [mne.Label(np.arange(0, 20), hemi='lh', name='whole-lh'),
+            mne.Label(np.arange(10), hemi='rh', name='front-rh'),
+            mne.Label(np.array([1, 3]), hemi='rh', name='between-sources'),
+            mne.Label(np.arange(10, 20), hemi='rh', name='back-rh')]
+
+
+@pytest.fixture
+def data():
+    return np.random.RandomState(0).randn(20, 50).astype(DTYPE)
+
+
+def test_labels_without_sources_are_dropped(src, labels):
+    reducer = ROIReducer(labels, src)
+    assert(reducer.roi_names == ['whole-lh', 'front-rh', 'back-rh'])
+    assert(reducer.source_count == 20)
+
+
+def test_read_parcellation_returns_labels_as_is(src, labels):
+    assert(read_parcellation(src, labels) == labels)
+
+
+def test_mean(src, labels, data):
+    output = ROIReducer(labels, src, method='mean').apply(data)
+    assert(output.dtype == DTYPE)
+    assert(np.allclose(output[0], data[:10].mean(axis=0), atol=1e-6))
+    assert(np.allclose(output[1], data[10:15].mean(axis=0), atol=1e-6))
+    assert(np.allclose(output[2], data[15:].mean(axis=0), atol=1e-6))
+
+
+def test_mean_flip(src, labels, data):
+    output = ROIReducer(labels, src, method='mean_flip').apply(data)
+    expected = np.abs((data[5:10].sum(axis=0) - data[:5].sum(axis=0)) / 10)
+    assert(np.allclose(np.abs(output[0]), expected, atol=1e-6))
+
+
+def test_max(src, labels, data):
+    output = ROIReducer(labels, src, method='max').apply(data)
+    assert(np.array_equal(output[0], np.abs(data[:10]).max(axis=0)))
+    assert(np.array_equal(output[2], np.abs(data[15:]).max(axis=0)))
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_pca_flip_of_a_single_component(src, labels, seed):
+    # Every source of the left hemisphere sees the same channel combination,
+    # with the sign of its orientation and a different gain. The source time
+    # courses then have a single component and the fixed weights give
+    # exactly what mne gives for them.
+    rng = np.random.RandomState(seed)
+    channel_weights = rng.randn(8)
+    gains = rng.rand(10) + 0.5
+    inverse_model_matrix = rng.randn(20, 8)
+    inverse_model_matrix[:5] = -np.outer(gains[:5], channel_weights)
+    inverse_model_matrix[5:10] = np.outer(gains[5:], channel_weights)
+
+    reducer = ROIReducer(labels, src, method='pca_flip',
+                         inverse_model_matrix=inverse_model_matrix)
+    sources = inverse_model_matrix.dot(rng.randn(8, 30))
+    roi_time_course = reducer.apply(sources)[0]
+
+    src = mne.SourceSpaces([dict(hemi, type='surf', coord_frame=5, np=20,
+                                 rr=np.zeros((20, 3))) for hemi in src])
+    stc = mne.SourceEstimate(sources, [hemi['vertno'] for hemi in src],
+                             tmin=0, tstep=1, subject='fake')
+    expected = mne.extract_label_time_course(
+        stc, labels[:1], src, mode='pca_flip', verbose='ERROR')[0]
+    assert(np.allclose(roi_time_course, expected, rtol=1e-4, atol=1e-6))
+
+
+@pytest.mark.parametrize('method', ['mean', 'mean_flip', 'pca_flip'])
+def test_fused_matrix_gives_the_same_output(src, labels, method):
+    rng = np.random.RandomState(0)
+    inverse_model_matrix = rng.randn(20, 8)
+    sensor_data = rng.randn(8, 30)
+    reducer = ROIReducer(labels, src, method=method,
+                         inverse_model_matrix=inverse_model_matrix)
+    fused_matrix = reducer.fuse(inverse_model_matrix)
+    assert(fused_matrix.shape == (3, 8))
+    assert(np.allclose(fused_matrix.dot(sensor_data),
+                       reducer.apply(inverse_model_matrix.dot(sensor_data)),
+                       rtol=1e-4, atol=1e-5))
+
+
+def test_max_can_not_be_fused(src, labels):
+    reducer = ROIReducer(labels, src, method='max')
+    with pytest.raises(ValueError):
+        reducer.fuse(np.ones((20, 8)))
+
+
+def test_unsupported_method(src, labels):
+    with pytest.raises(ValueError):
+        ROIReducer(labels, src, method='median')
+    with pytest.raises(ValueError):
+        ROIReducer(labels, src, method='pca_flip')
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from cognigraph import DTYPE
+from cognigraph.helpers.spectrum import (WindowedPSD, make_band_matrix,
+                                         make_tapers)
+
+FREQUENCY = 500.0
+
+
+@pytest.mark.parametrize('taper', ['hann', 'dpss'])
+def test_tapers_have_unit_energy(taper):
+    tapers = make_tapers(taper, 500, time_bandwidth=3)
+    assert(tapers.shape == ((1 if taper == 'hann' else 5), 500))
+    assert(np.allclose(np.sum(tapers ** 2, axis=1), 1))
+
+
+def test_unsupported_taper():
+    with pytest.raises(ValueError):
+        make_tapers('boxcar', 500)
+
+
+@pytest.mark.parametrize('taper', ['hann', 'dpss'])
+def test_power_of_a_sinusoid(taper):
+    times = np.arange(500) / FREQUENCY
+    amplitudes = np.array([1, 2])
+    sinusoids = amplitudes[:, np.newaxis] * np.sin(2 * np.pi * 10 * times)
+    windows = sinusoids[:, np.newaxis, :].astype(DTYPE)
+
+    psd = WindowedPSD(500, FREQUENCY, taper=taper).apply(windows)
+    assert(psd.shape == (2, 1, 251))
+    assert(psd.dtype == DTYPE)
+    # The multitaper spectrum is flat within time_bandwidth bins of the peak
+    assert(np.all(np.abs(np.argmax(psd, axis=2) - 10) < 4))
+
+    # The power is the mean square: amplitude ** 2 / 2
+    band_matrix = make_band_matrix(np.fft.rfftfreq(500, 1 / FREQUENCY),
+                                   [(5, 15), (30, 45)])
+    band_power = psd.dot(band_matrix)[:, 0, :]
+    assert(np.allclose(band_power[:, 0], amplitudes ** 2 / 2, rtol=1e-2))
+    assert(np.all(band_power[:, 1] < 1e-4))
+
+
+def test_white_noise_has_a_flat_spectrum():
+    noise = np.random.RandomState(0).randn(1, 200, 250).astype(DTYPE)
+    psd = WindowedPSD(250, FREQUENCY, taper='dpss').apply(noise)
+    # Unit variance spread over FREQUENCY / 2 Hz
+    mean_psd = psd.mean(axis=(0, 1))[1:-1]
+    assert(np.allclose(mean_psd, 2 / FREQUENCY, rtol=0.1))